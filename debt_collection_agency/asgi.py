@@ -9,8 +9,19 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
+from django.core.exceptions import ImproperlyConfigured
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "debt_collection_agency.settings")
+# Async views run their queries in a new thread per request, so a kept
+# connection is never reused and only piles up until the server is out of
+# connections. Close them after every request instead.
+os.environ.setdefault("DB_CONN_MAX_AGE", "0")
 
 application = get_asgi_application()
+
+if settings.DATABASES["default"]["CONN_MAX_AGE"] != 0:
+    raise ImproperlyConfigured(
+        "DB_CONN_MAX_AGE must be 0 when serving debt_collection_agency.asgi"
+    )
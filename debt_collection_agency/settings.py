@@ -27,7 +27,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = config("SECRET_KEY")
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = config("DEBUG", default=False)
+DEBUG = config("DEBUG", default=False, cast=bool)
 
 ALLOWED_HOSTS = ["*"]
 
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     "django.contrib.contenttypes",
     "django.contrib.sessions",
     "django.contrib.messages",
+    "django.contrib.postgres",
     "rest_framework",
     "webapp",
     "django_filters",
@@ -54,6 +55,7 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    "webapp.middleware.InstrumentationMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -96,6 +98,15 @@ DATABASES = {
         # Docker Compose service name for db
         "HOST": config("DB_HOST", default="db"),
         "PORT": config("DB_PORT", default=5432),  # Default PostgreSQL port
+        # Keep connections open across requests for up to this many seconds,
+        # then reconnect. 0 closes them after every request; the ASGI
+        # application defaults to 0 and refuses to start with anything else.
+        "CONN_MAX_AGE": config("DB_CONN_MAX_AGE", default=60, cast=int),
+        # Check that a reused connection still works before each request.
+        "CONN_HEALTH_CHECKS": config("DB_CONN_HEALTH_CHECKS", default=True, cast=bool),
+        "OPTIONS": {
+            "connect_timeout": config("DB_CONNECT_TIMEOUT", default=5, cast=int),
+        },
     }
 }
 
@@ -128,6 +139,58 @@ USE_TZ = True
 
 LANGUAGE_CODE = "es"
 
+# Uploaded files waiting for a background ingest worker are stored here.
+MEDIA_ROOT = config("MEDIA_ROOT", default=os.path.join(BASE_DIR, "media"))
+
+# Queue uploads as background jobs unless the request says otherwise.
+INGEST_ASYNC = config("INGEST_ASYNC", default=False, cast=bool)
+
+# Seconds without a heartbeat after which a running ingest job is taken to
+# have lost its worker and is claimed again by another one.
+INGEST_JOB_TIMEOUT = config("INGEST_JOB_TIMEOUT", default=300, cast=int)
+
+# Rendered /api/v1/accounts/ responses, invalidated through a data version
+# bumped by every ingest. Every process that serves or ingests accounts must
+# see the same version, so outside DEBUG the cache defaults to files shared by
+# every gunicorn worker and ingest worker of a host. Local memory, the DEBUG
+# default, only suits a single process such as runserver. Servers on several
+# hosts need a backend they all reach, such as Redis.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "accounts": {
+        "BACKEND": config(
+            "ACCOUNT_CACHE_BACKEND",
+            default=(
+                "django.core.cache.backends.locmem.LocMemCache"
+                if DEBUG
+                else "django.core.cache.backends.filebased.FileBasedCache"
+            ),
+        ),
+        "LOCATION": config(
+            "ACCOUNT_CACHE_LOCATION",
+            default="accounts" if DEBUG else os.path.join(MEDIA_ROOT, "account-cache"),
+        ),
+        "TIMEOUT": None,
+        "OPTIONS": {
+            "MAX_ENTRIES": config("ACCOUNT_CACHE_MAX_ENTRIES", default=1000, cast=int),
+        },
+    },
+}
+
+# A directory shared by every gunicorn worker and ingest worker process. Each
+# writes its metrics there and /metrics exposes their totals. Without it,
+# /metrics only reports the process that answers the scrape.
+METRICS_DIR = config("METRICS_DIR", default="")
+
+# Queries slower than this are logged to the "webapp.sql" logger.
+SLOW_QUERY_MS = config("SLOW_QUERY_MS", default=200, cast=int)
+
+# With ?count=approximate, account lists count exactly up to this many rows
+# and use the planner's estimate above it.
+ACCOUNT_COUNT_CAP = config("ACCOUNT_COUNT_CAP", default=10000, cast=int)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -17,8 +17,13 @@ Including another URLconf
 
 from django.urls import path, include
 
+from webapp.views import LivenessView, MetricsView, ReadinessView
+
 
 urlpatterns = [
+    path("health/live/", LivenessView.as_view(), name="health-live"),
+    path("health/ready/", ReadinessView.as_view(), name="health-ready"),
+    path("metrics", MetricsView.as_view(), name="metrics"),
     path(
         "api/v1/",
         include(
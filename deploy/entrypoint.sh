@@ -14,4 +14,17 @@ fi
 
 python manage.py makemigrations
 python manage.py migrate
-python manage.py runserver 0.0.0.0:8000
\ No newline at end of file
+
+if [ "$SERVER_MODE" = "production" ]
+then
+    # Metrics of the processes of a previous run, counters start over.
+    if [ -n "$METRICS_DIR" ]
+    then
+        rm -rf "$METRICS_DIR"
+    fi
+    # GUNICORN_APP=debt_collection_agency.asgi requires DB_CONN_MAX_AGE=0,
+    # its default there; the app refuses to start with any other value.
+    exec gunicorn --config deploy/gunicorn.conf.py "${GUNICORN_APP:-debt_collection_agency.wsgi}"
+else
+    python manage.py runserver 0.0.0.0:8000
+fi
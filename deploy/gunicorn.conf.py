@@ -0,0 +1,36 @@
+# Gunicorn settings for the production serving mode, read from the
+# environment like the Django settings.
+import multiprocessing
+
+# Imported under another name: gunicorn takes every module-level name of
+# this file for a setting, and "config" is one.
+from decouple import config as env
+
+bind = env("GUNICORN_BIND", default="0.0.0.0:8000")
+# "gthread" serves GUNICORN_THREADS requests per worker, "sync" one, and
+# "uvicorn.workers.UvicornWorker" serves debt_collection_agency.asgi, which
+# requires DB_CONN_MAX_AGE=0.
+worker_class = env("GUNICORN_WORKER_CLASS", default="gthread")
+workers = env("GUNICORN_WORKERS", default=multiprocessing.cpu_count() * 2 + 1, cast=int)
+threads = env("GUNICORN_THREADS", default=4, cast=int)
+timeout = env("GUNICORN_TIMEOUT", default=120, cast=int)
+graceful_timeout = env("GUNICORN_GRACEFUL_TIMEOUT", default=30, cast=int)
+keepalive = env("GUNICORN_KEEPALIVE", default=5, cast=int)
+# Recycle workers now and then, so that their memory and their database
+# connections do not live forever.
+max_requests = env("GUNICORN_MAX_REQUESTS", default=5000, cast=int)
+max_requests_jitter = env("GUNICORN_MAX_REQUESTS_JITTER", default=500, cast=int)
+accesslog = "-"
+errorlog = "-"
+
+metrics_dir = env("METRICS_DIR", default="")
+
+
+def child_exit(server, worker):
+    # Workers are recycled, and killed on timeout without cleaning up: keep
+    # METRICS_DIR at one file per live worker by adding up the metrics of
+    # every worker that exited.
+    if metrics_dir:
+        from webapp.metrics import fold
+
+        fold(metrics_dir, worker.pid)
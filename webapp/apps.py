@@ -4,3 +4,32 @@ from django.apps import AppConfig
 class WebappConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "webapp"
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+
+        from webapp.caching import data_changed_receiver
+        from webapp.models import Account, Client, CollectionAgency, Consumer
+        from webapp.partitions import create_partition_receiver
+        from webapp.readmodel import (
+            account_deleted_receiver,
+            account_saved_receiver,
+            agency_saved_receiver,
+            consumer_saved_receiver,
+        )
+
+        # Every new agency, e.g. one first seen by an upload, gets its own
+        # account partition.
+        post_save.connect(create_partition_receiver, sender=CollectionAgency)
+
+        # Direct writes invalidate cached account responses; ingest bumps the
+        # data version itself since bulk inserts send no signals.
+        for model in (Account, Client, CollectionAgency, Consumer):
+            post_save.connect(data_changed_receiver, sender=model)
+            post_delete.connect(data_changed_receiver, sender=model)
+
+        # Keep the account read model in step with direct writes.
+        post_save.connect(account_saved_receiver, sender=Account)
+        post_delete.connect(account_deleted_receiver, sender=Account)
+        post_save.connect(consumer_saved_receiver, sender=Consumer)
+        post_save.connect(agency_saved_receiver, sender=CollectionAgency)
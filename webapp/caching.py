@@ -0,0 +1,104 @@
+import hashlib
+import uuid
+
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.http import parse_etags
+from rest_framework import status
+
+ACCOUNT_CACHE = "accounts"
+DATA_VERSION_KEY = "data-version"
+
+
+def data_version():
+    """
+    The current version of the account data.
+
+    Versions are random tokens rather than counters, so that a version lost
+    to eviction or a restart can never be reused for different data.
+    """
+    cache = caches[ACCOUNT_CACHE]
+    version = cache.get(DATA_VERSION_KEY)
+    if version is None:
+        cache.add(DATA_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(DATA_VERSION_KEY)
+    return version
+
+
+def bump_data_version():
+    caches[ACCOUNT_CACHE].set(DATA_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def data_changed():
+    """
+    Invalidate cached account responses after a write.
+
+    The version is bumped right away and again once the transaction commits,
+    which drops anything cached from the old data while the write was in
+    flight.
+    """
+    bump_data_version()
+    transaction.on_commit(bump_data_version)
+
+
+def data_changed_receiver(sender, **kwargs):
+    data_changed()
+
+
+class VersionedCacheMixin:
+    """
+    Cache rendered JSON list responses per data version and query.
+
+    ``cache_params`` names the query parameters that select a response. Their
+    non-empty values, sorted, form the cache key together with the data
+    version, and the ETag is derived from the key. A matching
+    ``If-None-Match`` is answered with ``304 Not Modified`` and a cache hit is
+    served as is, neither touching the database.
+    """
+
+    cache_params = ()
+
+    def cache_key(self, request):
+        params = sorted(
+            (name, value.strip())
+            for name in self.cache_params
+            for value in request.query_params.getlist(name)
+            if value.strip()
+        )
+        raw = repr(
+            (data_version(), request.get_host(), request.accepted_media_type, params)
+        )
+        return f"{type(self).__name__}:{hashlib.sha256(raw.encode()).hexdigest()}"
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != "json":
+            return super().list(request, *args, **kwargs)
+
+        key = self.cache_key(request)
+        self.etag = f'"{key.rpartition(":")[2][:32]}"'
+        etags = parse_etags(request.headers.get("If-None-Match", ""))
+        if self.etag in etags or "*" in etags:
+            return HttpResponse(
+                status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": self.etag}
+            )
+        content = caches[ACCOUNT_CACHE].get(key)
+        if content is not None:
+            return HttpResponse(
+                content,
+                content_type=request.accepted_renderer.media_type,
+                headers={"ETag": self.etag},
+            )
+
+        response = super().list(request, *args, **kwargs)
+        self.cache_response_key = key
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, "cache_response_key", None)
+        if key and response.status_code == status.HTTP_200_OK:
+            response.render()
+            caches[ACCOUNT_CACHE].set(key, response.content)
+            response["ETag"] = self.etag
+        return response
@@ -0,0 +1,128 @@
+import bz2
+import lzma
+import zipfile
+import zlib
+
+from webapp.ingest import IngestError
+
+# Compressed bytes read, and at most uncompressed bytes returned, at a time.
+CHUNK_SIZE = 1024 * 1024
+
+# Leading bytes of every supported format.
+MAGIC_NUMBERS = {
+    "gzip": b"\x1f\x8b",
+    "bz2": b"BZh",
+    "xz": b"\xfd7zXZ\x00",
+    "zip": b"PK\x03\x04",
+}
+HEAD_SIZE = max(map(len, MAGIC_NUMBERS.values()))
+
+
+def detect_compression(head):
+    """The compression format whose magic number ``head`` starts with, or None."""
+    for name, magic in MAGIC_NUMBERS.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+class _GzipDecompressor:
+    """``zlib`` with the interface of ``bz2`` and ``lzma`` decompressors."""
+
+    def __init__(self):
+        self._zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    @property
+    def eof(self):
+        return self._zlib.eof
+
+    @property
+    def unused_data(self):
+        return self._zlib.unused_data
+
+    @property
+    def needs_input(self):
+        return not self._zlib.unconsumed_tail
+
+    def decompress(self, data, max_length):
+        return self._zlib.decompress(self._zlib.unconsumed_tail + data, max_length)
+
+
+DECOMPRESSORS = {
+    "gzip": _GzipDecompressor,
+    "bz2": bz2.BZ2Decompressor,
+    "xz": lzma.LZMADecompressor,
+}
+
+
+def decompressed_chunks(file, chunk_size=CHUNK_SIZE):
+    """
+    Byte chunks of a binary ``file``, decompressed if it is gzip, bz2, xz or zip.
+
+    The format is detected from the first bytes, so plain CSV files pass
+    through unchanged whatever they are named. Streams are decompressed as
+    they are read and no chunk is larger than ``chunk_size``, so a file of
+    any size and compression ratio is read in constant memory; the
+    uncompressed file never exists, in memory or on disk. Concatenated
+    gzip, bz2 and xz streams are read one after another. A zip archive must
+    contain one file, and ``file`` must be seekable to find it.
+    """
+    file.seek(0)
+    compression = detect_compression(file.read(HEAD_SIZE))
+    file.seek(0)
+    read = iter(lambda: file.read(chunk_size), b"")
+    if compression is None:
+        yield from read
+        return
+    try:
+        if compression == "zip":
+            yield from _zip_member_chunks(file, chunk_size)
+        else:
+            yield from _stream_chunks(read, DECOMPRESSORS[compression], chunk_size)
+    except (
+        OSError,
+        EOFError,
+        zlib.error,
+        lzma.LZMAError,
+        zipfile.BadZipFile,
+        NotImplementedError,
+        RuntimeError,
+    ) as exc:
+        # zipfile raises NotImplementedError for unsupported methods and
+        # RuntimeError for encrypted members.
+        raise IngestError(f"Unreadable {compression} file: {exc}") from exc
+
+
+def _stream_chunks(read, new_decompressor, chunk_size):
+    decompressor = new_decompressor()
+    pending = b""
+    while True:
+        if decompressor.eof:
+            pending = decompressor.unused_data or next(read, b"")
+            if not pending:
+                return
+            decompressor = new_decompressor()
+        elif decompressor.needs_input and not pending:
+            pending = next(read, b"")
+            if not pending:
+                # zlib may still hold output back for the size limit.
+                chunk = decompressor.decompress(b"", chunk_size)
+                if not chunk:
+                    raise EOFError("the file is truncated")
+                yield chunk
+                continue
+        chunk = decompressor.decompress(pending, chunk_size)
+        pending = b""
+        if chunk:
+            yield chunk
+
+
+def _zip_member_chunks(file, chunk_size):
+    with zipfile.ZipFile(file) as archive:
+        members = [info for info in archive.infolist() if not info.is_dir()]
+        if len(members) != 1:
+            raise IngestError(
+                f"A zip archive must contain one CSV file, not {len(members)}"
+            )
+        with archive.open(members[0]) as member:
+            yield from iter(lambda: member.read(chunk_size), b"")
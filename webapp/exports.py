@@ -0,0 +1,65 @@
+import csv
+import io
+import json
+
+from webapp.ingest import iter_batches
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Export column -> queryset lookup.
+EXPORT_FIELDS = {
+    "id": "id",
+    "balance": "balance",
+    "status": "status",
+    "consumer_name": "consumer__name",
+    "consumer_address": "consumer__address",
+    "consumer_ssn": "consumer__ssn",
+    "client_reference_no": "client__reference_no",
+    "agency_name": "client__agency__name",
+}
+
+
+def export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stream account rows as tuples in ``EXPORT_FIELDS`` order.
+
+    The rows are read from a server-side cursor ``chunk_size`` at a time and
+    no model instances are built, so memory does not grow with the result.
+    """
+    return (
+        queryset.order_by("id")
+        .values_list(*EXPORT_FIELDS.values())
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def iter_csv(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    # The header goes out before the query runs.
+    yield _drain(buffer)
+    for batch in iter_batches(rows, chunk_size):
+        writer.writerows(batch)
+        yield _drain(buffer)
+
+
+def iter_ndjson(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    columns = list(EXPORT_FIELDS)
+    for batch in iter_batches(rows, chunk_size):
+        yield "".join(
+            json.dumps(dict(zip(columns, row)), default=str) + "\n" for row in batch
+        )
+
+
+def _drain(buffer):
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+FORMATS = {
+    "csv": (iter_csv, "text/csv"),
+    "ndjson": (iter_ndjson, "application/x-ndjson"),
+}
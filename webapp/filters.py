@@ -1,5 +1,5 @@
 import django_filters
-from webapp.models import Account
+from webapp.models import Account, AccountSearch, CollectionAgency
 
 
 class AccountFilter(django_filters.FilterSet):
@@ -9,13 +9,12 @@ class AccountFilter(django_filters.FilterSet):
         field_name="balance", lookup_expr="lte")
     consumer_name = django_filters.CharFilter(
         field_name="consumer__name", lookup_expr="icontains")
-    status = django_filters.CharFilter(
-        field_name="status", lookup_expr="iexact")
+    status = django_filters.CharFilter(method='filter_by_status')
     agency_name = django_filters.CharFilter(method='filter_by_agency_name')
     client_reference_no = django_filters.UUIDFilter(
         field_name="client__reference_no")
     consumer_ssn = django_filters.CharFilter(
-        field_name="consumer__ssn", lookup_expr="iexact")
+        field_name="consumer__ssn", lookup_expr="exact")
 
     class Meta:
         model = Account
@@ -25,5 +24,30 @@ class AccountFilter(django_filters.FilterSet):
         ]
 
     def filter_by_agency_name(self, queryset, name, value):
+        # Filtering on the partition key itself, rather than through a join,
+        # lets the planner skip the partitions of every other agency.
         agency_names = value.split(',')
-        return queryset.filter(client__agency__name__in=agency_names)
+        agency_ids = list(CollectionAgency.objects.filter(
+            name__in=agency_names).values_list("id", flat=True))
+        return queryset.filter(agency_id__in=agency_ids)
+
+    def filter_by_status(self, queryset, name, value):
+        # Statuses are stored upper case, so an exact match keeps the
+        # predicate usable by the (status, balance) index, unlike iexact.
+        return queryset.filter(status=value.strip().upper())
+
+
+class AccountSearchFilter(AccountFilter):
+    """``AccountFilter`` on the flat ``AccountSearch`` read model."""
+
+    consumer_name = django_filters.CharFilter(
+        field_name="consumer_name", lookup_expr="icontains")
+    client_reference_no = django_filters.UUIDFilter(field_name="client_id")
+    consumer_ssn = django_filters.CharFilter(
+        field_name="consumer_ssn", lookup_expr="exact")
+
+    class Meta(AccountFilter.Meta):
+        model = AccountSearch
+
+    def filter_by_agency_name(self, queryset, name, value):
+        return queryset.filter(agency_name__in=value.split(','))
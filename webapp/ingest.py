@@ -0,0 +1,646 @@
+import codecs
+import csv
+import re
+import time
+import uuid
+
+from django.db import DataError, IntegrityError, connection, transaction
+from psycopg2 import errorcodes
+
+from webapp.caching import data_changed
+from webapp.metrics import INGEST_BATCH_DURATION, INGEST_ROWS, INGEST_ROWS_PER_SECOND
+from webapp.models import Account, Client, Consumer
+from webapp.readmodel import UPSERT_SQL as READ_MODEL_UPSERT_SQL
+from webapp.summary import UPSERT_SQL, add_accounts
+
+# Number of CSV rows turned into accounts and written per ``bulk_create``.
+BATCH_SIZE = 5000
+
+
+# Maps the expected CSV header to the columns of the COPY staging table.
+CSV_COLUMNS = {
+    "client reference no": "reference_no",
+    "balance": "balance",
+    "status": "status",
+    "consumer name": "name",
+    "consumer address": "address",
+    "ssn": "ssn",
+}
+
+# Columns a CSV may have. The account reference no is the agency's own
+# identifier of an account, which snapshots need to recognise accounts.
+OPTIONAL_CSV_COLUMNS = {
+    "account reference no": "external_id",
+}
+
+
+class IngestError(Exception):
+    pass
+
+
+def _duplicate_accounts_error(exc):
+    """
+    An ``IngestError`` for an ``IntegrityError`` raised while inserting
+    accounts if it broke their natural key, the only unique constraint an
+    inserted account can break, otherwise ``None``.
+    """
+    cause = exc.__cause__
+    if getattr(cause, "pgcode", None) != errorcodes.UNIQUE_VIOLATION:
+        return None
+    message = (
+        "Accounts with the same client, consumer and account reference no "
+        "already exist or are repeated in the file; use the snapshot engine "
+        "to update existing accounts"
+    )
+    detail = cause.diag.message_detail
+    return IngestError(f"{message}. {detail}" if detail else message)
+
+
+def check_header(header):
+    missing = [name for name in CSV_COLUMNS if name not in header]
+    if missing:
+        raise IngestError(f"Missing CSV columns: {', '.join(missing)}")
+
+
+def normalize_status(value):
+    """Statuses are stored upper case so that filters can match them exactly."""
+    return value.strip().upper()
+
+
+def iter_lines(chunks, encoding="utf-8"):
+    """
+    Incrementally decode an iterable of byte chunks into text lines.
+
+    Only the current chunk and the trailing partial line are held in memory,
+    so a file of any size can be fed straight into ``csv.reader``. Lines are
+    split on ``\\n`` only and keep their terminator, which lets the csv module
+    handle ``\\r\\n`` endings and quoted fields spanning several lines.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ""
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def iter_batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def resolve_clients(agency, reference_nos):
+    """
+    Make sure a ``Client`` exists for every reference number in ``agency``.
+
+    Known clients are looked up with one query, the missing ones are
+    bulk-created (ignoring rows a concurrent ingest inserted first) and the
+    result is checked so that no reference number belongs to another agency.
+    """
+    reference_nos = set(reference_nos)
+    agencies = dict(
+        Client.objects.filter(reference_no__in=reference_nos).values_list(
+            "reference_no", "agency_id"
+        )
+    )
+    missing = sorted(reference_nos - agencies.keys())
+    if missing:
+        Client.objects.bulk_create(
+            [
+                Client(reference_no=reference_no, agency=agency)
+                for reference_no in missing
+            ],
+            ignore_conflicts=True,
+        )
+        agencies.update(
+            Client.objects.filter(reference_no__in=missing).values_list(
+                "reference_no", "agency_id"
+            )
+        )
+
+    foreign = sorted(
+        str(reference_no)
+        for reference_no, agency_id in agencies.items()
+        if agency_id != agency.pk
+    )
+    if foreign:
+        raise IngestError(
+            f"Client reference numbers belong to another agency: "
+            f"{', '.join(foreign)}"
+        )
+
+
+def resolve_consumers(keys):
+    """
+    Map ``(name, address, ssn)`` keys to consumer ids, creating missing ones.
+
+    Uses a constant number of queries per call no matter how many keys are
+    given. Missing consumers are inserted in key order with conflicts
+    ignored, which keeps concurrent ingests of overlapping files from
+    deadlocking or creating duplicates.
+    """
+    keys = set(keys)
+    ids = _lookup_consumers(keys)
+    missing = sorted(keys - ids.keys())
+    if missing:
+        Consumer.objects.bulk_create(
+            [
+                Consumer(name=name, address=address, ssn=ssn)
+                for name, address, ssn in missing
+            ],
+            ignore_conflicts=True,
+        )
+        ids.update(_lookup_consumers(missing))
+    return ids
+
+
+def _lookup_consumers(keys):
+    keys = set(keys)
+    ssns = {ssn for _, _, ssn in keys}
+    consumers = Consumer.objects.filter(ssn__in=ssns).values_list(
+        "id", "name", "address", "ssn"
+    )
+    return {
+        (name, address, ssn): pk
+        for pk, name, address, ssn in consumers
+        if (name, address, ssn) in keys
+    }
+
+
+def ingest_csv(chunks, agency, batch_size=BATCH_SIZE, on_batch=None):
+    """
+    Stream accounts from CSV byte chunks into the database for ``agency``.
+
+    Accounts are written every ``batch_size`` rows, so memory use depends on
+    the batch size rather than on the size of the file. Clients and consumers
+    of each batch are resolved in bulk and its accounts are added to the
+    summary and, by ``bulk_create``, to the read model. Every batch runs in
+    its own atomic block and ``on_batch`` is called inside it with the
+    running row count, so a caller that is not inside a transaction commits
+    batch by batch. Returns the number of accounts created.
+    """
+    reader = csv.DictReader(iter_lines(chunks))
+    check_header(reader.fieldnames or [])
+    known_clients = set()
+    rows = 0
+
+    for batch in iter_batches(reader, batch_size):
+        reference_nos = [_parse_reference_no(row) for row in batch]
+        consumer_keys = [
+            (row["consumer name"], row["consumer address"], row["ssn"]) for row in batch
+        ]
+
+        with transaction.atomic():
+            new_clients = set(reference_nos) - known_clients
+            if new_clients:
+                resolve_clients(agency, new_clients)
+            consumers = resolve_consumers(consumer_keys)
+
+            try:
+                accounts = Account.objects.bulk_create(
+                    [
+                        Account(
+                            balance=row["balance"],
+                            status=normalize_status(row["status"]),
+                            consumer_id=consumers[consumer_key],
+                            client_id=reference_no,
+                            agency_id=agency.pk,
+                            external_id=row.get("account reference no") or None,
+                        )
+                        for row, reference_no, consumer_key in zip(
+                            batch, reference_nos, consumer_keys
+                        )
+                    ]
+                )
+            except IntegrityError as exc:
+                error = _duplicate_accounts_error(exc)
+                if error is None:
+                    raise
+                raise error from exc
+            add_accounts(agency, accounts)
+            rows += len(batch)
+            if on_batch:
+                on_batch(rows)
+        known_clients |= new_clients
+
+    return rows
+
+
+def _parse_reference_no(row):
+    try:
+        return uuid.UUID(row["client reference no"])
+    except ValueError:
+        raise IngestError(
+            f"Invalid client reference no: {row['client reference no']!r}"
+        )
+
+
+# An empty line, at the start of the data or after a line break.
+BLANK_LINE = re.compile(rb"^\r?\n", re.MULTILINE)
+
+
+def without_blank_lines(chunks):
+    """
+    CSV byte chunks without their blank lines, which ``csv`` skips but
+    ``COPY`` reads as a record without fields. Line breaks inside quoted
+    fields are kept: a blank line is only dropped after an even number of
+    quotes. Chunks are cut after their last line break, so that every
+    blank line is whole within one of them.
+    """
+    quotes = 0
+    pending = b""
+
+    def drop(data):
+        pieces, start = [], 0
+        for match in BLANK_LINE.finditer(data):
+            if (quotes + data.count(b'"', 0, match.start())) % 2 == 0:
+                pieces.append(data[start : match.start()])
+                start = match.end()
+        pieces.append(data[start:])
+        return b"".join(pieces)
+
+    for chunk in chunks:
+        data = pending + chunk
+        end = data.rfind(b"\n") + 1
+        data, pending = data[:end], data[end:]
+        if data:
+            yield drop(data)
+            quotes += data.count(b'"')
+    if pending.strip(b"\r"):
+        yield pending
+
+
+class ChunkStream:
+    """
+    Minimal binary file object over an iterable of CSV byte chunks, without
+    their blank lines.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = without_blank_lines(chunks)
+        self._buffer = b""
+
+    def _fill(self, size):
+        while len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return False
+            self._buffer += chunk
+        return True
+
+    def read(self, size=-1):
+        if size < 0:
+            data, self._buffer = self._buffer + b"".join(self._chunks), b""
+            return data
+        self._fill(size)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self):
+        while b"\n" not in self._buffer and self._fill(len(self._buffer) + 1):
+            pass
+        end = self._buffer.find(b"\n") + 1 or len(self._buffer)
+        line, self._buffer = self._buffer[:end], self._buffer[end:]
+        return line
+
+
+def copy_ingest(chunks, agency, on_batch=None):
+    """
+    Ingest CSV byte chunks for ``agency`` with PostgreSQL ``COPY``.
+
+    The raw CSV is copied into an unlogged staging table, clients and
+    consumers are created with set-based ``INSERT ... ON CONFLICT`` and the
+    accounts are inserted with a single ``INSERT ... SELECT`` that also adds
+    them to the summary and the read model, all in one transaction.
+    ``on_batch`` is called once, inside that transaction. Returns the number
+    of accounts created.
+    """
+    stream = ChunkStream(chunks)
+    columns = _staging_columns(stream)
+    staging = f"webapp_staging_{uuid.uuid4().hex}"
+    external_id = (
+        "nullif(staging.external_id, '')" if "external_id" in columns else "NULL"
+    )
+
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            _copy_stage(cursor, stream, columns, staging, agency)
+            summary = UPSERT_SQL.format(
+                source="""
+                    SELECT %s, client_id, status, count(*), sum(balance)
+                    FROM inserted
+                    GROUP BY client_id, status
+                    ORDER BY client_id, status
+                """
+            )
+            search = READ_MODEL_UPSERT_SQL.format(accounts="inserted")
+            cursor.execute(
+                f"""
+                WITH inserted AS (
+                    INSERT INTO webapp_account
+                        (balance, status, consumer_id, client_id, agency_id,
+                         external_id)
+                    SELECT staging.balance::numeric, upper(trim(staging.status)),
+                        consumer.id, staging.reference_no::uuid, %s, {external_id}
+                    FROM {staging} AS staging
+                    JOIN webapp_consumer AS consumer
+                        ON consumer.ssn = staging.ssn
+                        AND consumer.name = staging.name
+                        AND consumer.address = staging.address
+                    RETURNING id, balance, status, consumer_id, client_id, agency_id
+                ), summary AS ({summary}),
+                search AS ({search})
+                SELECT count(*) FROM inserted
+                """,
+                [agency.pk, agency.pk],
+            )
+            rows = cursor.fetchone()[0]
+            cursor.execute(f"DROP TABLE {staging}")
+            if on_batch:
+                on_batch(rows)
+    except DataError as exc:
+        raise IngestError(str(exc).splitlines()[0]) from exc
+    except IntegrityError as exc:
+        error = _duplicate_accounts_error(exc)
+        if error is None:
+            raise
+        raise error from exc
+    return rows
+
+
+def snapshot_ingest(chunks, agency, on_batch=None, mark_missing=False):
+    """
+    Apply a full snapshot of the accounts of ``agency`` from CSV byte chunks.
+
+    Accounts are identified by their natural key: client, consumer and
+    ``account reference no``. The snapshot is staged like ``copy_ingest``
+    and compared with the stored accounts of the agency's partition in a
+    single statement, which updates only accounts whose balance or status
+    changed, inserts only new ones, and applies both to the summary and the
+    read model. With ``mark_missing``, stored accounts of the agency that
+    are not in the snapshot are set to ``INACTIVE``. Unchanged accounts are
+    never written. Returns the number of snapshot rows and how many accounts
+    were inserted, updated, left unchanged and inactivated.
+    """
+    stream = ChunkStream(chunks)
+    columns = _staging_columns(stream)
+    if "external_id" not in columns:
+        raise IngestError("Snapshots need an 'account reference no' column")
+    staging = f"webapp_staging_{uuid.uuid4().hex}"
+    natural_key = """
+        account.client_id = incoming.client_id
+        AND account.consumer_id = incoming.consumer_id
+        AND account.external_id = incoming.external_id
+    """
+    missing = (
+        f"""
+        UNION ALL
+        SELECT account.id, account.client_id, account.status, account.balance,
+            'INACTIVE', account.balance, true
+        FROM webapp_account AS account
+        WHERE account.agency_id = %(agency)s
+            AND account.external_id IS NOT NULL
+            AND account.status <> 'INACTIVE'
+            AND NOT EXISTS (
+                SELECT FROM incoming WHERE {natural_key}
+            )
+    """
+        if mark_missing
+        else ""
+    )
+    # Groups that lose accounts already have a summary row, and go through
+    # an UPDATE because an upsert checks its proposed row, negative count
+    # included, before it finds the conflict.
+    summary = UPSERT_SQL.format(
+        source="""
+            SELECT %(agency)s, client_id, status, account_count, balance
+            FROM deltas WHERE account_count >= 0
+            ORDER BY client_id, status
+        """
+    )
+    shrink = """
+        UPDATE webapp_accountsummary AS summary
+        SET account_count = summary.account_count + deltas.account_count,
+            total_balance = summary.total_balance + deltas.balance
+        FROM deltas
+        WHERE deltas.account_count < 0
+            AND summary.client_id = deltas.client_id
+            AND summary.status = deltas.status
+    """
+    search = READ_MODEL_UPSERT_SQL.format(
+        accounts="(SELECT * FROM updated UNION ALL SELECT * FROM inserted)"
+    )
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            _copy_stage(cursor, stream, columns, staging, agency)
+            cursor.execute(
+                f"SELECT EXISTS (SELECT FROM {staging} WHERE external_id = '')"
+            )
+            if cursor.fetchone()[0]:
+                raise IngestError("Every snapshot row needs an account reference no")
+            cursor.execute(
+                f"""
+                WITH incoming AS MATERIALIZED (
+                    SELECT DISTINCT ON (client_id, consumer_id, external_id)
+                        staging.reference_no::uuid AS client_id,
+                        consumer.id AS consumer_id, staging.external_id,
+                        staging.balance::numeric(10, 2) AS balance,
+                        upper(trim(staging.status)) AS status
+                    FROM {staging} AS staging
+                    JOIN webapp_consumer AS consumer
+                        ON consumer.ssn = staging.ssn
+                        AND consumer.name = staging.name
+                        AND consumer.address = staging.address
+                    ORDER BY client_id, consumer_id, external_id
+                ), changed AS MATERIALIZED (
+                    SELECT account.id, account.client_id,
+                        account.status AS old_status,
+                        account.balance AS old_balance,
+                        incoming.status, incoming.balance, false AS missing
+                    FROM incoming
+                    JOIN webapp_account AS account
+                        ON account.agency_id = %(agency)s AND {natural_key}
+                    WHERE (account.status, account.balance)
+                        IS DISTINCT FROM (incoming.status, incoming.balance)
+                    {missing}
+                ), updated AS (
+                    UPDATE webapp_account AS account
+                    SET status = changed.status, balance = changed.balance
+                    FROM changed
+                    WHERE account.agency_id = %(agency)s AND account.id = changed.id
+                    RETURNING account.id, account.balance, account.status,
+                        account.consumer_id, account.client_id, account.agency_id
+                ), inserted AS (
+                    INSERT INTO webapp_account
+                        (balance, status, consumer_id, client_id, agency_id,
+                         external_id)
+                    SELECT balance, status, consumer_id, client_id, %(agency)s,
+                        external_id
+                    FROM incoming
+                    WHERE NOT EXISTS (
+                        SELECT FROM webapp_account AS account
+                        WHERE account.agency_id = %(agency)s AND {natural_key}
+                    )
+                    RETURNING id, balance, status, consumer_id, client_id, agency_id
+                ), deltas AS (
+                    SELECT client_id, status, sum(account_count) AS account_count,
+                        sum(balance) AS balance
+                    FROM (
+                        SELECT client_id, old_status AS status,
+                            -1 AS account_count, -old_balance AS balance
+                        FROM changed
+                        UNION ALL
+                        SELECT client_id, status, 1, balance FROM changed
+                        UNION ALL
+                        SELECT client_id, status, 1, balance FROM inserted
+                    ) AS changes
+                    GROUP BY client_id, status
+                    HAVING (sum(account_count), sum(balance)) <> (0, 0)
+                ), summary AS ({summary}),
+                shrink AS ({shrink}),
+                search AS ({search})
+                SELECT
+                    (SELECT count(*) FROM incoming),
+                    (SELECT count(*) FROM inserted),
+                    (SELECT count(*) FROM changed WHERE NOT missing),
+                    (SELECT count(*) FROM changed WHERE missing)
+                """,
+                {"agency": agency.pk},
+            )
+            rows, inserted, updated, inactivated = cursor.fetchone()
+            cursor.execute(f"DROP TABLE {staging}")
+            if on_batch:
+                on_batch(rows)
+    except DataError as exc:
+        raise IngestError(str(exc).splitlines()[0]) from exc
+    return {
+        "rows": rows,
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": rows - inserted - updated,
+        "inactivated": inactivated,
+    }
+
+
+def _staging_columns(stream):
+    """Staging table columns for the CSV header read from ``stream``."""
+    header = next(csv.reader([stream.readline().decode("utf-8")]), [])
+    check_header(header)
+    columns = []
+    for position, name in enumerate(header):
+        column = CSV_COLUMNS.get(name) or OPTIONAL_CSV_COLUMNS.get(name)
+        columns.append(
+            column if column and column not in columns else f"extra_{position}"
+        )
+    return columns
+
+
+def _copy_stage(cursor, stream, columns, staging, agency):
+    """Copy the CSV rows into ``staging`` and create their clients and consumers."""
+    cursor.execute(
+        f"CREATE UNLOGGED TABLE {staging} "
+        f"({', '.join(f'{column} text' for column in columns)})"
+    )
+    cursor.copy_expert(
+        f"COPY {staging} ({', '.join(columns)}) FROM STDIN "
+        f"WITH (FORMAT csv, FORCE_NOT_NULL ({', '.join(columns)}))",
+        stream,
+    )
+    cursor.execute(f"ANALYZE {staging}")
+    _copy_resolve_clients(cursor, staging, agency)
+    cursor.execute(
+        f"""
+        INSERT INTO webapp_consumer (ssn, name, address)
+        SELECT DISTINCT ssn, name, address FROM {staging}
+        ORDER BY ssn, name, address
+        ON CONFLICT (ssn, name, address) DO NOTHING
+        """
+    )
+
+
+def _copy_resolve_clients(cursor, staging, agency):
+    cursor.execute(
+        f"""
+        INSERT INTO webapp_client (reference_no, agency_id)
+        SELECT DISTINCT reference_no::uuid, %s FROM {staging}
+        ORDER BY 1
+        ON CONFLICT (reference_no) DO NOTHING
+        """,
+        [agency.pk],
+    )
+    cursor.execute(
+        f"""
+        SELECT DISTINCT client.reference_no
+        FROM {staging} AS staging
+        JOIN webapp_client AS client
+            ON client.reference_no = staging.reference_no::uuid
+        WHERE client.agency_id <> %s
+        ORDER BY client.reference_no
+        """,
+        [agency.pk],
+    )
+    foreign = [str(reference_no) for reference_no, in cursor.fetchall()]
+    if foreign:
+        raise IngestError(
+            f"Client reference numbers belong to another agency: "
+            f"{', '.join(foreign)}"
+        )
+
+
+ENGINES = {
+    "orm": ingest_csv,
+    "copy": copy_ingest,
+    "snapshot": snapshot_ingest,
+}
+
+
+def ingest(chunks, agency, engine="orm", on_batch=None, mark_missing=False):
+    """
+    Run the ingest ``engine`` and report how many rows it wrote and how fast.
+
+    ``mark_missing`` is passed on to the snapshot engine, whose report also
+    counts the accounts inserted, updated, unchanged and inactivated.
+    """
+    options = {}
+    if mark_missing:
+        if engine != "snapshot":
+            raise IngestError("Only snapshots can mark missing accounts inactive")
+        options["mark_missing"] = True
+    started = last_batch = time.perf_counter()
+
+    def record_batch(rows):
+        nonlocal last_batch
+        now = time.perf_counter()
+        INGEST_BATCH_DURATION.observe(now - last_batch, engine=engine)
+        last_batch = now
+        if on_batch:
+            on_batch(rows)
+
+    try:
+        result = ENGINES[engine](chunks, agency, on_batch=record_batch, **options)
+    finally:
+        # Batches may have been committed even if a later one failed.
+        data_changed()
+    counts = result if isinstance(result, dict) else {"rows": result}
+    rows = counts["rows"]
+    seconds = time.perf_counter() - started
+    INGEST_ROWS.inc(rows, engine=engine)
+    if seconds:
+        INGEST_ROWS_PER_SECOND.observe(rows / seconds, engine=engine)
+    return {
+        "engine": engine,
+        **counts,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds) if seconds else rows,
+    }
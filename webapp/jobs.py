@@ -0,0 +1,249 @@
+import logging
+import threading
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connections, transaction
+from django.db.models import Q
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+
+from webapp.compression import decompressed_chunks
+from webapp.ingest import IngestError, ingest
+from webapp.models import IngestJob, Upload
+from webapp.validation import invalid_rows_message, valid_rows_file, validate_csv
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLost(Exception):
+    """The job was claimed again by another worker after missing heartbeats."""
+
+
+def enqueue(
+    file, agency, engine="orm", sha256="", mark_missing=False, skip_invalid=False
+):
+    """Store an uploaded file and queue it for a background worker."""
+    job = IngestJob(
+        agency=agency,
+        engine=engine,
+        sha256=sha256,
+        mark_missing=mark_missing,
+        skip_invalid=skip_invalid,
+    )
+    if isinstance(file, FieldFile):
+        # Already in storage, e.g. the file of a resumable upload.
+        job.file.name = file.name
+    else:
+        job.file.save(file.name, file, save=False)
+    job.save()
+    return job
+
+
+def claim_next_job():
+    """
+    Mark the oldest queued job as running and return it, or ``None``.
+
+    ``SKIP LOCKED`` lets any number of workers poll the queue at the same
+    time without ever claiming the same job twice. A running job without a
+    heartbeat for ``INGEST_JOB_TIMEOUT`` seconds lost its worker and is
+    claimed again; its ``attempts`` fence off the previous worker.
+    """
+    stale = timezone.now() - timedelta(seconds=settings.INGEST_JOB_TIMEOUT)
+    with transaction.atomic():
+        job = (
+            IngestJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=IngestJob.QUEUED)
+                | Q(status=IngestJob.RUNNING, heartbeat_at__lt=stale)
+            )
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            return None
+        if job.status == IngestJob.RUNNING:
+            logger.warning(
+                "Reclaiming ingest job %s, last heartbeat at %s",
+                job.pk,
+                job.heartbeat_at,
+            )
+        job.status = IngestJob.RUNNING
+        job.attempts += 1
+        job.rows_processed = 0
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.save(
+            update_fields=[
+                "status",
+                "attempts",
+                "rows_processed",
+                "started_at",
+                "heartbeat_at",
+            ]
+        )
+    return job
+
+
+class Heartbeat:
+    """
+    Report the progress of a running job from a thread with its own
+    database connection.
+
+    The ingest of a job is one transaction, whose writes nobody else sees
+    until it commits. The thread writes the row count passed to
+    ``progress`` after every batch, and at least three times per
+    ``INGEST_JOB_TIMEOUT`` during long statements such as a ``COPY``, so
+    the job is not taken for abandoned while its worker is alive.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.rows = 0
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped = True
+        self._wake.set()
+        self._thread.join()
+
+    def progress(self, rows):
+        self.rows = rows
+        self._wake.set()
+
+    def _run(self):
+        interval = settings.INGEST_JOB_TIMEOUT / 3
+        try:
+            while True:
+                self._wake.wait(interval)
+                self._wake.clear()
+                if self._stopped:
+                    return
+                try:
+                    _owned(self.job).update(
+                        rows_processed=self.rows, heartbeat_at=timezone.now()
+                    )
+                except DatabaseError:
+                    logger.exception("Heartbeat of ingest job %s failed", self.job.pk)
+                    connections.close_all()
+        finally:
+            # Connections are per thread, so only this thread's are closed.
+            connections.close_all()
+
+
+def _owned(job):
+    """The job, unless another worker claimed it since ``job`` was claimed."""
+    return IngestJob.objects.filter(pk=job.pk, attempts=job.attempts)
+
+
+def _claim_upload(job):
+    """
+    Claim the ledger entry of the job's file in the ingest transaction.
+
+    A worker that runs the same file at the same time waits here until the
+    other one finishes, and then fails if it succeeded.
+    """
+    try:
+        with transaction.atomic():
+            return Upload.objects.create(
+                agency_id=job.agency_id, sha256=job.sha256, size=job.file.size, rows=0
+            )
+    except IntegrityError:
+        duplicate = Upload.objects.get(agency_id=job.agency_id, sha256=job.sha256)
+        raise IngestError(f"File already ingested as upload {duplicate.pk}")
+
+
+def run_job(job):
+    """
+    Validate and ingest the file of a claimed job.
+
+    The validation report is stored on the job before anything is written.
+    A file with invalid rows fails the job unless it asked to skip them.
+    The rows are ingested in one transaction together with the ledger entry
+    of the file and the outcome of the job, so a job that fails, or whose
+    worker dies and which is claimed again, never leaves rows behind that a
+    retry would insert twice. Meanwhile a ``Heartbeat`` reports how many
+    rows were written.
+    """
+    fields = ["status", "error", "rows_processed", "finished_at"]
+    try:
+        duplicate = (
+            job.sha256
+            and Upload.objects.filter(
+                agency_id=job.agency_id, sha256=job.sha256
+            ).first()
+        )
+        if duplicate:
+            raise IngestError(f"File already ingested as upload {duplicate.pk}")
+        with job.file.open("rb") as file:
+            report, invalid = validate_csv(decompressed_chunks(file))
+            job.validation = report
+            _owned(job).update(validation=report, heartbeat_at=timezone.now())
+            if invalid and not job.skip_invalid:
+                raise IngestError(invalid_rows_message(report))
+            with (
+                valid_rows_file(file, invalid) if invalid else nullcontext(file)
+            ) as rows_file, transaction.atomic():
+                upload = _claim_upload(job) if job.sha256 else None
+                with Heartbeat(job) as heartbeat:
+                    stats = ingest(
+                        decompressed_chunks(rows_file),
+                        job.agency,
+                        engine=job.engine,
+                        on_batch=heartbeat.progress,
+                        mark_missing=job.mark_missing,
+                    )
+                if upload:
+                    upload.rows = stats["rows"]
+                    upload.save(update_fields=["rows"])
+                job.status = IngestJob.SUCCEEDED
+                job.error = ""
+                job.rows_processed = stats["rows"]
+                for name in ("inserted", "updated", "unchanged", "inactivated"):
+                    setattr(job, f"rows_{name}", stats.get(name))
+                job.finished_at = timezone.now()
+                fields += [
+                    "rows_inserted",
+                    "rows_updated",
+                    "rows_unchanged",
+                    "rows_inactivated",
+                ]
+                if not _owned(job).update(
+                    **{name: getattr(job, name) for name in fields}
+                ):
+                    raise LeaseLost()
+    except LeaseLost:
+        logger.warning("Ingest job %s was claimed by another worker", job.pk)
+        return job
+    except IngestError as exc:
+        job.status = IngestJob.FAILED
+        job.error = str(exc)
+    except Exception as exc:
+        logger.exception("Ingest job %s failed", job.pk)
+        job.status = IngestJob.FAILED
+        job.error = f"{type(exc).__name__}: {exc}"
+    else:
+        # Kept until the outcome is committed, for a worker claiming it again.
+        job.file.delete(save=False)
+        IngestJob.objects.filter(pk=job.pk).update(file="")
+        return job
+
+    # Nothing of a failed job was committed.
+    job.rows_processed = 0
+    job.finished_at = timezone.now()
+    if not _owned(job).update(**{name: getattr(job, name) for name in fields}):
+        logger.warning("Ingest job %s was claimed by another worker", job.pk)
+    return job
+
+
+def run_next_job():
+    job = claim_next_job()
+    if job is not None:
+        run_job(job)
+    return job
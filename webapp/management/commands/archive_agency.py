@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from webapp.caching import data_changed
+from webapp.models import AccountSearch, AccountSummary, CollectionAgency
+from webapp.partitions import detach_partition
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive the accounts of an agency by detaching its account partition. "
+        "With --drop, drop the partition and delete the agency instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("agency_name")
+        parser.add_argument(
+            "--drop",
+            action="store_true",
+            help="Drop the accounts and delete the agency with its clients.",
+        )
+
+    def handle(self, *args, agency_name, drop, **options):
+        try:
+            agency = CollectionAgency.objects.get(name=agency_name)
+        except CollectionAgency.DoesNotExist:
+            raise CommandError(f"No agency named {agency_name!r}")
+
+        with transaction.atomic():
+            try:
+                accounts, archive = detach_partition(agency.pk, drop=drop)
+            except LookupError as exc:
+                raise CommandError(str(exc))
+            AccountSummary.objects.filter(agency=agency).delete()
+            # Names are unique and, unlike agency ids, indexed in the read model.
+            AccountSearch.objects.filter(agency_name=agency.name).delete()
+            if drop:
+                agency.delete()
+            data_changed()
+
+        if drop:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Dropped {accounts} accounts and deleted {agency_name}"
+                )
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Archived {accounts} accounts of {agency_name} in {archive}"
+                )
+            )
@@ -0,0 +1,113 @@
+import bz2
+import gzip
+import io
+import lzma
+import time
+import zipfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+
+from webapp.ingest import ENGINES
+from webapp.synthetic import SyntheticDataset
+
+UPLOAD_URL = "/api/v1/upload/"
+
+
+def zip_compress(data):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("accounts.csv", data)
+    return buffer.getvalue()
+
+
+# File name and compression function of each upload format.
+FORMATS = {
+    "plain": ("accounts.csv", lambda data: data),
+    "gzip": ("accounts.csv.gz", gzip.compress),
+    "bz2": ("accounts.csv.bz2", bz2.compress),
+    "xz": ("accounts.csv.xz", lzma.compress),
+    "zip": ("accounts.zip", zip_compress),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Upload the same synthetic CSV plain and compressed with every "
+        "supported format, and compare the end-to-end wall time: compressing "
+        "on the client, sending the file at --bandwidth and ingesting it. "
+        "Every upload is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--accounts",
+            type=int,
+            default=100_000,
+            help="Number of accounts in the upload.",
+        )
+        parser.add_argument("--engine", choices=list(ENGINES), default="copy")
+        parser.add_argument(
+            "--bandwidth", type=float, default=100, help="Upload bandwidth in Mbit/s."
+        )
+        parser.add_argument(
+            "--format",
+            choices=list(FORMATS),
+            action="append",
+            dest="formats",
+            help="Formats to upload, all by default.",
+        )
+
+    def handle(self, *args, accounts, engine, bandwidth, formats, **options):
+        dataset = SyntheticDataset(
+            accounts=accounts, agencies=1, clients=100, seed=time.time_ns()
+        )
+        data = b"".join(dataset.csv_chunks(0))
+        client = Client()
+
+        results = {}
+        for name in formats or FORMATS:
+            filename, compress = FORMATS[name]
+            started = time.perf_counter()
+            content = compress(data)
+            compress_seconds = time.perf_counter() - started
+
+            with transaction.atomic():
+                started = time.perf_counter()
+                response = client.post(
+                    UPLOAD_URL,
+                    {
+                        "file": SimpleUploadedFile(filename, content),
+                        "agency_name": f"Benchmark Agency {dataset.seed}",
+                        "engine": engine,
+                        "async": "false",
+                    },
+                )
+                ingest_seconds = time.perf_counter() - started
+                transaction.set_rollback(True)
+            if response.status_code != 201:
+                raise CommandError(
+                    f"{name}: HTTP {response.status_code} {response.content[:200]!r}"
+                )
+            if response.json()["rows"] != accounts:
+                raise CommandError(f"{name}: ingested {response.json()['rows']} rows")
+
+            send_seconds = len(content) * 8 / (bandwidth * 1_000_000)
+            results[name] = compress_seconds + send_seconds + ingest_seconds
+            self.stdout.write(
+                f"{name}: {len(content) / 1_000_000:.1f} MB "
+                f"({len(data) / len(content):.1f}x), compress "
+                f"{compress_seconds:.2f}s, send {send_seconds:.2f}s, "
+                f"ingest {ingest_seconds:.2f}s, total {results[name]:.2f}s"
+            )
+
+        if "plain" in results:
+            best = min(results, key=results.get)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Fastest: {best}, {results['plain'] / results[best]:.1f}x "
+                    f"the plain upload at {bandwidth:g} Mbit/s"
+                )
+            )
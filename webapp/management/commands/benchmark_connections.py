@@ -0,0 +1,59 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.test import Client
+
+from webapp.management.commands.loadtest import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare request latency with a new database connection per request "
+        "and with persistent connections."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default="/health/ready/",
+            help="Path requested in every iteration.",
+        )
+        parser.add_argument("--requests", type=int, default=500)
+
+    def handle(self, *args, path, requests, **options):
+        client = Client()
+        original = connection.settings_dict["CONN_MAX_AGE"]
+        results = {}
+        try:
+            for name, max_age in [("new connection", 0), ("persistent", 600)]:
+                connection.close()
+                connection.settings_dict["CONN_MAX_AGE"] = max_age
+                latencies = []
+                for _ in range(requests):
+                    started = time.perf_counter()
+                    # What the request_started and request_finished signals do
+                    # around every request, which the test client skips.
+                    close_old_connections()
+                    client.get(path)
+                    close_old_connections()
+                    latencies.append(time.perf_counter() - started)
+                results[name] = latencies
+        finally:
+            connection.close()
+            connection.settings_dict["CONN_MAX_AGE"] = original
+
+        for name, latencies in results.items():
+            self.stdout.write(
+                f"{name}: p50 {statistics.median(latencies) * 1000:.2f} ms, "
+                f"p99 {percentile(latencies, 0.99) * 1000:.2f} ms"
+            )
+        speedup = statistics.median(results["new connection"]) / statistics.median(
+            results["persistent"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Persistent connections: {speedup:.1f}x lower median latency"
+            )
+        )
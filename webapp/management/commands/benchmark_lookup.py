@@ -0,0 +1,79 @@
+import time
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from webapp.caching import ACCOUNT_CACHE
+from webapp.models import AccountSearch
+
+ACCOUNTS_URL = "/api/v1/accounts/"
+LOOKUP_URL = "/api/v1/accounts/lookup/"
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare fetching the accounts of many consumers with one GET "
+        "/api/v1/accounts/?consumer_ssn= per consumer and with a single POST "
+        "to /api/v1/accounts/lookup/, and check that both find the same accounts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keys", type=int, default=1000, help="Number of consumer SSNs to look up."
+        )
+
+    def handle(self, *args, keys, **options):
+        ssns = list(
+            AccountSearch.objects.order_by("consumer_ssn")
+            .values_list("consumer_ssn", flat=True)
+            .distinct()[:keys]
+        )
+        if not ssns:
+            raise CommandError(
+                "No accounts to look up, load some with generate_accounts --load"
+            )
+        client = Client()
+        caches[ACCOUNT_CACHE].clear()
+
+        found = {}
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for ssn in ssns:
+                response = client.get(ACCOUNTS_URL, {"consumer_ssn": ssn})
+                if response.status_code != 200:
+                    raise CommandError(f"GET {ssn}: HTTP {response.status_code}")
+                found[ssn] = sorted(
+                    account["id"] for account in response.json()["results"]
+                )
+            loop_seconds = time.perf_counter() - started
+        loop_queries = len(queries)
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.post(
+                LOOKUP_URL, {"consumer_ssns": ssns}, content_type="application/json"
+            )
+            batch_seconds = time.perf_counter() - started
+        if response.status_code != 200:
+            raise CommandError(f"POST: HTTP {response.status_code}")
+        batch = response.json()["consumer_ssn"]
+        if any(
+            sorted(account["id"] for account in batch[ssn]) != found[ssn]
+            for ssn in ssns
+        ):
+            raise CommandError("The lookup found different accounts")
+
+        self.stdout.write(
+            f"GET per key: {len(ssns)} requests in {loop_seconds * 1000:.0f} ms, "
+            f"{loop_queries} queries"
+        )
+        self.stdout.write(
+            f"POST lookup: 1 request in {batch_seconds * 1000:.0f} ms, "
+            f"{len(queries)} queries"
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"{loop_seconds / batch_seconds:.1f}x faster")
+        )
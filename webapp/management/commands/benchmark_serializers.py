@@ -0,0 +1,74 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from webapp.models import Account, Client
+from webapp.renderers import FastJSONRenderer
+from webapp.serializers import AccountRowSerializer, AccountSerializer
+
+
+def nested_page(limit):
+    """The account list as it was served by ``AccountSerializer``."""
+    accounts = (
+        Account.objects.select_related("consumer")
+        .prefetch_related(
+            Prefetch("client", queryset=Client.objects.select_related("agency"))
+        )
+        .order_by("id")[:limit]
+    )
+    return JSONRenderer().render(AccountSerializer(accounts, many=True).data)
+
+
+def flat_page(limit):
+    """The account list as served by ``AccountRowSerializer``."""
+    rows = Account.objects.values(*AccountRowSerializer.values).order_by("id")[:limit]
+    return FastJSONRenderer().render(AccountRowSerializer(rows, many=True).data)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the per-row cost of listing accounts with the nested "
+        "AccountSerializer and the flat AccountRowSerializer, and check that "
+        "both produce the same bytes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=1000,
+            help="Number of existing accounts per page.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Runs per serializer; the fastest one counts.",
+        )
+
+    def handle(self, *args, rows, repeat, **options):
+        nested, flat = nested_page(rows), flat_page(rows)
+        if nested != flat:
+            raise CommandError("Serializers produced different output")
+        count = min(rows, Account.objects.count())
+        if not count:
+            raise CommandError("No accounts to serialize")
+
+        results = {}
+        for name, page in [("nested", nested_page), ("flat", flat_page)]:
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                page(rows)
+                timings.append(time.perf_counter() - started)
+            results[name] = min(timings) / count * 1e6
+            self.stdout.write(f"{name}: {results[name]:.1f} us/row")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{count} rows, identical output ({len(flat)} bytes), "
+                f"{results['nested'] / results['flat']:.1f}x faster"
+            )
+        )
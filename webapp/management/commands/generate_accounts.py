@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from webapp.ingest import ENGINES
+from webapp.synthetic import SyntheticDataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a reproducible synthetic dataset, as one CSV upload per "
+        "agency and/or loaded into the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--accounts", type=int, default=10_000)
+        parser.add_argument("--agencies", type=int, default=10)
+        parser.add_argument(
+            "--clients",
+            type=int,
+            default=100,
+            help="Clients, spread over the agencies.",
+        )
+        parser.add_argument(
+            "--consumers",
+            type=int,
+            help="Distinct consumers. Defaults to half the accounts.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Directory to write the CSV files to.")
+        parser.add_argument(
+            "--load", action="store_true", help="Ingest the dataset into the database."
+        )
+        parser.add_argument(
+            "--engine",
+            choices=list(ENGINES),
+            default="copy",
+            help="Ingest engine used by --load.",
+        )
+
+    def handle(
+        self,
+        *args,
+        accounts,
+        agencies,
+        clients,
+        consumers,
+        seed,
+        output,
+        load,
+        engine,
+        **options,
+    ):
+        if not output and not load:
+            raise CommandError("Pass --output, --load or both")
+        try:
+            dataset = SyntheticDataset(accounts, agencies, clients, consumers, seed)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if output:
+            paths = dataset.write_csv(output)
+            self.stdout.write(f"Wrote {len(paths)} files to {output}")
+        if load:
+            rows = 0
+            for agency, stats in dataset.load(engine=engine):
+                rows += stats["rows"]
+                self.stdout.write(
+                    f"{agency.name}: {stats['rows']} rows, "
+                    f"{stats['rows_per_second']} rows/s"
+                )
+            self.stdout.write(self.style.SUCCESS(f"Loaded {rows} accounts"))
@@ -0,0 +1,255 @@
+import hashlib
+import itertools
+import mmap
+import multiprocessing
+import os
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from django import db
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from webapp.compression import HEAD_SIZE, decompressed_chunks, detect_compression
+from webapp.ingest import ENGINES, IngestError, ingest
+from webapp.models import CollectionAgency, Upload
+from webapp.validation import invalid_rows_message, validate_csv
+
+CHUNK_SIZE = 1024 * 1024
+
+# Files ingested from a directory.
+DIRECTORY_PATTERNS = ["*.csv", "*.csv.gz", "*.csv.bz2", "*.csv.xz", "*.zip"]
+
+
+def split_file(path, shard_bytes):
+    """
+    Split a CSV file into ``(start, end)`` byte ranges on line boundaries.
+
+    The header line is excluded from every range. Quoted fields must not
+    contain line breaks, since shards are cut at the first newline after
+    each ``shard_bytes`` offset.
+    """
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = data.find(b"\n") + 1
+            if not start:
+                return []
+            shards = []
+            while start < len(data):
+                end = data.find(b"\n", start + shard_bytes) + 1 or len(data)
+                shards.append((start, end))
+                start = end
+            return shards
+
+
+def is_compressed(path):
+    with open(path, "rb") as file:
+        return detect_compression(file.read(HEAD_SIZE)) is not None
+
+
+def check_file(path):
+    """
+    Validate a whole file and hash its decompressed content in one pass.
+
+    Returns the ``validate_csv`` report and the SHA-256 that identifies the
+    file in the upload ledger, as for uploads.
+    """
+    digest = hashlib.sha256()
+
+    def hashed(chunks):
+        for chunk in chunks:
+            digest.update(chunk)
+            yield chunk
+
+    with open(path, "rb") as file:
+        report, _ = validate_csv(hashed(decompressed_chunks(file)))
+    return report, digest.hexdigest()
+
+
+def ingest_shard(path, start, end, agency_id, engine):
+    """
+    Ingest one byte range of a memory-mapped CSV file, or a whole compressed
+    file if ``end`` is None.
+    """
+    agency = CollectionAgency.objects.get(pk=agency_id)
+    if end is None:
+        with open(path, "rb") as file:
+            stats = ingest(decompressed_chunks(file), agency, engine=engine)
+        return os.getpid(), stats
+    with open(path, "rb") as file, mmap.mmap(
+        file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as data:
+        header = data[: data.find(b"\n") + 1]
+        chunks = itertools.chain(
+            [header],
+            (
+                data[offset : min(offset + CHUNK_SIZE, end)]
+                for offset in range(start, end, CHUNK_SIZE)
+            ),
+        )
+        stats = ingest(chunks, agency, engine=engine)
+    return os.getpid(), stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Ingest account CSV files from local paths or directories. Large files "
+        "are split on line boundaries and ingested in parallel. gzip, bz2, xz "
+        "and zip files are decompressed while they are ingested. Every file is "
+        "validated before any is ingested, and files already in the upload "
+        "ledger are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths",
+            nargs="+",
+            help="CSV files, or directories whose *.csv files, compressed or "
+            "not, and *.zip files are ingested.",
+        )
+        parser.add_argument(
+            "--agency", required=True, help="Name of the collection agency."
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of worker processes. 1 ingests in this process.",
+        )
+        parser.add_argument(
+            "--shard-bytes",
+            type=int,
+            default=64 * 1024 * 1024,
+            help="Approximate size of the byte range ingested by one task.",
+        )
+        parser.add_argument("--engine", choices=list(ENGINES), default="orm")
+
+    def handle(self, *args, paths, agency, workers, shard_bytes, engine, **options):
+        files = []
+        for path in map(Path, paths):
+            if path.is_dir():
+                files.extend(
+                    sorted(
+                        file
+                        for pattern in DIRECTORY_PATTERNS
+                        for file in path.glob(pattern)
+                    )
+                )
+            elif path.is_file():
+                files.append(path)
+            else:
+                raise CommandError(f"{path} does not exist")
+
+        agency, _ = CollectionAgency.objects.get_or_create(name=agency)
+        # Shards commit on their own, so a bad row must be found before any
+        # of them starts.
+        hashes = {}
+        for path in map(str, files):
+            try:
+                report, sha256 = check_file(path)
+            except IngestError as exc:
+                raise CommandError(f"{path}: {exc}")
+            if report["invalid_rows"]:
+                for error in report["errors"]:
+                    self.stderr.write(
+                        f"{path}, line {error.pop('line')}: "
+                        + "; ".join(
+                            f"{name}: {message}" for name, message in error.items()
+                        )
+                    )
+                raise CommandError(f"{path}: {invalid_rows_message(report)}")
+            duplicate = Upload.objects.filter(agency=agency, sha256=sha256).first()
+            if duplicate:
+                self.stdout.write(
+                    f"Skipping {path}, already ingested as upload {duplicate.pk}"
+                )
+            elif sha256 in hashes.values():
+                self.stdout.write(f"Skipping {path}, the same file is listed twice")
+            else:
+                hashes[path] = sha256
+
+        # Compressed files cannot be split and are streamed whole by one
+        # worker each.
+        tasks = [
+            (path, start, end, agency.pk, engine)
+            for path in hashes
+            for start, end in (
+                [(0, None)] if is_compressed(path) else split_file(path, shard_bytes)
+            )
+        ]
+        remaining = Counter(task[0] for task in tasks)
+        file_rows = Counter()
+
+        def shard_done(task, result):
+            """Record a file in the ledger once all of its shards are in."""
+            path = task[0]
+            self.report_shard(result)
+            file_rows[path] += result[1]["rows"]
+            remaining[path] -= 1
+            if not remaining[path]:
+                Upload.objects.create(
+                    agency=agency,
+                    sha256=hashes[path],
+                    size=os.path.getsize(path),
+                    rows=file_rows[path],
+                )
+            return result
+
+        started = time.perf_counter()
+        try:
+            if workers <= 1:
+                results = [shard_done(task, ingest_shard(*task)) for task in tasks]
+            else:
+                # Forked workers must open their own database connections.
+                db.connections.close_all()
+                with ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("fork"),
+                ) as pool:
+                    futures = {pool.submit(ingest_shard, *task): task for task in tasks}
+                    try:
+                        results = [
+                            shard_done(futures[future], future.result())
+                            for future in as_completed(futures)
+                        ]
+                    except BaseException:
+                        pool.shutdown(cancel_futures=True)
+                        raise
+        except (IngestError, db.DatabaseError, ValidationError) as exc:
+            partial = [path for path in hashes if remaining[path]]
+            raise CommandError(
+                f"{exc}\nNot recorded as ingested, and possibly partly ingested: "
+                f"{', '.join(partial)}"
+            )
+        seconds = time.perf_counter() - started
+
+        by_worker = defaultdict(lambda: [0, 0.0])
+        for pid, stats in results:
+            by_worker[pid][0] += stats["rows"]
+            by_worker[pid][1] += stats["seconds"]
+        for pid, (rows, busy) in sorted(by_worker.items()):
+            self.stdout.write(
+                f"Worker {pid}: {rows} rows, "
+                f"{round(rows / busy) if busy else rows} rows/s"
+            )
+
+        rows = sum(stats["rows"] for _, stats in results)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Ingested {rows} rows from {len(hashes)} files in {len(tasks)} "
+                f"shards in {seconds:.1f}s "
+                f"({round(rows / seconds) if seconds else rows} rows/s)"
+            )
+        )
+
+    def report_shard(self, result):
+        pid, stats = result
+        self.stdout.write(
+            f"Worker {pid}: shard of {stats['rows']} rows in "
+            f"{stats['seconds']}s ({stats['rows_per_second']} rows/s)"
+        )
+        return result
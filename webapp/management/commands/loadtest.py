@@ -0,0 +1,84 @@
+import http.client
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Send concurrent GET requests to a running deployment and report "
+        "requests per second and latency percentiles."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "urls",
+            nargs="+",
+            help="URLs to request, in turn, e.g. http://localhost:8000/api/v1/accounts/",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=50,
+            help="Number of requests in flight at any time.",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=2000, help="Total number of requests."
+        )
+
+    def handle(self, *args, urls, concurrency, requests, **options):
+        targets = [urlsplit(url) for url in urls]
+        if any(target.scheme != "http" for target in targets):
+            raise CommandError("Only http:// URLs are supported")
+
+        local = threading.local()
+        latencies, failures = [], []
+
+        def send(n):
+            target = targets[n % len(targets)]
+            path = target.path + (f"?{target.query}" if target.query else "")
+            connection = getattr(local, "connection", None)
+            if connection is None:
+                connection = local.connection = http.client.HTTPConnection(
+                    target.netloc, timeout=60
+                )
+            started = time.perf_counter()
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException) as exc:
+                local.connection = None
+                failures.append(repr(exc))
+                return
+            latencies.append(time.perf_counter() - started)
+            if response.status != 200:
+                failures.append(f"HTTP {response.status}")
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(send, range(requests)))
+        seconds = time.perf_counter() - started
+
+        if not latencies:
+            raise CommandError(f"All requests failed: {failures[0]}")
+        self.stdout.write(
+            f"{len(latencies)} responses in {seconds:.1f}s, "
+            f"{len(failures)} failures"
+        )
+        self.stdout.write(
+            f"p50 {statistics.median(latencies) * 1000:.1f} ms, "
+            f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms"
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"{len(latencies) / seconds:.1f} requests/s")
+        )
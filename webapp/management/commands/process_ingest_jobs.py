@@ -0,0 +1,60 @@
+import multiprocessing
+import time
+
+from django import db
+from django.core.management.base import BaseCommand
+
+from webapp.jobs import run_next_job
+
+
+class Command(BaseCommand):
+    help = "Run queued CSV ingest jobs. Start several processes to ingest jobs in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help="Number of worker processes claiming jobs in parallel.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Seconds to wait before polling an empty queue again.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty instead of polling forever.",
+        )
+
+    def handle(self, *args, processes, poll_interval, once, **options):
+        if processes <= 1:
+            self.work(poll_interval, once)
+            return
+
+        # Children must open their own database connections.
+        db.connections.close_all()
+        context = multiprocessing.get_context("fork")
+        workers = [
+            context.Process(target=self.work, args=(poll_interval, once))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    def work(self, poll_interval, once):
+        while True:
+            job = run_next_job()
+            if job is not None:
+                self.stdout.write(
+                    f"Job {job.pk} {job.status.lower()}: "
+                    f"{job.rows_processed} rows, {job.rows_per_second} rows/s"
+                )
+                continue
+            if once:
+                return
+            time.sleep(poll_interval)
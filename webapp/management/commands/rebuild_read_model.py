@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from webapp.caching import data_changed
+from webapp.readmodel import read_model_differences, rebuild_read_model
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the account read model from the account table and verify it. "
+        "With --check, only report whether the read model is up to date."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Verify the read model without rebuilding it.",
+        )
+
+    def handle(self, *args, check, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            if check:
+                differences = read_model_differences(cursor)
+                if differences:
+                    raise CommandError(
+                        f"{differences} accounts differ from the read model"
+                    )
+                self.stdout.write(self.style.SUCCESS("Read model is up to date"))
+                return
+
+            before = rebuild_read_model(cursor)
+            if read_model_differences(cursor):
+                raise CommandError("Rebuilt read model differs from the accounts")
+            data_changed()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Read model rebuilt and verified, {before} accounts were out of date"
+            )
+        )
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from webapp.summary import rebuild_summary, summary_differences
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the account summary from the account table and verify it. "
+        "With --check, only report whether the summary is up to date."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Verify the summary without rebuilding it.",
+        )
+
+    def handle(self, *args, check, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            if check:
+                differences = summary_differences(cursor)
+                if differences:
+                    raise CommandError(
+                        f"{differences} summary groups differ from the accounts"
+                    )
+                self.stdout.write(self.style.SUCCESS("Summary is up to date"))
+                return
+
+            before = rebuild_summary(cursor)
+            if summary_differences(cursor):
+                raise CommandError("Rebuilt summary differs from the accounts")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Summary rebuilt and verified, {before} groups were out of date"
+            )
+        )
@@ -0,0 +1,104 @@
+import statistics
+import time
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from webapp.caching import ACCOUNT_CACHE
+from webapp.ingest import ENGINES, ingest
+from webapp.management.commands.loadtest import percentile
+from webapp.models import Account, CollectionAgency
+from webapp.synthetic import SyntheticDataset
+
+ACCOUNTS_URL = "/api/v1/accounts/"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark ingest throughput on a synthetic upload and the latency of "
+        "/api/v1/accounts/ per filter on the accounts in the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ingest-accounts",
+            type=int,
+            default=10_000,
+            help="Size of the synthetic upload, 0 to skip.",
+        )
+        parser.add_argument(
+            "--engine",
+            choices=list(ENGINES),
+            action="append",
+            help="Ingest engines to run, all by default.",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=20, help="Requests per filter, 0 to skip."
+        )
+
+    def handle(self, *args, ingest_accounts, engine, requests, **options):
+        if ingest_accounts:
+            for name in engine or ENGINES:
+                self.benchmark_ingest(name, ingest_accounts)
+        if requests:
+            self.benchmark_filters(requests)
+
+    def benchmark_ingest(self, engine, accounts):
+        """Ingest a synthetic upload and roll it back."""
+        dataset = SyntheticDataset(
+            accounts=accounts, agencies=1, clients=100, seed=time.time_ns()
+        )
+        with transaction.atomic():
+            agency = CollectionAgency.objects.create(
+                name=f"Benchmark Agency {dataset.seed}"
+            )
+            stats = ingest(dataset.csv_chunks(0), agency, engine=engine)
+            transaction.set_rollback(True)
+        self.stdout.write(
+            f"ingest {engine}: {stats['rows']} rows in {stats['seconds']}s, "
+            f"{stats['rows_per_second']} rows/s"
+        )
+
+    def filters(self):
+        account = (
+            Account.objects.select_related("consumer", "client__agency")
+            .order_by("id")
+            .first()
+        )
+        if account is None:
+            raise CommandError(
+                "No accounts to query, load some with generate_accounts --load"
+            )
+        return {
+            "no filter": {},
+            "status": {"status": "IN_COLLECTION"},
+            "balance range": {"min_balance": 100, "max_balance": 200},
+            "status and min balance": {"status": "PAID_IN_FULL", "min_balance": 1000},
+            "agency": {"agency_name": account.client.agency.name},
+            "client": {"client_reference_no": account.client_id},
+            "consumer name": {"consumer_name": account.consumer.name[:6]},
+            "consumer ssn": {"consumer_ssn": account.consumer.ssn},
+        }
+
+    def benchmark_filters(self, requests):
+        client = Client()
+        cache = caches[ACCOUNT_CACHE]
+        for name, params in self.filters().items():
+            latencies = []
+            for _ in range(requests):
+                # Measure the database path rather than the response cache.
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = client.get(ACCOUNTS_URL, params)
+                    latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise CommandError(f"{name}: HTTP {response.status_code}")
+            self.stdout.write(
+                f"accounts {name}: p50 {statistics.median(latencies) * 1000:.1f} ms, "
+                f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms, "
+                f"{len(queries)} queries"
+            )
@@ -0,0 +1,354 @@
+import atexit
+import bisect
+import contextvars
+import copy
+import fcntl
+import json
+import os
+import re
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from rest_framework.response import Response
+
+# Upper bounds, in seconds, of the buckets of every latency histogram.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 500)
+ROWS_PER_SECOND_BUCKETS = (100, 1000, 5000, 10_000, 25_000, 50_000, 100_000, 250_000)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def samples(self, values):
+        raise NotImplementedError
+
+    def add(self, total, value):
+        """``total`` and ``value`` of the same labels added up."""
+        raise NotImplementedError
+
+    def snapshot(self):
+        with self.lock:
+            return copy.deepcopy(self.values)
+
+    def merge(self, values, other):
+        """Add the ``other`` values, by labels, to ``values``."""
+        for key, value in other.items():
+            values[key] = self.add(values[key], value) if key in values else value
+        return values
+
+    def expose(self, other_processes=()):
+        """The samples of this process, plus those of ``other_processes``."""
+        values = self.snapshot()
+        for process_values in other_processes:
+            self.merge(values, process_values)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines += [
+            f"{name}{_labels(labels)} {float(value)!r}"
+            for name, labels, value in self.samples(values)
+        ]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        _changed()
+
+    def add(self, total, value):
+        return total + value
+
+    def samples(self, values):
+        for key, value in sorted(values.items()):
+            yield self.name, key, value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counts = self.values.setdefault(key, [[0] * len(self.buckets), 0, 0])
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                counts[0][index] += 1
+            counts[1] += value
+            counts[2] += 1
+        _changed()
+
+    def add(self, total, value):
+        return [
+            [a + b for a, b in zip(total[0], value[0])],
+            total[1] + value[1],
+            total[2] + value[2],
+        ]
+
+    def samples(self, values):
+        for key, (buckets, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, buckets):
+                cumulative += bucket
+                yield f"{self.name}_bucket", key + (("le", f"{bound:g}"),), cumulative
+            yield f"{self.name}_bucket", key + (("le", "+Inf"),), count
+            yield f"{self.name}_sum", key, total
+            yield f"{self.name}_count", key, count
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time to answer a request."
+)
+REQUEST_SQL_DURATION = Histogram(
+    "http_request_sql_duration_seconds", "Time spent in SQL queries per request."
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_queries", "SQL queries run per request.", QUERY_COUNT_BUCKETS
+)
+REQUEST_STAGE_DURATION = Histogram(
+    "http_request_stage_duration_seconds",
+    "Time spent serializing and rendering per request.",
+)
+SLOW_QUERIES = Counter(
+    "sql_slow_queries_total", "SQL queries slower than SLOW_QUERY_MS."
+)
+INGEST_ROWS = Counter("ingest_rows_total", "Accounts created by ingest.")
+INGEST_ROWS_PER_SECOND = Histogram(
+    "ingest_rows_per_second", "Throughput of each ingest.", ROWS_PER_SECOND_BUCKETS
+)
+INGEST_BATCH_DURATION = Histogram(
+    "ingest_batch_duration_seconds", "Time to write one ingest batch."
+)
+
+REGISTRY = [
+    REQUEST_DURATION,
+    REQUEST_SQL_DURATION,
+    REQUEST_QUERIES,
+    REQUEST_STAGE_DURATION,
+    SLOW_QUERIES,
+    INGEST_ROWS,
+    INGEST_ROWS_PER_SECOND,
+    INGEST_BATCH_DURATION,
+]
+
+
+# Processes sharing a METRICS_DIR write their metrics there at most this
+# often, in seconds, so that any of them can expose the totals of all.
+FLUSH_INTERVAL = 1.0
+
+# The metrics of every process that exited, added up.
+EXITED_FILE = "exited.json"
+
+_flush_lock = threading.Lock()
+_last_flush = 0.0
+_file_claimed = False
+
+
+def _process_file(pid):
+    """
+    The file of process ``pid`` of this host in a METRICS_DIR, which the
+    containers of a deployment share while each has its own pids.
+    """
+    return f"{socket.gethostname()}-{pid}.json"
+
+
+@contextmanager
+def _locked(directory, operation):
+    """Hold a ``flock`` on ``directory`` against folds in other processes."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "a") as lock:
+        fcntl.flock(lock, operation)
+        yield
+
+
+def _read(path):
+    """The metrics in file ``path``, by metric name and labels."""
+    with open(path) as file:
+        data = json.load(file)
+    return {
+        metric: {tuple(map(tuple, key)): value for key, value in samples}
+        for metric, samples in data.items()
+    }
+
+
+def _write(path, metrics):
+    """Replace file ``path`` with ``metrics`` at once, as readers never lock."""
+    data = {
+        metric: [[list(map(list, key)), value] for key, value in values.items()]
+        for metric, values in metrics.items()
+    }
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(data, file)
+    os.replace(f"{path}.tmp", path)
+
+
+def fold(directory, pid):
+    """
+    Add the metrics of process ``pid`` of this host, which exited, to those
+    in EXITED_FILE and remove its file, so that ``directory`` holds one
+    file per live process however many exited.
+    """
+    path = os.path.join(directory, _process_file(pid))
+    exited_path = os.path.join(directory, EXITED_FILE)
+    with _locked(directory, fcntl.LOCK_EX):
+        try:
+            process = _read(path)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            process = {}
+        try:
+            exited = _read(exited_path)
+        except (OSError, ValueError):
+            exited = {}
+        for metric in REGISTRY:
+            if metric.name in process:
+                metric.merge(exited.setdefault(metric.name, {}), process[metric.name])
+        _write(exited_path, exited)
+        os.remove(path)
+
+
+def _changed():
+    if settings.METRICS_DIR and time.monotonic() - _last_flush >= FLUSH_INTERVAL:
+        flush()
+
+
+def flush():
+    """Write the metrics of this process to its file in METRICS_DIR."""
+    global _last_flush, _file_claimed
+    if not settings.METRICS_DIR or not _flush_lock.acquire(blocking=False):
+        return
+    try:
+        _last_flush = time.monotonic()
+        if not _file_claimed:
+            # Left by an exited process that had the same pid.
+            fold(settings.METRICS_DIR, os.getpid())
+            _file_claimed = True
+        _write(
+            os.path.join(settings.METRICS_DIR, _process_file(os.getpid())),
+            {metric.name: metric.snapshot() for metric in REGISTRY},
+        )
+    finally:
+        _flush_lock.release()
+
+
+def _other_processes():
+    """The metrics other processes wrote to METRICS_DIR, by metric name."""
+    if not settings.METRICS_DIR:
+        return {}
+    own = _process_file(os.getpid())
+    metrics = {}
+    with _locked(settings.METRICS_DIR, fcntl.LOCK_SH):
+        for name in os.listdir(settings.METRICS_DIR):
+            if not name.endswith(".json") or name == own:
+                continue
+            try:
+                data = _read(os.path.join(settings.METRICS_DIR, name))
+            except (OSError, ValueError):
+                continue
+            for metric, values in data.items():
+                metrics.setdefault(metric, []).append(values)
+    return metrics
+
+
+def _forked():
+    # A child starts counting from zero in a file of its own.
+    global _flush_lock, _file_claimed, _last_flush
+    _flush_lock = threading.Lock()
+    _file_claimed = False
+    _last_flush = 0.0
+    for metric in REGISTRY:
+        metric.lock = threading.Lock()
+        metric.values = {}
+
+
+def _exited():
+    if _file_claimed and settings.METRICS_DIR:
+        flush()
+        fold(settings.METRICS_DIR, os.getpid())
+
+
+os.register_at_fork(after_in_child=_forked)
+atexit.register(_exited)
+
+
+def expose():
+    """
+    All metrics in the Prometheus text format.
+
+    With METRICS_DIR, the metrics of every process that wrote there are
+    added up, those of processes that exited included, so counters never go
+    back whichever process answers the scrape.
+    """
+    others = _other_processes()
+    return (
+        "\n".join(metric.expose(others.get(metric.name, ())) for metric in REGISTRY)
+        + "\n"
+    )
+
+
+# Stage timings of the request being served, set by the middleware.
+request_stages = contextvars.ContextVar("request_stages", default=None)
+
+
+@contextmanager
+def stage(name):
+    """Add the time spent in the block to stage ``name`` of the current request."""
+    stages = request_stages.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stages is not None:
+            stages[name] = stages.get(name, 0) + time.perf_counter() - started
+
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r"(?:\?|%s)(?:\s*,\s*(?:\?|%s))+")
+
+
+def normalize_sql(sql):
+    """``sql`` with literals replaced by ``?`` and placeholder lists collapsed."""
+    sql = _LITERALS.sub("?", " ".join(sql.split()))
+    return _PLACEHOLDER_LISTS.sub("?, ...", sql)
+
+
+class TimedListMixin:
+    """``ListModelMixin.list`` that reports the serialization stage."""
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        with stage("serialize"):
+            data = self.get_serializer(
+                queryset if page is None else page, many=True
+            ).data
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
@@ -0,0 +1,90 @@
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from webapp.metrics import (
+    REQUEST_DURATION,
+    REQUEST_QUERIES,
+    REQUEST_SQL_DURATION,
+    REQUEST_STAGE_DURATION,
+    SLOW_QUERIES,
+    normalize_sql,
+    request_stages,
+)
+
+logger = logging.getLogger("webapp.sql")
+
+
+class QueryRecorder:
+    """``execute_wrapper`` counting and timing queries, and logging slow ones."""
+
+    def __init__(self, slow_seconds):
+        self.slow_seconds = slow_seconds
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.seconds += duration
+            if duration >= self.slow_seconds:
+                SLOW_QUERIES.inc()
+                logger.warning(
+                    "Slow query (%.1f ms): %s", duration * 1000, normalize_sql(sql)
+                )
+
+
+class InstrumentationMiddleware:
+    """
+    Measure every request and report it in ``Server-Timing`` and ``/metrics``.
+
+    Records the number of queries, the time spent in SQL, in the stages
+    reported with ``webapp.metrics.stage`` (serialization and rendering) and
+    in total. Queries slower than ``SLOW_QUERY_MS`` are logged with their
+    literals stripped. The body of a streaming response is produced after
+    this middleware returns and is not measured.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryRecorder(settings.SLOW_QUERY_MS / 1000)
+        stages = {}
+        token = request_stages.set(stages)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(queries):
+                response = self.get_response(request)
+        finally:
+            request_stages.reset(token)
+        total = time.perf_counter() - started
+
+        match = request.resolver_match
+        labels = {
+            "route": match.route if match else "unmatched",
+            "method": request.method,
+        }
+        REQUEST_DURATION.observe(
+            total, status=f"{response.status_code // 100}xx", **labels
+        )
+        REQUEST_SQL_DURATION.observe(queries.seconds, **labels)
+        REQUEST_QUERIES.observe(queries.count, **labels)
+        for name, seconds in stages.items():
+            REQUEST_STAGE_DURATION.observe(seconds, stage=name, **labels)
+
+        timings = [
+            f'sql;dur={queries.seconds * 1000:.2f};desc="{queries.count} queries"'
+        ]
+        timings += [
+            f"{name};dur={seconds * 1000:.2f}" for name, seconds in stages.items()
+        ]
+        timings.append(f"total;dur={total * 1000:.2f}")
+        response["Server-Timing"] = ", ".join(timings)
+        return response
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.4 on 2026-10-18 10:22
+
+from django.db import migrations, models
+
+# Existing duplicates are merged into the row with the lowest id before the
+# unique constraints are added, repointing the rows that reference them.
+MERGE_DUPLICATE_AGENCIES = """
+    WITH duplicates AS (
+        SELECT id, MIN(id) OVER (PARTITION BY name) AS keep_id
+        FROM webapp_collectionagency
+    )
+    UPDATE webapp_client AS client SET agency_id = duplicates.keep_id
+    FROM duplicates
+    WHERE client.agency_id = duplicates.id AND duplicates.id <> duplicates.keep_id;
+
+    DELETE FROM webapp_collectionagency AS agency
+    USING webapp_collectionagency AS keeper
+    WHERE agency.name = keeper.name AND agency.id > keeper.id;
+"""
+
+MERGE_DUPLICATE_CONSUMERS = """
+    WITH duplicates AS (
+        SELECT id, MIN(id) OVER (PARTITION BY ssn, name, address) AS keep_id
+        FROM webapp_consumer
+    )
+    UPDATE webapp_account AS account SET consumer_id = duplicates.keep_id
+    FROM duplicates
+    WHERE account.consumer_id = duplicates.id AND duplicates.id <> duplicates.keep_id;
+
+    DELETE FROM webapp_consumer AS consumer
+    USING webapp_consumer AS keeper
+    WHERE consumer.ssn = keeper.ssn
+        AND consumer.name = keeper.name
+        AND consumer.address = keeper.address
+        AND consumer.id > keeper.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webapp", "0002_alter_account_status"),
+    ]
+
+    operations = [
+        migrations.RunSQL(MERGE_DUPLICATE_AGENCIES, migrations.RunSQL.noop),
+        migrations.RunSQL(MERGE_DUPLICATE_CONSUMERS, migrations.RunSQL.noop),
+        migrations.AlterField(
+            model_name="collectionagency",
+            name="name",
+            field=models.CharField(max_length=255, unique=True),
+        ),
+        migrations.AddConstraint(
+            model_name="consumer",
+            constraint=models.UniqueConstraint(
+                fields=("ssn", "name", "address"), name="unique_consumer"
+            ),
+        ),
+    ]
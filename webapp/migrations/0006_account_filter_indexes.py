@@ -0,0 +1,33 @@
+# Generated by Django 5.0.4 on 2026-10-18 11:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently so the account table stays writable.
+    atomic = False
+
+    dependencies = [
+        ("webapp", "0005_upload_ledger_and_sessions"),
+    ]
+
+    operations = [
+        # The status filter now matches exactly, so stored statuses must be
+        # upper case like the ones written by the ingest path.
+        migrations.RunSQL(
+            "UPDATE webapp_account SET status = upper(trim(status)) "
+            "WHERE status <> upper(trim(status))",
+            migrations.RunSQL.noop,
+        ),
+        AddIndexConcurrently(
+            model_name="account",
+            index=models.Index(
+                fields=["status", "balance"], name="account_status_balance_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="account",
+            index=models.Index(fields=["balance", "id"], name="account_balance_id_idx"),
+        ),
+    ]
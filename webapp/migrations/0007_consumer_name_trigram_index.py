@@ -0,0 +1,29 @@
+# Generated by Django 5.0.4 on 2026-10-18 11:34
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # The index is built concurrently so the consumer table stays writable.
+    atomic = False
+
+    dependencies = [
+        ("webapp", "0006_account_filter_indexes"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name="consumer",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("name"),
+                    name="gin_trgm_ops",
+                ),
+                name="consumer_name_trgm_idx",
+            ),
+        ),
+    ]
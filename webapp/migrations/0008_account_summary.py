@@ -0,0 +1,79 @@
+# Generated by Django 5.0.4 on 2026-10-18 10:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webapp", "0007_consumer_name_trigram_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AccountSummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("INACTIVE", "Inactive"),
+                            ("PAID_IN_FULL", "Paid in Full"),
+                            ("IN_COLLECTION", "In Collection"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("account_count", models.PositiveBigIntegerField(default=0)),
+                (
+                    "total_balance",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=20),
+                ),
+                (
+                    "agency",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="account_summaries",
+                        to="webapp.collectionagency",
+                    ),
+                ),
+                (
+                    "client",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="account_summaries",
+                        to="webapp.client",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="accountsummary",
+            constraint=models.UniqueConstraint(
+                fields=("client", "status"), name="unique_summary_per_client_status"
+            ),
+        ),
+        # Summarize the accounts that already exist.
+        migrations.RunSQL(
+            """
+            INSERT INTO webapp_accountsummary
+                (agency_id, client_id, status, account_count, total_balance)
+            SELECT client.agency_id, account.client_id, account.status,
+                count(*), sum(account.balance)
+            FROM webapp_account AS account
+            JOIN webapp_client AS client ON client.reference_no = account.client_id
+            GROUP BY client.agency_id, account.client_id, account.status
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,138 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Rebuilds webapp_account as a table LIST partitioned by agency_id, with a
+# partition per existing agency and a default one. Indexes and foreign keys
+# keep the names Django gave them. The copy rewrites every account, so on a
+# large table this migration needs a maintenance window.
+PARTITION_SQL = """
+    CREATE TABLE webapp_account_partitioned (
+        id bigint GENERATED BY DEFAULT AS IDENTITY,
+        balance numeric(10, 2) NOT NULL,
+        status varchar(20) NOT NULL,
+        client_id uuid NOT NULL,
+        consumer_id bigint NOT NULL,
+        agency_id bigint NOT NULL,
+        PRIMARY KEY (id, agency_id)
+    ) PARTITION BY LIST (agency_id);
+
+    CREATE TABLE webapp_account_default
+        PARTITION OF webapp_account_partitioned DEFAULT;
+
+    DO $$
+    DECLARE
+        agency record;
+    BEGIN
+        FOR agency IN SELECT id FROM webapp_collectionagency ORDER BY id LOOP
+            EXECUTE format(
+                'CREATE TABLE webapp_account_p%s '
+                'PARTITION OF webapp_account_partitioned FOR VALUES IN (%s)',
+                agency.id, agency.id);
+        END LOOP;
+    END
+    $$;
+
+    INSERT INTO webapp_account_partitioned
+        (id, balance, status, client_id, consumer_id, agency_id)
+    SELECT account.id, account.balance, account.status, account.client_id,
+        account.consumer_id, client.agency_id
+    FROM webapp_account AS account
+    JOIN webapp_client AS client ON client.reference_no = account.client_id;
+
+    SELECT setval(
+        pg_get_serial_sequence('webapp_account_partitioned', 'id'),
+        coalesce((SELECT max(id) FROM webapp_account_partitioned), 0) + 1,
+        false);
+
+    DROP TABLE webapp_account;
+    ALTER TABLE webapp_account_partitioned RENAME TO webapp_account;
+    ALTER SEQUENCE webapp_account_partitioned_id_seq RENAME TO webapp_account_id_seq;
+    ALTER INDEX webapp_account_partitioned_pkey RENAME TO webapp_account_pkey;
+
+    CREATE INDEX account_status_balance_idx ON webapp_account (status, balance);
+    CREATE INDEX account_balance_id_idx ON webapp_account (balance, id);
+    CREATE INDEX webapp_account_client_id_15d6ead7 ON webapp_account (client_id);
+    CREATE INDEX webapp_account_consumer_id_bee02c51 ON webapp_account (consumer_id);
+
+    ALTER TABLE webapp_account
+        ADD CONSTRAINT webapp_account_client_id_15d6ead7_fk_webapp_client_reference_no
+            FOREIGN KEY (client_id) REFERENCES webapp_client (reference_no)
+            DEFERRABLE INITIALLY DEFERRED,
+        ADD CONSTRAINT webapp_account_consumer_id_bee02c51_fk_webapp_consumer_id
+            FOREIGN KEY (consumer_id) REFERENCES webapp_consumer (id)
+            DEFERRABLE INITIALLY DEFERRED,
+        ADD CONSTRAINT webapp_account_agency_id_fk_webapp_collectionagency_id
+            FOREIGN KEY (agency_id) REFERENCES webapp_collectionagency (id)
+            DEFERRABLE INITIALLY DEFERRED;
+
+    ANALYZE webapp_account;
+"""
+
+# Rebuilds webapp_account as a plain table again, with the accounts of every
+# attached partition. Tables of archived agencies stay as they are.
+UNPARTITION_SQL = """
+    CREATE TABLE webapp_account_unpartitioned (
+        id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        balance numeric(10, 2) NOT NULL,
+        status varchar(20) NOT NULL,
+        client_id uuid NOT NULL,
+        consumer_id bigint NOT NULL
+    );
+
+    INSERT INTO webapp_account_unpartitioned
+        (id, balance, status, client_id, consumer_id)
+    SELECT id, balance, status, client_id, consumer_id FROM webapp_account;
+
+    SELECT setval(
+        pg_get_serial_sequence('webapp_account_unpartitioned', 'id'),
+        coalesce((SELECT max(id) FROM webapp_account_unpartitioned), 0) + 1,
+        false);
+
+    DROP TABLE webapp_account;
+    ALTER TABLE webapp_account_unpartitioned RENAME TO webapp_account;
+    ALTER SEQUENCE webapp_account_unpartitioned_id_seq
+        RENAME TO webapp_account_id_seq;
+    ALTER INDEX webapp_account_unpartitioned_pkey RENAME TO webapp_account_pkey;
+
+    CREATE INDEX account_status_balance_idx ON webapp_account (status, balance);
+    CREATE INDEX account_balance_id_idx ON webapp_account (balance, id);
+    CREATE INDEX webapp_account_client_id_15d6ead7 ON webapp_account (client_id);
+    CREATE INDEX webapp_account_consumer_id_bee02c51 ON webapp_account (consumer_id);
+
+    ALTER TABLE webapp_account
+        ADD CONSTRAINT webapp_account_client_id_15d6ead7_fk_webapp_client_reference_no
+            FOREIGN KEY (client_id) REFERENCES webapp_client (reference_no)
+            DEFERRABLE INITIALLY DEFERRED,
+        ADD CONSTRAINT webapp_account_consumer_id_bee02c51_fk_webapp_consumer_id
+            FOREIGN KEY (consumer_id) REFERENCES webapp_consumer (id)
+            DEFERRABLE INITIALLY DEFERRED;
+
+    ANALYZE webapp_account;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webapp", "0008_account_summary"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunSQL(PARTITION_SQL, UNPARTITION_SQL)],
+            state_operations=[
+                migrations.AddField(
+                    model_name="account",
+                    name="agency",
+                    field=models.ForeignKey(
+                        db_index=False,
+                        default=None,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="accounts",
+                        to="webapp.collectionagency",
+                    ),
+                    preserve_default=False,
+                ),
+            ],
+        ),
+    ]
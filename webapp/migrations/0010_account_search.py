@@ -0,0 +1,80 @@
+# Generated by Django 5.0.4 on 2026-10-18 11:03
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webapp", "0009_partition_accounts_by_agency"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AccountSearch",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("balance", models.DecimalField(decimal_places=2, max_digits=10)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("INACTIVE", "Inactive"),
+                            ("PAID_IN_FULL", "Paid in Full"),
+                            ("IN_COLLECTION", "In Collection"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("consumer_id", models.BigIntegerField()),
+                ("consumer_name", models.CharField(max_length=255)),
+                ("consumer_address", models.TextField()),
+                ("consumer_ssn", models.CharField(max_length=11)),
+                ("client_id", models.UUIDField()),
+                ("agency_id", models.BigIntegerField()),
+                ("agency_name", models.CharField(max_length=255)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["status", "balance"], name="search_status_balance_idx"
+                    ),
+                    models.Index(
+                        fields=["balance", "id"], name="search_balance_id_idx"
+                    ),
+                    models.Index(
+                        fields=["consumer_ssn"], name="search_consumer_ssn_idx"
+                    ),
+                    models.Index(fields=["client_id"], name="search_client_id_idx"),
+                    models.Index(fields=["consumer_id"], name="search_consumer_id_idx"),
+                    models.Index(
+                        fields=["agency_name", "status"], name="search_agency_name_idx"
+                    ),
+                    django.contrib.postgres.indexes.GinIndex(
+                        django.contrib.postgres.indexes.OpClass(
+                            django.db.models.functions.text.Upper("consumer_name"),
+                            name="gin_trgm_ops",
+                        ),
+                        name="search_consumer_name_trgm_idx",
+                    ),
+                ],
+            },
+        ),
+        # Copy the accounts that already exist.
+        migrations.RunSQL(
+            """
+            INSERT INTO webapp_accountsearch
+                (id, balance, status, consumer_id, consumer_name,
+                 consumer_address, consumer_ssn, client_id, agency_id, agency_name)
+            SELECT account.id, account.balance, account.status,
+                account.consumer_id, consumer.name, consumer.address,
+                consumer.ssn, account.client_id, account.agency_id, agency.name
+            FROM webapp_account AS account
+            JOIN webapp_consumer AS consumer ON consumer.id = account.consumer_id
+            JOIN webapp_collectionagency AS agency ON agency.id = account.agency_id
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
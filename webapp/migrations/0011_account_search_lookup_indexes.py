@@ -0,0 +1,37 @@
+# Generated by Django 5.0.4 on 2026-10-18 11:08
+
+from django.contrib.postgres.operations import (
+    AddIndexConcurrently,
+    RemoveIndexConcurrently,
+)
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are rebuilt concurrently so the read model stays writable.
+    atomic = False
+
+    dependencies = [
+        ("webapp", "0010_account_search"),
+    ]
+
+    operations = [
+        RemoveIndexConcurrently(
+            model_name="accountsearch",
+            name="search_consumer_ssn_idx",
+        ),
+        RemoveIndexConcurrently(
+            model_name="accountsearch",
+            name="search_client_id_idx",
+        ),
+        AddIndexConcurrently(
+            model_name="accountsearch",
+            index=models.Index(
+                fields=["consumer_ssn", "id"], name="search_consumer_ssn_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="accountsearch",
+            index=models.Index(fields=["client_id", "id"], name="search_client_id_idx"),
+        ),
+    ]
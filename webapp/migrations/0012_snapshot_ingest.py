@@ -0,0 +1,53 @@
+# Generated by Django 5.0.4 on 2026-10-18 11:11
+
+from django.db import migrations, models
+
+
+# The natural key constraint includes agency_id, the partition key, as unique
+# constraints on a partitioned table must. Existing accounts keep a NULL
+# external_id, which never conflicts.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webapp", "0011_account_search_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="account",
+            name="external_id",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="ingestjob",
+            name="mark_missing",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="ingestjob",
+            name="rows_inactivated",
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="ingestjob",
+            name="rows_inserted",
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="ingestjob",
+            name="rows_unchanged",
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="ingestjob",
+            name="rows_updated",
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="account",
+            constraint=models.UniqueConstraint(
+                fields=("client", "consumer", "external_id", "agency"),
+                name="unique_account_natural_key",
+            ),
+        ),
+    ]
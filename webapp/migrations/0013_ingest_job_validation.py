@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-18 11:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webapp", "0012_snapshot_ingest"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ingestjob",
+            name="skip_invalid",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="ingestjob",
+            name="validation",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
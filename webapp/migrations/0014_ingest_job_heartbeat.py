@@ -0,0 +1,29 @@
+# Generated by Django 5.0.4 on 2026-10-18 11:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("webapp", "0013_ingest_job_validation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ingestjob",
+            name="attempts",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="ingestjob",
+            name="heartbeat_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        # Jobs running during the upgrade count from when they started.
+        migrations.RunSQL(
+            "UPDATE webapp_ingestjob SET heartbeat_at = started_at, attempts = 1 "
+            "WHERE status = 'RUNNING'",
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -1,8 +1,15 @@
+import uuid
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Upper
+from django.utils import timezone
+
+from webapp.readmodel import index_accounts
 
 
 class CollectionAgency(models.Model):
-    name = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, unique=True)
 
 
 class Client(models.Model):
@@ -17,8 +24,60 @@ class Consumer(models.Model):
     address = models.TextField()
     ssn = models.CharField(max_length=11)
 
+    class Meta:
+        constraints = [
+            # ssn leads so that lookups by ssn can use the same index.
+            models.UniqueConstraint(
+                fields=["ssn", "name", "address"], name="unique_consumer"
+            ),
+        ]
+        indexes = [
+            # Trigram index on UPPER(name): serves the icontains filter, which
+            # Django compiles to UPPER(name) LIKE UPPER(...), and similarity
+            # search on the same expression.
+            GinIndex(
+                OpClass(Upper("name"), name="gin_trgm_ops"),
+                name="consumer_name_trgm_idx",
+            ),
+        ]
+
+
+class AccountQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        """Fill in the agency of accounts created with only a client."""
+        objs = list(objs)
+        reference_no = Client._meta.pk
+        missing = {
+            reference_no.to_python(obj.client_id)
+            for obj in objs
+            if obj.agency_id is None
+        }
+        if missing:
+            agencies = dict(
+                Client.objects.filter(reference_no__in=missing).values_list(
+                    "reference_no", "agency_id"
+                )
+            )
+            for obj in objs:
+                if obj.agency_id is None:
+                    obj.agency_id = agencies.get(reference_no.to_python(obj.client_id))
+        objs = super().bulk_create(objs, *args, **kwargs)
+        index_accounts(objs)
+        return objs
+
 
 class Account(models.Model):
+    """
+    An account of a consumer with a client.
+
+    The table is LIST partitioned by ``agency``, a copy of the client's
+    agency, with one partition per agency (see ``webapp.partitions``).
+    Filtering on ``agency_id`` lets PostgreSQL skip the partitions of other
+    agencies. The primary key in the database is (id, agency_id), as a
+    partitioned table requires; ids stay unique since they come from a
+    single identity sequence.
+    """
+
     INACTIVE = "INACTIVE"
     PAID_IN_FULL = "PAID_IN_FULL"
     IN_COLLECTION = "IN_COLLECTION"
@@ -36,3 +95,205 @@ class Account(models.Model):
     client = models.ForeignKey(
         Client, related_name="accounts", on_delete=models.CASCADE
     )
+    # The partition key, so partitions replace an index on it.
+    agency = models.ForeignKey(
+        CollectionAgency,
+        related_name="accounts",
+        on_delete=models.CASCADE,
+        db_index=False,
+    )
+    # The agency's own identifier of the account, if it sends one. Together
+    # with the client and consumer it identifies accounts across snapshots.
+    external_id = models.CharField(max_length=64, null=True, blank=True)
+
+    objects = AccountQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # The partition key must be part of every unique constraint.
+            # Accounts without an external id are never considered equal.
+            models.UniqueConstraint(
+                fields=["client", "consumer", "external_id", "agency"],
+                name="unique_account_natural_key",
+            ),
+        ]
+        indexes = [
+            # Status filters with or without a balance range.
+            models.Index(
+                fields=["status", "balance"], name="account_status_balance_idx"
+            ),
+            # Balance ranges and keyset pagination ordered by balance.
+            models.Index(fields=["balance", "id"], name="account_balance_id_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.agency_id is None:
+            self.agency_id = self.client.agency_id
+        super().save(*args, **kwargs)
+
+
+class AccountSearch(models.Model):
+    """
+    Flat copy of every account with its consumer, client and agency.
+
+    The account list is served from this table alone, without joins. Ingest
+    and ``Account.objects.bulk_create`` add the accounts they create in the
+    same transaction, and saving or deleting an account, consumer or agency
+    updates the copies (see ``webapp.readmodel``). Accounts changed by
+    queryset updates or raw SQL are only copied again by
+    ``rebuild_read_model``.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    balance = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=Account.STATUS_CHOICES)
+    consumer_id = models.BigIntegerField()
+    consumer_name = models.CharField(max_length=255)
+    consumer_address = models.TextField()
+    consumer_ssn = models.CharField(max_length=11)
+    client_id = models.UUIDField()
+    agency_id = models.BigIntegerField()
+    agency_name = models.CharField(max_length=255)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "balance"], name="search_status_balance_idx"
+            ),
+            models.Index(fields=["balance", "id"], name="search_balance_id_idx"),
+            # Ids follow the lookup keys so that batch lookups read the
+            # first accounts of each key without sorting.
+            models.Index(fields=["consumer_ssn", "id"], name="search_consumer_ssn_idx"),
+            models.Index(fields=["client_id", "id"], name="search_client_id_idx"),
+            models.Index(fields=["consumer_id"], name="search_consumer_id_idx"),
+            models.Index(
+                fields=["agency_name", "status"], name="search_agency_name_idx"
+            ),
+            GinIndex(
+                OpClass(Upper("consumer_name"), name="gin_trgm_ops"),
+                name="search_consumer_name_trgm_idx",
+            ),
+        ]
+
+
+class AccountSummary(models.Model):
+    """
+    Number of accounts and total balance per client and status.
+
+    Ingest adds the accounts it creates in the same transaction, so the
+    totals never have to be aggregated from the account table. Accounts
+    changed by other means are only counted again by ``rebuild_summary``.
+    """
+
+    agency = models.ForeignKey(
+        CollectionAgency, related_name="account_summaries", on_delete=models.CASCADE
+    )
+    client = models.ForeignKey(
+        Client, related_name="account_summaries", on_delete=models.CASCADE
+    )
+    status = models.CharField(max_length=20, choices=Account.STATUS_CHOICES)
+    account_count = models.PositiveBigIntegerField(default=0)
+    total_balance = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["client", "status"], name="unique_summary_per_client_status"
+            ),
+        ]
+
+
+class IngestJob(models.Model):
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    SUCCEEDED = "SUCCEEDED"
+    FAILED = "FAILED"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (SUCCEEDED, "Succeeded"),
+        (FAILED, "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    agency = models.ForeignKey(
+        CollectionAgency, related_name="ingest_jobs", on_delete=models.CASCADE
+    )
+    file = models.FileField(upload_to="ingest/")
+    sha256 = models.CharField(max_length=64, blank=True)
+    engine = models.CharField(max_length=10, default="orm")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    mark_missing = models.BooleanField(default=False)
+    skip_invalid = models.BooleanField(default=False)
+    # The report of ``validate_csv``, set once the worker has checked the file.
+    validation = models.JSONField(null=True, blank=True)
+    rows_processed = models.PositiveBigIntegerField(default=0)
+    # What a snapshot did with its rows.
+    rows_inserted = models.PositiveBigIntegerField(null=True, blank=True)
+    rows_updated = models.PositiveBigIntegerField(null=True, blank=True)
+    rows_unchanged = models.PositiveBigIntegerField(null=True, blank=True)
+    rows_inactivated = models.PositiveBigIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Written by the worker while the job runs. A running job without a
+    # heartbeat for INGEST_JOB_TIMEOUT is claimed again, which counts as
+    # another attempt.
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    @property
+    def rows_per_second(self):
+        if not self.started_at:
+            return None
+        seconds = (
+            (self.finished_at or timezone.now()) - self.started_at
+        ).total_seconds()
+        return round(self.rows_processed / seconds) if seconds else None
+
+
+class Upload(models.Model):
+    """Ledger of ingested files, used to recognise a file uploaded twice."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    agency = models.ForeignKey(
+        CollectionAgency, related_name="uploads", on_delete=models.CASCADE
+    )
+    sha256 = models.CharField(max_length=64)
+    size = models.PositiveBigIntegerField()
+    rows = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["agency", "sha256"], name="unique_upload_per_agency"
+            ),
+        ]
+
+
+class UploadSession(models.Model):
+    """A file sent in parts, resumable from the last acknowledged offset."""
+
+    OPEN = "OPEN"
+    COMPLETE = "COMPLETE"
+    STATUS_CHOICES = [
+        (OPEN, "Open"),
+        (COMPLETE, "Complete"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    agency = models.ForeignKey(
+        CollectionAgency, related_name="upload_sessions", on_delete=models.CASCADE
+    )
+    file = models.FileField(upload_to="sessions/")
+    offset = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=OPEN)
+    upload = models.ForeignKey(Upload, null=True, blank=True, on_delete=models.SET_NULL)
+    job = models.ForeignKey(IngestJob, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
@@ -0,0 +1,253 @@
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a unique ordering, without ``COUNT`` or ``OFFSET``.
+
+    The cursor holds the ordering values of the last row of a page and the
+    next page starts right after them, so every page costs the same index
+    range scan no matter how deep it is. Orderings must end with a unique
+    field; a tie on the first field is broken by the next one.
+    """
+
+    cursor_query_param = "cursor"
+    ordering_query_param = "ordering"
+    orderings = {
+        "id": ("id",),
+        "-id": ("-id",),
+        "balance": ("balance", "id"),
+        "-balance": ("-balance", "-id"),
+    }
+    default_ordering = "id"
+    page_size = api_settings.PAGE_SIZE
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        ordering = self.orderings.get(
+            request.query_params.get(self.ordering_query_param),
+            self.orderings[self.default_ordering],
+        )
+        position, reverse = self.decode_cursor(request)
+        if reverse:
+            ordering = tuple(_flip(field) for field in ordering)
+
+        queryset = queryset.order_by(*ordering)
+        try:
+            if position is not None:
+                queryset = queryset.filter(_after(ordering, position))
+            rows = list(queryset[: self.page_size + 1])
+        except (ValidationError, ValueError, IndexError):
+            raise NotFound(self.invalid_cursor_message)
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if reverse:
+            rows.reverse()
+            ordering = tuple(_flip(field) for field in ordering)
+
+        self.ordering = ordering
+        self.page = rows
+        self.has_next = has_more if not reverse else True
+        self.has_previous = has_more if reverse else position is not None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, row, reverse):
+        position = [str(_value(row, field.lstrip("-"))) for field in self.ordering]
+        token = json.dumps({"p": position, "r": reverse}).encode()
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            base64.urlsafe_b64encode(token).decode(),
+        )
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(token.encode()))
+            return list(cursor["p"]), bool(cursor["r"])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class ApproximateCountPagination(PageNumberPagination):
+    """
+    Page-number pagination that avoids an exact ``COUNT(*)`` of broad filters.
+
+    ``count_type`` tells how ``count`` was obtained:
+
+    - ``exact``: the last page was reached, or the filter matches at most
+      ``ACCOUNT_COUNT_CAP`` rows, counted with a ``LIMIT``.
+    - ``capped``: at least ``count`` rows, which is the cap.
+    - ``estimated``: the planner's estimate, from ``pg_class.reltuples``
+      without filters and from ``EXPLAIN`` for filters it expects to match
+      more rows than the cap.
+
+    Pages are fetched with one extra row to know whether there is a next one,
+    so links do not depend on the count.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            self.number = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            self.number = 0
+        if self.number < 1:
+            raise NotFound(
+                self.invalid_page_message.format(
+                    page_number=self.number, message="That page number is less than 1"
+                )
+            )
+
+        offset = (self.number - 1) * self.page_size
+        rows = list(queryset[offset : offset + self.page_size + 1])
+        if not rows and self.number > 1:
+            raise NotFound(
+                self.invalid_page_message.format(
+                    page_number=self.number, message="That page contains no results"
+                )
+            )
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[: self.page_size]
+        if self.has_next:
+            self.count, self.count_type = self.get_count(queryset)
+            # An estimate below the rows already seen is certainly wrong.
+            self.count = max(self.count, offset + len(rows))
+        else:
+            self.count, self.count_type = offset + len(self.page), "exact"
+        return self.page
+
+    def get_count(self, queryset):
+        cap = settings.ACCOUNT_COUNT_CAP
+        if not queryset.query.where:
+            estimate = self.table_estimate(queryset.model._meta.db_table)
+        else:
+            plan = json.loads(queryset.explain(format="json"))[0]["Plan"]
+            estimate = plan["Plan Rows"]
+        if estimate is not None and estimate > cap:
+            return int(estimate), "estimated"
+        count = queryset[: cap + 1].count()
+        return (cap, "capped") if count > cap else (count, "exact")
+
+    def table_estimate(self, table):
+        """Rows in ``table`` as of its last analyze, ``None`` if never analyzed."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)", [table]
+            )
+            row = cursor.fetchone()
+        return row[0] if row and row[0] >= 0 else None
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.page_query_param, self.number + 1
+        )
+
+    def get_previous_link(self):
+        if self.number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.number - 1)
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "count": self.count,
+                "count_type": self.count_type,
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        response = super().get_paginated_response_schema(schema)
+        response["properties"]["count_type"] = {
+            "type": "string",
+            "enum": ["exact", "capped", "estimated"],
+        }
+        return response
+
+
+def _value(row, name):
+    # Rows are model instances, or dicts for .values() querysets.
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+def _flip(field):
+    return field[1:] if field.startswith("-") else f"-{field}"
+
+
+def _after(ordering, position):
+    """
+    Rows strictly after ``position`` in ``ordering``.
+
+    The leading ``>=`` condition on the first field is what lets the database
+    start an index range scan right at the cursor.
+    """
+    lookups = [
+        (field.lstrip("-"), "lt" if field.startswith("-") else "gt")
+        for field in ordering
+    ]
+    after = Q()
+    for depth in reversed(range(len(lookups))):
+        name, lookup = lookups[depth]
+        condition = Q(**{f"{name}__{lookup}": position[depth]})
+        if depth < len(lookups) - 1:
+            condition |= Q(**{name: position[depth]}) & after
+        after = condition
+
+    name, lookup = lookups[0]
+    return Q(**{f"{name}__{lookup}e": position[0]}) & after
@@ -0,0 +1,113 @@
+from django.db import connection
+
+# Accounts are LIST partitioned by agency: every agency gets its own
+# ``webapp_account_p<agency id>`` table and rows of agencies without one land
+# in ``webapp_account_default``.
+PARENT = "webapp_account"
+DEFAULT_PARTITION = "webapp_account_default"
+
+
+def partition_name(agency_id):
+    return f"{PARENT}_p{int(agency_id)}"
+
+
+def archive_name(cursor, agency_id):
+    """The first free ``webapp_account_archive_p<agency id>_<n>`` table name."""
+    number = 1
+    while True:
+        name = f"{PARENT}_archive_p{int(agency_id)}_{number}"
+        cursor.execute("SELECT to_regclass(%s) IS NULL", [name])
+        if cursor.fetchone()[0]:
+            return name
+        number += 1
+
+
+def agency_partitions(cursor):
+    """Names of the partitions currently attached to the account table."""
+    cursor.execute(
+        """
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class AS parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = %s
+        ORDER BY child.relname
+        """,
+        [PARENT],
+    )
+    return [name for name, in cursor.fetchall()]
+
+
+def ensure_partition(agency_id):
+    """
+    Create the account partition of ``agency_id`` unless it exists.
+
+    The table is created on its own and then attached, which only takes a
+    SHARE UPDATE EXCLUSIVE lock on the account table, so reads and ingests
+    of other agencies carry on. Attaching scans the default partition for
+    rows of the agency; they must be moved out of it first. Does nothing
+    before the account table is partitioned by its migration. Returns
+    whether a partition was created.
+    """
+    name = partition_name(agency_id)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT to_regclass(%s) IS NULL FROM pg_class "
+            "WHERE oid = to_regclass(%s) AND relkind = 'p'",
+            [name, PARENT],
+        )
+        if cursor.fetchone() != (True,):
+            return False
+        cursor.execute(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS)")
+        cursor.execute(
+            f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES IN (%s)",
+            [int(agency_id)],
+        )
+    return True
+
+
+def detach_partition(agency_id, drop=False):
+    """
+    Detach the account partition of ``agency_id`` from the account table.
+
+    The partition is kept as ``webapp_account_archive_p<agency id>_<n>``,
+    numbered so that an agency can be archived again, without foreign keys
+    so that it does not hold on to clients and consumers, and replaced by
+    an empty partition for the agency's later accounts. With ``drop`` it is
+    dropped instead. Either way its accounts disappear from every query at
+    once without a row being deleted. Returns the number of accounts
+    detached and the name of the archive table, ``None`` with ``drop``.
+    """
+    name = partition_name(agency_id)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [name])
+        if not cursor.fetchone()[0]:
+            raise LookupError(f"Agency {agency_id} has no account partition")
+        cursor.execute(f"SELECT count(*) FROM {name}")
+        accounts = cursor.fetchone()[0]
+        # Neither detaching nor dropping is allowed while deferred foreign
+        # key checks on the partition are pending.
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(f"ALTER TABLE {PARENT} DETACH PARTITION {name}")
+        if drop:
+            cursor.execute(f"DROP TABLE {name}")
+            return accounts, None
+        cursor.execute(
+            "SELECT conname FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [name],
+        )
+        for (constraint,) in cursor.fetchall():
+            cursor.execute(
+                f"ALTER TABLE {name} DROP CONSTRAINT {connection.ops.quote_name(constraint)}"
+            )
+        archive = archive_name(cursor, agency_id)
+        cursor.execute(f"ALTER TABLE {name} RENAME TO {archive}")
+    ensure_partition(agency_id)
+    return accounts, archive
+
+
+def create_partition_receiver(sender, instance, created, raw=False, **kwargs):
+    """``post_save`` receiver creating the partition of a new agency."""
+    if created and not raw:
+        ensure_partition(instance.pk)
@@ -0,0 +1,164 @@
+from django.db import connection
+
+COLUMNS = (
+    "id, balance, status, consumer_id, consumer_name, consumer_address, "
+    "consumer_ssn, client_id, agency_id, agency_name"
+)
+
+# Rows of the read model for the account rows of ``{accounts}``, a table or
+# a subquery with the columns of webapp_account.
+SELECT_SQL = """
+    SELECT account.id, account.balance, account.status, account.consumer_id,
+        consumer.name, consumer.address, consumer.ssn, account.client_id,
+        account.agency_id, agency.name
+    FROM {accounts} AS account
+    JOIN webapp_consumer AS consumer ON consumer.id = account.consumer_id
+    JOIN webapp_collectionagency AS agency ON agency.id = account.agency_id
+"""
+
+# Sorted by id so that concurrent writers lock rows in the same order.
+UPSERT_SQL = f"""
+    INSERT INTO webapp_accountsearch ({COLUMNS})
+    {SELECT_SQL}
+    ORDER BY account.id
+    ON CONFLICT (id) DO UPDATE SET
+        balance = EXCLUDED.balance,
+        status = EXCLUDED.status,
+        consumer_id = EXCLUDED.consumer_id,
+        consumer_name = EXCLUDED.consumer_name,
+        consumer_address = EXCLUDED.consumer_address,
+        consumer_ssn = EXCLUDED.consumer_ssn,
+        client_id = EXCLUDED.client_id,
+        agency_id = EXCLUDED.agency_id,
+        agency_name = EXCLUDED.agency_name
+"""
+
+
+def index_accounts(accounts):
+    """
+    Copy ``accounts``, saved Account instances, into the read model.
+
+    They are looked up by agency too, so that only the partitions of their
+    agencies are read.
+    """
+    accounts = [account for account in accounts if account.pk is not None]
+    if not accounts:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            UPSERT_SQL.format(
+                accounts="(SELECT * FROM webapp_account "
+                "WHERE id = ANY(%s) AND agency_id = ANY(%s))"
+            ),
+            [
+                [account.pk for account in accounts],
+                list({account.agency_id for account in accounts}),
+            ],
+        )
+
+
+# Read model column and PostgreSQL array type of each batch lookup key.
+LOOKUP_KEYS = {
+    "consumer_ssn": ("consumer_ssn", "text[]"),
+    "client_reference_no": ("client_id", "uuid[]"),
+}
+
+
+def lookup_accounts(key, values, limit):
+    """
+    Accounts of every value of lookup ``key``, in one query.
+
+    The values are sent as a single array parameter and each one is looked
+    up through the (key, id) index with a ``LATERAL`` subquery, so at most
+    ``limit + 1`` accounts are read per value, lowest ids first. Returns the
+    rows as dicts grouped by value, with ``limit + 1`` rows for values that
+    have more than ``limit`` accounts.
+    """
+    column, array_type = LOOKUP_KEYS[key]
+    grouped = {value: [] for value in values}
+    if not grouped:
+        return grouped
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT lookup.value, account.*
+            FROM unnest(%s::{array_type}) AS lookup (value)
+            CROSS JOIN LATERAL (
+                SELECT {COLUMNS} FROM webapp_accountsearch
+                WHERE {column} = lookup.value
+                ORDER BY id
+                LIMIT %s
+            ) AS account
+            """,
+            [list(grouped), limit + 1],
+        )
+        names = [description.name for description in cursor.description[1:]]
+        for value, *row in cursor.fetchall():
+            grouped[value].append(dict(zip(names, row)))
+    return grouped
+
+
+def read_model_differences(cursor):
+    """Count the accounts whose copy in the read model is missing or differs."""
+    actual = SELECT_SQL.format(accounts="webapp_account")
+    cursor.execute(
+        f"""
+        SELECT count(DISTINCT id) FROM (
+            (SELECT {COLUMNS} FROM webapp_accountsearch EXCEPT {actual})
+            UNION ALL
+            ({actual} EXCEPT SELECT {COLUMNS} FROM webapp_accountsearch)
+        ) AS differences
+        """
+    )
+    return cursor.fetchone()[0]
+
+
+def rebuild_read_model(cursor):
+    """
+    Replace the read model with a copy of the account table.
+
+    Must run in a transaction. Returns the number of accounts whose copy was
+    out of date.
+    """
+    cursor.execute("LOCK TABLE webapp_accountsearch IN EXCLUSIVE MODE")
+    before = read_model_differences(cursor)
+    cursor.execute("DELETE FROM webapp_accountsearch")
+    cursor.execute(
+        f"INSERT INTO webapp_accountsearch ({COLUMNS}) "
+        f"{SELECT_SQL.format(accounts='webapp_account')}"
+    )
+    return before
+
+
+def account_saved_receiver(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_accounts([instance])
+
+
+def account_deleted_receiver(sender, instance, **kwargs):
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM webapp_accountsearch WHERE id = %s", [instance.pk])
+
+
+def consumer_saved_receiver(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE webapp_accountsearch
+            SET consumer_name = %s, consumer_address = %s, consumer_ssn = %s
+            WHERE consumer_id = %s
+            """,
+            [instance.name, instance.address, instance.ssn, instance.pk],
+        )
+
+
+def agency_saved_receiver(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE webapp_accountsearch SET agency_name = %s WHERE agency_id = %s",
+            [instance.name, instance.pk],
+        )
@@ -1,5 +1,14 @@
+from operator import itemgetter
+
 from rest_framework import serializers
-from webapp.models import CollectionAgency, Client, Consumer, Account
+from webapp.models import (
+    CollectionAgency,
+    Client,
+    Consumer,
+    Account,
+    IngestJob,
+    UploadSession,
+)
 
 
 class CollectionAgencySerializer(serializers.ModelSerializer):
@@ -29,3 +38,248 @@ class AccountSerializer(serializers.ModelSerializer):
     class Meta:
         model = Account
         fields = ["id", "balance", "status", "consumer", "client"]
+
+
+class IngestJobSerializer(serializers.ModelSerializer):
+    agency_name = serializers.CharField(source="agency.name")
+
+    class Meta:
+        model = IngestJob
+        fields = [
+            "id",
+            "agency_name",
+            "engine",
+            "mark_missing",
+            "skip_invalid",
+            "status",
+            "validation",
+            "rows_processed",
+            "rows_inserted",
+            "rows_updated",
+            "rows_unchanged",
+            "rows_inactivated",
+            "rows_per_second",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+        ]
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    agency_name = serializers.CharField(source="agency.name")
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            "id",
+            "agency_name",
+            "offset",
+            "status",
+            "upload",
+            "job",
+            "created_at",
+            "updated_at",
+        ]
+
+
+class AccountRowSerializer(serializers.BaseSerializer):
+    """
+    Read-only ``AccountSerializer`` for ``.values(*AccountRowSerializer.values)``
+    rows.
+
+    It builds the same representation with plain dicts instead of one nested
+    serializer per consumer, client and agency, which dominates the cost of
+    listing accounts. ``fields`` and ``expand`` narrow the representation to
+    some fields and nested relations, and ``columns()`` to the values they
+    need.
+    """
+
+    # Account id, balance, status, consumer id, name, address and ssn,
+    # client reference no, agency id and name, in that order.
+    values = [
+        "id",
+        "balance",
+        "status",
+        "consumer_id",
+        "consumer__name",
+        "consumer__address",
+        "consumer__ssn",
+        "client_id",
+        "client__agency_id",
+        "client__agency__name",
+    ]
+    row_values = itemgetter(*values)
+    balance_field = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+    # Top-level fields and the positions in ``values`` of their columns. A
+    # relation that is not expanded is represented by its key only.
+    field_names = ("id", "balance", "status", "consumer", "client")
+    field_columns = {
+        "id": (0,),
+        "balance": (1,),
+        "status": (2,),
+        "consumer": (3,),
+        "client": (7,),
+    }
+    expanded_columns = {"consumer": (3, 4, 5, 6), "client": (7, 8, 9)}
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = set(fields or self.field_names)
+        self.selected = [name for name in self.field_names if name in fields]
+        self.expand = set(self.expanded_columns if expand is None else expand)
+        self.sparse = len(self.selected) < len(self.field_names) or self.expand != set(
+            self.expanded_columns
+        )
+
+    @classmethod
+    def fieldset(cls, query_params):
+        """
+        Serializer options for the ``fields`` and ``expand`` query parameters.
+
+        Both take comma-separated names. Without ``fields`` every field is
+        returned and, unless ``expand`` names some, every relation expanded;
+        with ``fields``, which must name at least one field, only the
+        relations in ``expand`` are.
+        """
+        options, errors = {}, {}
+        for param, allowed in [
+            ("fields", cls.field_names),
+            ("expand", tuple(cls.expanded_columns)),
+        ]:
+            if param not in query_params:
+                continue
+            names = {
+                name.strip()
+                for value in query_params.getlist(param)
+                for name in value.split(",")
+                if name.strip()
+            }
+            unknown = names.difference(allowed)
+            if unknown:
+                errors[param] = [
+                    f"Unknown {', '.join(sorted(unknown))}, expected some of: "
+                    f"{', '.join(allowed)}"
+                ]
+            elif param == "fields" and not names:
+                errors[param] = [
+                    f"No field named, expected some of: {', '.join(allowed)}"
+                ]
+            options[param] = names
+        if errors:
+            raise serializers.ValidationError(errors)
+        if "fields" in options:
+            options.setdefault("expand", ())
+        return options
+
+    def columns(self):
+        """The ``values`` needed for the selected fields, in ``values`` order."""
+        positions = set()
+        for name in self.selected:
+            positions.update(
+                (self.expanded_columns if name in self.expand else self.field_columns)[
+                    name
+                ]
+            )
+        return [
+            value for position, value in enumerate(self.values) if position in positions
+        ]
+
+    def to_representation(self, row):
+        if self.sparse:
+            return self.sparse_representation(row)
+        (
+            account_id,
+            balance,
+            status,
+            consumer_id,
+            consumer_name,
+            consumer_address,
+            consumer_ssn,
+            client_id,
+            agency_id,
+            agency_name,
+        ) = self.row_values(row)
+        return {
+            "id": account_id,
+            "balance": self.balance_field.to_representation(balance),
+            "status": status,
+            "consumer": {
+                "id": consumer_id,
+                "name": consumer_name,
+                "address": consumer_address,
+                "ssn": consumer_ssn,
+            },
+            "client": {
+                "reference_no": str(client_id),
+                "agency": {
+                    "id": agency_id,
+                    "name": agency_name,
+                },
+            },
+        }
+
+    def sparse_representation(self, row):
+        (
+            account_id,
+            balance,
+            status,
+            consumer_id,
+            consumer_name,
+            consumer_address,
+            consumer_ssn,
+            client_id,
+            agency_id,
+            agency_name,
+        ) = map(row.get, self.values)
+        data = {}
+        for name in self.selected:
+            if name == "id":
+                data["id"] = account_id
+            elif name == "balance":
+                data["balance"] = self.balance_field.to_representation(balance)
+            elif name == "status":
+                data["status"] = status
+            elif name == "consumer":
+                data["consumer"] = (
+                    {
+                        "id": consumer_id,
+                        "name": consumer_name,
+                        "address": consumer_address,
+                        "ssn": consumer_ssn,
+                    }
+                    if "consumer" in self.expand
+                    else consumer_id
+                )
+            else:
+                data["client"] = (
+                    {
+                        "reference_no": str(client_id),
+                        "agency": {
+                            "id": agency_id,
+                            "name": agency_name,
+                        },
+                    }
+                    if "client" in self.expand
+                    else str(client_id)
+                )
+        return data
+
+
+class AccountSearchRowSerializer(AccountRowSerializer):
+    """``AccountRowSerializer`` for rows of the ``AccountSearch`` read model."""
+
+    values = [
+        "id",
+        "balance",
+        "status",
+        "consumer_id",
+        "consumer_name",
+        "consumer_address",
+        "consumer_ssn",
+        "client_id",
+        "agency_id",
+        "agency_name",
+    ]
+    row_values = itemgetter(*values)
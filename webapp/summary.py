@@ -0,0 +1,85 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection
+
+# Adds account counts and balances to the summary of their client and status.
+# ``{source}`` yields (agency_id, client_id, status, account_count,
+# total_balance) rows, sorted so that concurrent ingests lock summary rows in
+# the same order.
+UPSERT_SQL = """
+    INSERT INTO webapp_accountsummary
+        (agency_id, client_id, status, account_count, total_balance)
+    {source}
+    ON CONFLICT (client_id, status) DO UPDATE SET
+        account_count = webapp_accountsummary.account_count + EXCLUDED.account_count,
+        total_balance = webapp_accountsummary.total_balance + EXCLUDED.total_balance
+"""
+
+# The summary computed from scratch.
+AGGREGATE_SQL = """
+    SELECT client.agency_id, account.client_id, account.status,
+        count(*) AS account_count, sum(account.balance) AS total_balance
+    FROM webapp_account AS account
+    JOIN webapp_client AS client ON client.reference_no = account.client_id
+    GROUP BY client.agency_id, account.client_id, account.status
+"""
+
+
+def add_accounts(agency, accounts):
+    """Add newly created ``accounts`` of ``agency`` to the summary."""
+    deltas = defaultdict(lambda: [0, Decimal(0)])
+    for account in accounts:
+        delta = deltas[account.client_id, account.status]
+        delta[0] += 1
+        delta[1] += Decimal(account.balance)
+    if not deltas:
+        return
+
+    params = []
+    for (client_id, status), (count, balance) in sorted(deltas.items()):
+        params += [agency.pk, client_id, status, count, balance]
+    values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(deltas))
+    with connection.cursor() as cursor:
+        cursor.execute(UPSERT_SQL.format(source=f"VALUES {values}"), params)
+
+
+def summary_differences(cursor):
+    """
+    Count the (client, status) groups whose summary differs from the accounts.
+
+    Groups without accounts match a missing summary row or one at zero.
+    """
+    cursor.execute(
+        f"""
+        SELECT count(*)
+        FROM webapp_accountsummary AS summary
+        FULL JOIN ({AGGREGATE_SQL}) AS actual
+            ON actual.client_id = summary.client_id
+            AND actual.status = summary.status
+        WHERE coalesce(summary.account_count, 0) <> coalesce(actual.account_count, 0)
+            OR coalesce(summary.total_balance, 0) <> coalesce(actual.total_balance, 0)
+        """
+    )
+    return cursor.fetchone()[0]
+
+
+def rebuild_summary(cursor):
+    """
+    Replace the summary with one aggregated from the account table.
+
+    Must run in a transaction. The summary is locked first, so ingests wait
+    to add their accounts until the rebuild has committed, and a rebuild
+    waits for ingests that already did.
+    """
+    cursor.execute("LOCK TABLE webapp_accountsummary IN EXCLUSIVE MODE")
+    before = summary_differences(cursor)
+    cursor.execute("DELETE FROM webapp_accountsummary")
+    cursor.execute(
+        f"""
+        INSERT INTO webapp_accountsummary
+            (agency_id, client_id, status, account_count, total_balance)
+        {AGGREGATE_SQL}
+        """
+    )
+    return before
@@ -0,0 +1,212 @@
+import csv
+import io
+import random
+import uuid
+from pathlib import Path
+
+from webapp.ingest import ingest
+from webapp.models import CollectionAgency
+
+FIRST_NAMES = [
+    "James",
+    "Mary",
+    "Robert",
+    "Patricia",
+    "John",
+    "Jennifer",
+    "Michael",
+    "Linda",
+    "David",
+    "Elizabeth",
+    "William",
+    "Barbara",
+    "Richard",
+    "Susan",
+    "Joseph",
+    "Jessica",
+    "Thomas",
+    "Sarah",
+    "Carlos",
+    "Karen",
+    "Daniel",
+    "Lisa",
+    "Matthew",
+    "Nancy",
+    "Anthony",
+    "Betty",
+    "Mark",
+    "Sandra",
+    "Luis",
+    "Ashley",
+    "Steven",
+    "Kimberly",
+]
+LAST_NAMES = [
+    "Smith",
+    "Johnson",
+    "Williams",
+    "Brown",
+    "Jones",
+    "Garcia",
+    "Miller",
+    "Davis",
+    "Rodriguez",
+    "Martinez",
+    "Hernandez",
+    "Lopez",
+    "Gonzalez",
+    "Wilson",
+    "Anderson",
+    "Thomas",
+    "Taylor",
+    "Moore",
+    "Jackson",
+    "Martin",
+    "Lee",
+    "Perez",
+    "Thompson",
+    "White",
+    "Harris",
+    "Sanchez",
+    "Clark",
+    "Ramirez",
+    "Lewis",
+    "Robinson",
+    "Walker",
+    "Young",
+]
+STREETS = [
+    "Main",
+    "Oak",
+    "Pine",
+    "Maple",
+    "Cedar",
+    "Elm",
+    "Lake",
+    "Hill",
+    "Park",
+    "Washington",
+    "Sunset",
+    "River",
+]
+CITIES = [
+    ("Springfield", "IL"),
+    ("Riverside", "CA"),
+    ("Franklin", "TN"),
+    ("Greenville", "SC"),
+    ("Madison", "WI"),
+    ("Salem", "OR"),
+    ("Fairview", "TX"),
+    ("Clinton", "NY"),
+]
+STATUSES = ["IN_COLLECTION", "PAID_IN_FULL", "INACTIVE"]
+STATUS_WEIGHTS = [6, 3, 1]
+
+CSV_HEADER = [
+    "client reference no",
+    "balance",
+    "status",
+    "consumer name",
+    "consumer address",
+    "ssn",
+    "account reference no",
+]
+
+
+class SyntheticDataset:
+    """
+    A reproducible set of account uploads, generated lazily.
+
+    Clients are spread over agencies round-robin and every account belongs
+    to a random client of its agency and a random consumer, with an account
+    reference no unique within the agency, so any size from
+    thousands to millions of accounts is produced in constant memory. The
+    same ``seed`` always produces the same rows.
+    """
+
+    def __init__(
+        self, accounts=10_000, agencies=10, clients=100, consumers=None, seed=0
+    ):
+        if min(accounts, agencies) < 1 or clients < agencies:
+            raise ValueError(
+                "A dataset needs accounts, agencies and a client per agency"
+            )
+        self.accounts = accounts
+        self.agencies = agencies
+        self.clients = clients
+        self.consumers = consumers or max(1, accounts // 2)
+        self.seed = seed
+
+    def agency_name(self, agency):
+        return f"Synthetic Agency {agency + 1}"
+
+    def reference_no(self, client):
+        return uuid.UUID(
+            int=random.Random(f"{self.seed}-client-{client}").getrandbits(128),
+            version=4,
+        )
+
+    def consumer(self, n):
+        """Name, address and SSN of consumer ``n``; unique per ``n``."""
+        first = FIRST_NAMES[n % len(FIRST_NAMES)]
+        last = LAST_NAMES[n // len(FIRST_NAMES) % len(LAST_NAMES)]
+        city, state = CITIES[n % len(CITIES)]
+        address = (
+            f"{n % 9000 + 100} {STREETS[n % len(STREETS)]} St, "
+            f"{city}, {state} {10000 + n % 90000:05d}"
+        )
+        ssn = f"{n // 1_000_000:03d}-{n // 10_000 % 100:02d}-{n % 10_000:04d}"
+        return f"{first} {last}", address, ssn
+
+    def agency_accounts(self, agency):
+        return self.accounts // self.agencies + (agency < self.accounts % self.agencies)
+
+    def rows(self, agency):
+        """CSV rows of the upload of ``agency``, without the header."""
+        rng = random.Random(f"{self.seed}-agency-{agency}")
+        clients = range(agency, self.clients, self.agencies)
+        reference_nos = [str(self.reference_no(client)) for client in clients]
+        for index in range(self.agency_accounts(agency)):
+            balance = round(rng.lognormvariate(6, 1.2), 2)
+            status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+            yield (
+                rng.choice(reference_nos),
+                f"{balance:.2f}",
+                status,
+                *self.consumer(rng.randrange(self.consumers)),
+                f"{agency + 1}-{index + 1}",
+            )
+
+    def csv_chunks(self, agency, chunk_size=1024 * 1024):
+        """The upload of ``agency`` as UTF-8 byte chunks."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(CSV_HEADER)
+        for row in self.rows(agency):
+            writer.writerow(row)
+            if buffer.tell() >= chunk_size:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode()
+
+    def write_csv(self, directory):
+        """Write one CSV file per agency into ``directory``."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for agency in range(self.agencies):
+            path = directory / f"agency-{agency + 1}.csv"
+            with open(path, "wb") as file:
+                for chunk in self.csv_chunks(agency):
+                    file.write(chunk)
+            paths.append(path)
+        return paths
+
+    def load(self, engine="copy"):
+        """Ingest every agency's upload and yield the ingest stats of each."""
+        for index in range(self.agencies):
+            agency, _ = CollectionAgency.objects.get_or_create(
+                name=self.agency_name(index)
+            )
+            yield agency, ingest(self.csv_chunks(index), agency, engine=engine)
@@ -1,8 +1,64 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+import warnings
+import zipfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.core.paginator import UnorderedObjectListWarning
+from django.conf import settings
+from django.db import DataError, OperationalError, connection
+from django.test import (
+    LiveServerTestCase, SimpleTestCase, TestCase, TransactionTestCase,
+    override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.core.files.uploadedfile import SimpleUploadedFile
 from rest_framework import status
-from rest_framework.test import APIClient
-from webapp.models import CollectionAgency, Client, Consumer, Account
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from webapp.models import (
+    AccountSearch, AccountSummary, CollectionAgency, Client, Consumer, Account,
+    IngestJob, Upload, UploadSession
+)
+from webapp.caching import ACCOUNT_CACHE
+from webapp.compression import decompressed_chunks
+from webapp.filters import AccountFilter
+from webapp.ingest import (
+    BATCH_SIZE, ENGINES, IngestError, ingest, ingest_csv, iter_lines, resolve_clients,
+    resolve_consumers,
+)
+from webapp.jobs import Heartbeat, claim_next_job, run_job, run_next_job
+from webapp.management.commands.benchmark_serializers import (
+    flat_page, nested_page
+)
+from webapp.management.commands.benchmark_compression import FORMATS, zip_compress
+from webapp.management.commands.ingest_accounts import split_file
+from webapp import metrics
+from webapp.metrics import INGEST_BATCH_DURATION, INGEST_ROWS, normalize_sql
+from webapp.pagination import ApproximateCountPagination, KeysetPagination
+from webapp.partitions import ensure_partition, partition_name
+from webapp.readmodel import read_model_differences, rebuild_read_model
+from webapp.summary import rebuild_summary, summary_differences
+from webapp.synthetic import SyntheticDataset
+from webapp.validation import validate_csv
+from webapp.views import AccountListView
 
 ACCOUNTS_URL = "/api/v1/accounts/"
 
@@ -218,3 +274,2122 @@ class UploadCSVTests(TestCase):
             Account.objects.filter(
                 consumer__name="Bob Johnson", client__agency=second_agency).exists(), True
         )
+
+
+CSV_HEADER = "client reference no,balance,status,consumer name,consumer address,ssn\n"
+
+
+def synthetic_csv_chunks(rows, consumers=100, chunk_size=64 * 1024,
+                         references=None):
+    """
+    Lazily generate an upload of ``rows`` accounts as byte chunks.
+
+    With ``references``, the rows get account reference nos with that prefix.
+    """
+    header = CSV_HEADER
+    if references:
+        header = header.replace("\n", ",account reference no\n")
+    buffer = [header]
+    size = len(header)
+    for i in range(rows):
+        n = i % consumers
+        line = (
+            f"ffeb5d88-e5af-45f0-9637-{n % 10:012d},{i % 9999}.50,IN_COLLECTION,"
+            f'Consumer {n},"{n} Main St, Somecity, AA 12345",{n % 1000:03d}-45-6789'
+        )
+        line += f",{references}-{i}\n" if references else "\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield "".join(buffer).encode()
+            buffer = []
+            size = 0
+    yield "".join(buffer).encode()
+
+
+def peak_memory(func, *args, **kwargs):
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class StreamingIngestTests(TestCase):
+    # Override with e.g. INGEST_PROFILE_ROWS=3000000 for a full-size profile.
+    PROFILE_ROWS = int(os.environ.get("INGEST_PROFILE_ROWS", 5000))
+
+    def setUp(self):
+        self.agency = CollectionAgency.objects.create(name="Test Agency")
+
+    def test_iter_lines_handles_split_multibyte_and_crlf(self):
+        data = 'a,b\r\n"Jos\u00e9","1 Main St\nApt 2"\r\n'.encode()
+        chunks = [data[i:i + 1] for i in range(len(data))]
+        self.assertEqual(
+            "".join(iter_lines(chunks)), data.decode())
+
+    def test_ingest_flushes_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            rows = ingest_csv(synthetic_csv_chunks(25, consumers=10),
+                              self.agency, batch_size=10)
+        inserts = [q for q in queries.captured_queries
+                   if q["sql"].startswith('INSERT INTO "webapp_account"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(rows, 25)
+        self.assertEqual(Account.objects.count(), 25)
+
+    def test_peak_memory_is_flat_in_file_size(self):
+        small = peak_memory(ingest_csv, synthetic_csv_chunks(
+            self.PROFILE_ROWS), self.agency, batch_size=1000)
+        large = peak_memory(ingest_csv, synthetic_csv_chunks(
+            self.PROFILE_ROWS * 4), self.agency, batch_size=1000)
+        self.assertEqual(Account.objects.count(), self.PROFILE_ROWS * 5)
+        self.assertLess(large, small * 1.5)
+
+
+class ResolverTests(TestCase):
+    def setUp(self):
+        self.agency = CollectionAgency.objects.create(name="Test Agency")
+
+    def test_resolve_consumers_uses_constant_queries(self):
+        existing = Consumer.objects.create(
+            name="John Doe", address="123 Main St", ssn="123-45-6789")
+        keys = [(f"Consumer {i}", f"{i} Main St", f"{i:03d}-45-6789")
+                for i in range(500)]
+        keys.append(("John Doe", "123 Main St", "123-45-6789"))
+
+        with self.assertNumQueries(3):
+            ids = resolve_consumers(keys)
+
+        self.assertEqual(len(ids), 501)
+        self.assertEqual(ids[("John Doe", "123 Main St", "123-45-6789")],
+                         existing.pk)
+        self.assertEqual(Consumer.objects.count(), 501)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_consumers(keys), ids)
+
+    def test_resolve_clients_rejects_other_agency(self):
+        other = CollectionAgency.objects.create(name="Other Agency")
+        Client.objects.create(
+            reference_no="d984a3b4-d331-4857-8e6f-b44bad2567aa", agency=other)
+
+        with self.assertRaises(IngestError):
+            resolve_clients(self.agency, [
+                uuid.UUID("d984a3b4-d331-4857-8e6f-b44bad2567aa")])
+
+    def test_upload_reuses_existing_consumers(self):
+        Consumer.objects.create(
+            name="Anna Smith", address="789 Oak St, Somecity, AA 12345",
+            ssn="123-45-6780")
+        csv_content = (
+            CSV_HEADER
+            + 'ffeb5d88-e5af-45f0-9637-16ea469c58c0,1200.00,IN_COLLECTION,Anna Smith,"789 Oak St, Somecity, AA 12345",123-45-6780\n'
+            + 'ffeb5d88-e5af-45f0-9637-16ea469c58c0,300.00,PAID_IN_FULL,Anna Smith,"789 Oak St, Somecity, AA 12345",123-45-6780\n'
+        )
+        response = APIClient().post("/api/v1/upload/", {
+            "file": SimpleUploadedFile("accounts.csv", csv_content.encode()),
+            "agency_name": self.agency.name,
+        }, format="multipart")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Consumer.objects.count(), 1)
+        self.assertEqual(Account.objects.count(), 2)
+
+    def test_upload_with_invalid_reference_no_is_rejected(self):
+        csv_content = (
+            CSV_HEADER
+            + 'not-a-uuid,1200.00,IN_COLLECTION,Anna Smith,"789 Oak St",123-45-6780\n'
+        )
+        response = APIClient().post("/api/v1/upload/", {
+            "file": SimpleUploadedFile("accounts.csv", csv_content.encode()),
+            "agency_name": self.agency.name,
+        }, format="multipart")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Account.objects.count(), 0)
+
+
+class CSVValidationTests(TestCase):
+    VALID = 'ffeb5d88-e5af-45f0-9637-16ea469c58c0,{balance},{status},Anna Smith,"1 Oak St",{ssn}\n'
+
+    def setUp(self):
+        self.agency = CollectionAgency.objects.create(name="Test Agency")
+
+    def row(self, balance="1.00", status="INACTIVE", ssn="123-45-6780"):
+        return self.VALID.format(balance=balance, status=status, ssn=ssn)
+
+    def upload(self, content, **data):
+        return APIClient().post("/api/v1/upload/", {
+            "file": SimpleUploadedFile(
+                "accounts.csv", content.encode(errors="surrogateescape")),
+            "agency_name": self.agency.name, **data,
+        }, format="multipart")
+
+    def test_columns_are_checked_against_the_model(self):
+        content = (
+            CSV_HEADER
+            + self.row(balance="-12345678.99", status=" paid_in_full ")
+            + self.row(balance="123456789.00")
+            + self.row(balance="1.005", status="OPEN")
+            + "not-a-uuid,abc,INACTIVE,Anna Smith,1 Oak St,123456780\n"
+            + "\n"
+            + self.row(balance="0.5")
+            + "ffeb5d88-e5af-45f0-9637-16ea469c58c0,1.00\n"
+        )
+        report, invalid = validate_csv([content.encode()])
+        balance = "Not a number with at most 8 digits before and 2 after the decimal point"
+        self.assertEqual(report["errors"], [
+            {"line": 3, "balance": balance},
+            {"line": 4, "balance": balance,
+             "status": "Not one of INACTIVE, PAID_IN_FULL, IN_COLLECTION"},
+            {"line": 5, "client reference no": "Not a UUID", "balance": balance,
+             "ssn": "Not formatted as 123-45-6789"},
+            {"line": 8, "row": "Expected 6 fields, found 2"},
+        ])
+        self.assertEqual((report["rows"], report["invalid_rows"]), (6, 4))
+        self.assertEqual(invalid, {3, 4, 5, 8})
+        self.assertFalse(report["errors_truncated"])
+
+        report, _ = validate_csv([content.encode()], batch_size=2, max_errors=2)
+        self.assertEqual([error["line"] for error in report["errors"]], [3, 4])
+        self.assertEqual((report["invalid_rows"], report["errors_truncated"]), (4, True))
+
+    def test_invalid_uploads_are_rejected_before_any_write(self):
+        content = CSV_HEADER + self.row() * 3 + self.row(balance="1,00")
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                # The agency and the upload ledger are only read.
+                with self.assertNumQueries(2):
+                    response = self.upload(content, engine=engine)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertEqual(response.data["error"], "1 of 4 rows are invalid")
+                self.assertEqual(response.data["errors"][0]["line"], 5)
+        self.assertFalse(Client.objects.exists())
+        self.assertFalse(Consumer.objects.exists())
+
+    def test_unreadable_files_are_rejected(self):
+        for content, error in [
+            ("client reference no,balance\n", "Missing CSV columns: status"),
+            (CSV_HEADER + "\udcff\n", "Unreadable CSV"),
+        ]:
+            response = self.upload(content)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(error, response.data["error"])
+
+    def test_valid_rows_can_be_ingested_alone(self):
+        content = (CSV_HEADER + self.row(balance="1.00") + self.row(status="LOST")
+                   + self.row(balance="2.50"))
+        for engine in ("orm", "copy"):
+            with self.subTest(engine=engine):
+                response = self.upload(content + "\n" * len(engine), engine=engine,
+                                       skip_invalid="true")
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                self.assertEqual((response.data["rows"], response.data["skipped_rows"]),
+                                 (2, 1))
+                self.assertEqual(response.data["errors"],
+                                 [{"line": 3, "status": "Not one of INACTIVE, "
+                                   "PAID_IN_FULL, IN_COLLECTION"}])
+        self.assertEqual(
+            sorted(str(balance) for balance in
+                   Account.objects.values_list("balance", flat=True)),
+            ["1.00", "1.00", "2.50", "2.50"])
+
+        self.upload(content + "\n" * 5, skip_invalid="true", **{"async": "true"})
+        job = run_next_job()
+        self.assertEqual((job.status, job.rows_processed), (IngestJob.SUCCEEDED, 2))
+        self.assertEqual(job.validation["invalid_rows"], 1)
+
+
+class CopyIngestTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.agency = CollectionAgency.objects.create(name="Test Agency")
+
+    def upload(self, csv_content, engine="copy"):
+        return self.client.post("/api/v1/upload/", {
+            "file": SimpleUploadedFile("accounts.csv", csv_content.encode()),
+            "agency_name": self.agency.name,
+            "engine": engine,
+        }, format="multipart")
+
+    def test_copy_engine_matches_orm_engine(self):
+        Consumer.objects.create(
+            name="Consumer 1", address="1 Main St, Somecity, AA 12345",
+            ssn="001-45-6789")
+        csv_content = b"".join(synthetic_csv_chunks(50, consumers=5)).decode()
+
+        response = self.upload(csv_content)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["engine"], "copy")
+        self.assertEqual(response.data["rows"], 50)
+        self.assertIn("rows_per_second", response.data)
+        self.assertEqual(Consumer.objects.count(), 5)
+        self.assertEqual(Client.objects.filter(agency=self.agency).count(), 5)
+
+        # A trailing blank line keeps the ledger from treating it as a duplicate.
+        self.upload(csv_content + "\n", engine="orm")
+        copied = Account.objects.order_by("id")[:50]
+        created = Account.objects.order_by("id")[50:]
+        self.assertEqual(
+            [(a.balance, a.status, a.consumer_id, a.client_id) for a in copied],
+            [(a.balance, a.status, a.consumer_id, a.client_id) for a in created],
+        )
+
+    def test_copy_engine_accepts_reordered_and_extra_columns(self):
+        csv_content = (
+            "ssn,notes,consumer name,consumer address,status,balance,client reference no\n"
+            '123-45-6780,n/a,Anna Smith,"789 Oak St, Somecity, AA 12345",IN_COLLECTION,1200.00,ffeb5d88-e5af-45f0-9637-16ea469c58c0\n'
+        )
+
+        response = self.upload(csv_content)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        account = Account.objects.select_related("consumer").get()
+        self.assertEqual(account.consumer.address,
+                         "789 Oak St, Somecity, AA 12345")
+        self.assertEqual(str(account.balance), "1200.00")
+
+    def test_copy_engine_rolls_back_invalid_rows(self):
+        csv_content = (
+            CSV_HEADER
+            + 'ffeb5d88-e5af-45f0-9637-16ea469c58c0,1200.00,IN_COLLECTION,Anna Smith,"789 Oak St",123-45-6780\n'
+            + 'not-a-uuid,1200.00,IN_COLLECTION,Bob Smith,"789 Oak St",123-45-6781\n'
+        )
+
+        response = self.upload(csv_content)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Consumer.objects.count(), 0)
+        self.assertEqual(Client.objects.count(), 0)
+
+    def test_statuses_are_normalized_by_both_engines(self):
+        for engine in ("orm", "copy"):
+            self.upload(
+                CSV_HEADER
+                + f'ffeb5d88-e5af-45f0-9637-16ea469c58c0,1.00, paid_in_full ,{engine},"1 Oak St",123-45-6780\n',
+                engine=engine,
+            )
+        self.assertEqual(
+            list(Account.objects.values_list("status", flat=True)),
+            ["PAID_IN_FULL", "PAID_IN_FULL"],
+        )
+
+    def test_blank_lines_are_skipped_by_every_engine(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                response = self.upload(
+                    CSV_HEADER.replace("\n", ",account reference no\n")
+                    + "\n"
+                    + f'ffeb5d88-e5af-45f0-9637-16ea469c58c0,1.00,INACTIVE,{engine},'
+                    f'"1 Oak St\n\nSomecity",123-45-6780,{engine}\r\n'
+                    + "\r\n\n",
+                    engine=engine,
+                )
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED,
+                                 response.data)
+                self.assertEqual(response.data["rows"], 1)
+        self.assertEqual(
+            set(Consumer.objects.values_list("address", flat=True)),
+            {"1 Oak St\n\nSomecity"})
+
+    def test_unknown_engine_is_rejected(self):
+        response = self.upload(CSV_HEADER, engine="magic")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class IngestJobTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.agency = CollectionAgency.objects.create(name="Test Agency")
+
+    def upload_async(self, csv_content):
+        return self.client.post("/api/v1/upload/", {
+            "file": SimpleUploadedFile("accounts.csv", csv_content.encode()),
+            "agency_name": self.agency.name,
+            "async": "true",
+        }, format="multipart")
+
+    def test_async_upload_returns_job(self):
+        csv_content = b"".join(synthetic_csv_chunks(20)).decode()
+
+        response = self.upload_async(csv_content)
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response["Location"], response.data["url"])
+        self.assertEqual(Account.objects.count(), 0)
+
+        job_response = self.client.get(response.data["url"])
+        self.assertEqual(job_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(job_response.data["status"], IngestJob.QUEUED)
+        self.assertEqual(job_response.data["agency_name"], "Test Agency")
+
+    def test_worker_runs_queued_jobs(self):
+        first = self.upload_async(b"".join(synthetic_csv_chunks(20)).decode())
+        second = self.upload_async(b"".join(synthetic_csv_chunks(5)).decode())
+
+        out = StringIO()
+        call_command("process_ingest_jobs", "--once", stdout=out)
+
+        self.assertEqual(out.getvalue().count("succeeded"), 2)
+        self.assertEqual(Account.objects.count(), 25)
+        job_response = self.client.get(first.data["url"])
+        self.assertEqual(job_response.data["status"], IngestJob.SUCCEEDED)
+        self.assertEqual(job_response.data["rows_processed"], 20)
+        self.assertIsNotNone(job_response.data["rows_per_second"])
+        self.assertEqual(
+            self.client.get(second.data["url"]).data["rows_processed"], 5)
+        self.assertIsNone(run_next_job())
+
+    def test_failed_job_reports_error(self):
+        # Valid rows whose client belongs to another agency only fail in the job.
+        reference_no = "ffeb5d88-e5af-45f0-9637-16ea469c58c0"
+        Client.objects.create(
+            reference_no=reference_no,
+            agency=CollectionAgency.objects.create(name="Other Agency"))
+        self.upload_async(
+            CSV_HEADER + f"{reference_no},1.00,INACTIVE,Anna Smith,1 Oak St,123-45-6780\n")
+
+        job = run_next_job()
+
+        self.assertEqual(job.status, IngestJob.FAILED)
+        self.assertIn(reference_no, job.error)
+        self.assertEqual(job.rows_processed, 0)
+
+    def test_invalid_rows_are_reported_by_the_job(self):
+        response = self.upload_async(
+            CSV_HEADER + "not-a-uuid,1.00,INACTIVE,Anna Smith,1 Oak St,123-45-6780\n")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        job = run_next_job()
+
+        self.assertEqual((job.status, job.error),
+                         (IngestJob.FAILED, "1 of 1 rows are invalid"))
+        data = self.client.get(response.data["url"]).data
+        self.assertEqual(data["validation"]["errors"],
+                         [{"line": 2, "client reference no": "Not a UUID"}])
+        self.assertFalse(Client.objects.exists())
+
+    def test_claimed_job_is_not_claimed_twice(self):
+        self.upload_async(CSV_HEADER)
+
+        self.assertIsNotNone(claim_next_job())
+        self.assertIsNone(claim_next_job())
+
+    def test_failed_job_leaves_no_rows_behind(self):
+        # The foreign client only fails the second batch of the orm engine.
+        reference_no = "ffeb5d88-e5af-45f0-9637-16ea469c58c0"
+        foreign = Client.objects.create(
+            reference_no=reference_no,
+            agency=CollectionAgency.objects.create(name="Other Agency"))
+        content = (b"".join(synthetic_csv_chunks(BATCH_SIZE)).decode()
+                   + f"{reference_no},1.00,INACTIVE,Anna Smith,1 Oak St,123-45-6780\n")
+        self.upload_async(content)
+
+        job = run_next_job()
+
+        self.assertEqual((job.status, job.rows_processed), (IngestJob.FAILED, 0))
+        self.assertFalse(Account.objects.exists())
+        self.assertFalse(Upload.objects.exists())
+
+        foreign.delete()
+        self.upload_async(content)
+        self.assertEqual(run_next_job().status, IngestJob.SUCCEEDED)
+        self.assertEqual(Account.objects.count(), BATCH_SIZE + 1)
+
+    def test_abandoned_job_is_claimed_again(self):
+        self.upload_async(b"".join(synthetic_csv_chunks(20)).decode())
+        abandoned = claim_next_job()
+        self.assertIsNone(claim_next_job())
+
+        IngestJob.objects.update(heartbeat_at=timezone.now() - timedelta(
+            seconds=settings.INGEST_JOB_TIMEOUT + 1))
+        job = claim_next_job()
+        self.assertEqual((job.pk, job.attempts), (abandoned.pk, 2))
+
+        # A worker that was only slow cannot record its outcome any more.
+        run_job(abandoned)
+        self.assertFalse(Account.objects.exists())
+        self.assertEqual(IngestJob.objects.get().status, IngestJob.RUNNING)
+
+        run_job(job)
+        self.assertEqual(IngestJob.objects.get().status, IngestJob.SUCCEEDED)
+        self.assertEqual(Account.objects.count(), 20)
+
+    def test_unknown_job_returns_404(self):
+        response = self.client.get(f"/api/v1/upload/{uuid.uuid4()}/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class HeartbeatTests(TransactionTestCase):
+    def test_progress_is_visible_while_the_job_runs(self):
+        agency = CollectionAgency.objects.create(name="Test Agency")
+        job = IngestJob.objects.create(agency=agency, status=IngestJob.RUNNING,
+                                       attempts=1)
+
+        with Heartbeat(job) as heartbeat:
+            heartbeat.progress(10)
+            for _ in range(50):
+                job.refresh_from_db()
+                if job.rows_processed:
+                    break
+                time.sleep(0.1)
+
+        self.assertEqual(job.rows_processed, 10)
+        self.assertIsNotNone(job.heartbeat_at)
+
+
+class IngestAccountsCommandTests(TransactionTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name, rows in (("a.csv", 300), ("b.csv", 120)):
+            with open(os.path.join(self.directory, name), "wb") as file:
+                file.writelines(synthetic_csv_chunks(rows, consumers=50))
+
+    def test_split_file_on_line_boundaries(self):
+        path = os.path.join(self.directory, "a.csv")
+        with open(path, "rb") as file:
+            data = file.read()
+
+        shards = split_file(path, 1000)
+
+        self.assertGreater(len(shards), 1)
+        self.assertEqual(shards[0][0], len(CSV_HEADER))
+        self.assertEqual(shards[-1][1], len(data))
+        for (_, end), (start, _) in zip(shards, shards[1:]):
+            self.assertEqual(end, start)
+            self.assertEqual(data[end - 1:end], b"\n")
+
+    def test_ingest_directory_in_parallel(self):
+        out = StringIO()
+        call_command(
+            "ingest_accounts", self.directory, "--agency", "Test Agency",
+            "--workers", "3", "--shard-bytes", "2000", stdout=out,
+        )
+
+        self.assertEqual(Account.objects.count(), 420)
+        # Shards share consumers and clients, none may be duplicated.
+        self.assertEqual(Consumer.objects.count(), 50)
+        self.assertEqual(Client.objects.count(), 10)
+        self.assertIn("Ingested 420 rows from 2 files", out.getvalue())
+
+    def test_ingest_in_process(self):
+        call_command(
+            "ingest_accounts", os.path.join(self.directory, "b.csv"),
+            "--agency", "Test Agency", "--workers", "1", "--engine", "copy",
+            stdout=StringIO(),
+        )
+        self.assertEqual(Account.objects.count(), 120)
+
+    def test_invalid_file_stops_the_whole_ingest(self):
+        with open(os.path.join(self.directory, "c.csv"), "w") as file:
+            file.write(CSV_HEADER)
+            file.write("ffeb5d88-e5af-45f0-9637-16ea469c58c0,ten,INACTIVE,"
+                       "John Doe,123 Main St,123-45-6789\n")
+        err = StringIO()
+
+        with self.assertRaisesMessage(CommandError, "1 of 1 rows are invalid"):
+            call_command(
+                "ingest_accounts", self.directory, "--agency", "Test Agency",
+                "--workers", "2", stdout=StringIO(), stderr=err,
+            )
+
+        self.assertIn("c.csv, line 2: balance: Not a number", err.getvalue())
+        self.assertFalse(Account.objects.exists())
+        self.assertFalse(Upload.objects.exists())
+
+    def test_ingested_files_are_skipped(self):
+        args = ["ingest_accounts", self.directory, "--agency", "Test Agency",
+                "--workers", "2", "--shard-bytes", "2000"]
+        call_command(*args, stdout=StringIO())
+        with open(os.path.join(self.directory, "a.csv"), "rb") as file:
+            data = file.read()
+        with open(os.path.join(self.directory, "c.csv.gz"), "wb") as file:
+            file.write(gzip.compress(data))
+        out = StringIO()
+
+        call_command(*args, stdout=out)
+
+        self.assertEqual(Account.objects.count(), 420)
+        self.assertEqual(
+            sorted(Upload.objects.values_list("rows", flat=True)), [120, 300])
+        self.assertEqual(out.getvalue().count("already ingested as upload"), 3)
+        self.assertIn("Ingested 0 rows from 0 files", out.getvalue())
+
+    def test_database_errors_fail_the_command(self):
+        with mock.patch(
+                "webapp.management.commands.ingest_accounts.ingest",
+                side_effect=DataError("value out of range")):
+            with self.assertRaisesMessage(
+                    CommandError, "possibly partly ingested: "):
+                call_command(
+                    "ingest_accounts", os.path.join(self.directory, "b.csv"),
+                    "--agency", "Test Agency", "--workers", "1",
+                    stdout=StringIO(),
+                )
+        self.assertFalse(Upload.objects.exists())
+
+    def test_compressed_files_are_ingested_whole(self):
+        # Other files than a.csv, which the ledger would skip.
+        with open(os.path.join(self.directory, "c.csv.gz"), "wb") as file:
+            file.write(gzip.compress(b"".join(
+                synthetic_csv_chunks(300, consumers=50, references="c"))))
+        with open(os.path.join(self.directory, "d.zip"), "wb") as file:
+            file.write(zip_compress(b"".join(
+                synthetic_csv_chunks(300, consumers=50, references="d"))))
+
+        out = StringIO()
+        call_command(
+            "ingest_accounts", self.directory, "--agency", "Test Agency",
+            "--workers", "2", "--shard-bytes", "2000", "--engine", "copy",
+            stdout=out,
+        )
+
+        self.assertEqual(Account.objects.count(), 1020)
+        self.assertIn("from 4 files", out.getvalue())
+        self.assertIn("Worker", out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class CompressedUploadTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.agency = CollectionAgency.objects.create(name="Test Agency")
+        self.csv_content = b"".join(synthetic_csv_chunks(40, consumers=5))
+
+    def upload(self, content, **data):
+        # Named .csv whatever the format, which is told from the content.
+        return self.client.post("/api/v1/upload/", {
+            "file": SimpleUploadedFile("accounts.csv", content),
+            "agency_name": self.agency.name, **data,
+        }, format="multipart")
+
+    def test_every_format_is_detected_and_ingested(self):
+        uploads = 0
+        for name, (_, compress) in FORMATS.items():
+            for engine in ("orm", "copy"):
+                with self.subTest(format=name, engine=engine):
+                    # Distinct references keep the uploads from being duplicates.
+                    uploads += 1
+                    content = compress(b"".join(synthetic_csv_chunks(
+                        40, consumers=5, references=f"{name}-{engine}")))
+                    response = self.upload(content, engine=engine)
+                    self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                    self.assertEqual(response.data["rows"], 40)
+        self.assertEqual(Account.objects.count(), 40 * uploads)
+
+    def test_async_jobs_and_invalid_rows_are_decompressed(self):
+        content = self.csv_content + CSV_HEADER.split(",")[0].encode() + b"\n"
+        self.upload(gzip.compress(content), **{"async": "true"})
+        job = run_next_job()
+        self.assertEqual(job.status, IngestJob.FAILED)
+        self.assertEqual(job.validation["errors"][0]["line"], 42)
+
+        self.upload(gzip.compress(content), skip_invalid="true", **{"async": "true"})
+        job = run_next_job()
+        self.assertEqual((job.status, job.rows_processed), (IngestJob.SUCCEEDED, 40))
+        self.assertEqual(job.validation["invalid_rows"], 1)
+
+    def test_ledger_recognises_a_file_however_it_is_compressed(self):
+        response = self.upload(gzip.compress(self.csv_content, mtime=1))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        for content in [
+            self.csv_content,
+            gzip.compress(self.csv_content, compresslevel=1, mtime=2),
+            *(compress(self.csv_content) for _, compress in FORMATS.values()),
+        ]:
+            response = self.upload(content)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data["status"], "File already ingested")
+        self.assertEqual(Upload.objects.get().sha256,
+                         hashlib.sha256(self.csv_content).hexdigest())
+        self.assertEqual(Account.objects.count(), 40)
+
+    def test_corrupt_archives_are_rejected(self):
+        two_files = io.BytesIO()
+        with zipfile.ZipFile(two_files, "w") as archive:
+            archive.writestr("a.csv", self.csv_content)
+            archive.writestr("b.csv", self.csv_content)
+        for content, error in [
+            (gzip.compress(self.csv_content)[:-50], "Unreadable gzip file"),
+            (two_files.getvalue(), "must contain one CSV file, not 2"),
+            (zip_compress(self.csv_content)[:100], "Unreadable zip file"),
+        ]:
+            response = self.upload(content)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(error, response.data["error"])
+        self.assertFalse(Account.objects.exists())
+
+    def test_decompressed_chunks_are_bounded(self):
+        content = gzip.compress(b"0" * 5_000_000) + gzip.compress(b"1" * 10)
+        chunks = list(decompressed_chunks(io.BytesIO(content), chunk_size=64 * 1024))
+        self.assertEqual(max(map(len, chunks)), 64 * 1024)
+        self.assertEqual(b"".join(chunks), b"0" * 5_000_000 + b"1" * 10)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command("benchmark_compression", accounts=50, format=["plain", "xz"],
+                     stdout=out)
+        self.assertIn("xz: ", out.getvalue())
+        self.assertIn("the plain upload at 100 Mbit/s", out.getvalue())
+        self.assertFalse(Account.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class IdempotentUploadTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.agency = CollectionAgency.objects.create(name="Test Agency")
+        self.csv_content = b"".join(synthetic_csv_chunks(30, consumers=5))
+
+    def upload(self, content, **data):
+        return self.client.post("/api/v1/upload/", {
+            "file": SimpleUploadedFile("accounts.csv", content),
+            "agency_name": self.agency.name,
+            **data,
+        }, format="multipart")
+
+    def test_same_file_is_ingested_once_per_agency(self):
+        first = self.upload(self.csv_content)
+        second = self.upload(self.csv_content)
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data["upload_id"], first.data["upload_id"])
+        self.assertEqual(Account.objects.count(), 30)
+        upload = Upload.objects.get()
+        self.assertEqual(upload.sha256,
+                         hashlib.sha256(self.csv_content).hexdigest())
+        self.assertEqual(upload.rows, 30)
+
+    def test_failed_upload_is_not_recorded(self):
+        content = CSV_HEADER.encode() + b"not-a-uuid,1.00,INACTIVE,A,B,123-45-6780\n"
+        self.assertEqual(self.upload(content).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Upload.objects.exists())
+
+    def test_async_duplicates_share_one_job(self):
+        first = self.upload(self.csv_content, **{"async": "true"})
+        second = self.upload(self.csv_content, **{"async": "true"})
+        self.assertEqual(first.data["job_id"], second.data["job_id"])
+
+        run_next_job()
+
+        third = self.upload(self.csv_content, **{"async": "true"})
+        self.assertEqual(third.status_code, status.HTTP_200_OK)
+        self.assertEqual(Upload.objects.get().rows, 30)
+
+    def test_job_of_already_ingested_file_is_skipped(self):
+        self.upload(self.csv_content, **{"async": "true"})
+        self.upload(self.csv_content)
+
+        job = run_next_job()
+
+        self.assertEqual(job.status, IngestJob.FAILED)
+        self.assertIn("already ingested", job.error)
+        self.assertEqual(Account.objects.count(), 30)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ResumableUploadTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.csv_content = b"".join(synthetic_csv_chunks(40, consumers=5))
+        response = self.client.post(
+            "/api/v1/upload/sessions/", {"agency_name": "Test Agency"})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.url = response["Location"]
+
+    def put_part(self, part, offset):
+        return self.client.put(
+            self.url, data=part, content_type="application/octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_upload_in_parts_and_resume(self):
+        half = len(self.csv_content) // 2
+        response = self.put_part(self.csv_content[:half], 0)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Upload-Offset"], str(half))
+
+        # A client that lost the acknowledgement asks where to resume.
+        self.assertEqual(self.client.get(self.url).data["offset"], half)
+        stale = self.put_part(self.csv_content[:half], 0)
+        self.assertEqual(stale.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(stale.data["offset"], half)
+
+        self.put_part(self.csv_content[half:], half)
+        response = self.client.post(self.url + "complete/")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["rows"], 40)
+        self.assertEqual(Account.objects.count(), 40)
+        self.assertEqual(
+            self.client.get(self.url).data["status"], UploadSession.COMPLETE)
+
+    def test_completing_twice_does_not_reingest(self):
+        self.put_part(self.csv_content, 0)
+        first = self.client.post(self.url + "complete/")
+        second = self.client.post(self.url + "complete/")
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data["upload_id"], first.data["upload_id"])
+        self.assertEqual(Account.objects.count(), 40)
+        self.assertEqual(self.put_part(b"x", len(self.csv_content)).status_code,
+                         status.HTTP_409_CONFLICT)
+
+    def test_async_completion_queues_the_session_file(self):
+        self.put_part(self.csv_content, 0)
+        response = self.client.post(self.url + "complete/", {"async": "true"})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        job = run_next_job()
+
+        self.assertEqual(job.status, IngestJob.SUCCEEDED)
+        self.assertEqual(Account.objects.count(), 40)
+        self.assertEqual(self.client.post(self.url + "complete/").data["job_id"],
+                         job.pk)
+
+
+@override_settings(ACCOUNT_COUNT_CAP=100)
+@mock.patch.object(ApproximateCountPagination, "page_size", 20)
+class ApproximateCountTests(TestCase):
+    def setUp(self):
+        caches[ACCOUNT_CACHE].clear()
+        agency = CollectionAgency.objects.create(name="Test Agency")
+        client = Client.objects.create(
+            reference_no="ffeb5d88-e5af-45f0-9637-16ea469c58c0", agency=agency)
+        consumer = Consumer.objects.create(
+            name="John Doe", address="123 Main St", ssn="123-45-6789")
+        Account.objects.bulk_create(
+            Account(balance=i, status="INACTIVE" if i < 50 else "IN_COLLECTION",
+                    consumer=consumer, client=client)
+            for i in range(250)
+        )
+
+    def get(self, query):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"{ACCOUNTS_URL}?count=approximate&{query}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        return data["count"], data["count_type"], len(queries)
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE webapp_accountsearch")
+
+    def test_small_results_are_counted_exactly(self):
+        self.assertEqual(self.get("status=inactive"), (50, "exact", 3))
+        self.assertEqual(self.get("max_balance=9"), (10, "exact", 1))
+
+    def test_large_results_are_capped(self):
+        self.assertEqual(self.get("status=in_collection"), (100, "capped", 3))
+        # A table that was never analyzed has no estimate.
+        with mock.patch.object(ApproximateCountPagination, "table_estimate",
+                               return_value=None):
+            self.assertEqual(self.get(""), (100, "capped", 2))
+
+    def test_broad_queries_are_estimated(self):
+        self.analyze()
+        count, count_type, queries = self.get("")
+        self.assertEqual((count, count_type, queries), (250, "estimated", 2))
+        count, count_type, queries = self.get("status=in_collection")
+        self.assertEqual((count_type, queries), ("estimated", 2))
+        self.assertAlmostEqual(count, 200, delta=20)
+
+    def test_last_page_is_exact_and_links_follow_the_rows(self):
+        self.analyze()
+        response = self.client.get(f"{ACCOUNTS_URL}?count=approximate&page=13")
+        self.assertEqual((response.data["count"], response.data["count_type"]),
+                         (250, "exact"))
+        self.assertEqual(len(response.data["results"]), 10)
+        self.assertIsNone(response.data["next"])
+        self.assertIn("page=12", response.data["previous"])
+        self.assertEqual(
+            self.client.get(f"{ACCOUNTS_URL}?count=approximate&page=14").status_code,
+            status.HTTP_404_NOT_FOUND)
+
+    def test_pages_are_ordered_by_id(self):
+        for query in ["", "count=approximate&"]:
+            with self.subTest(query=query), warnings.catch_warnings():
+                warnings.simplefilter("error", UnorderedObjectListWarning)
+                ids = [
+                    account["id"]
+                    for page in (1, 2)
+                    for account in self.client.get(
+                        f"{ACCOUNTS_URL}?{query}page={page}").json()["results"]
+                ]
+                self.assertEqual(ids, sorted(set(ids)))
+
+    def test_exact_count_is_the_default(self):
+        response = self.client.get(ACCOUNTS_URL)
+        self.assertEqual(response.data["count"], 250)
+        self.assertNotIn("count_type", response.data)
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        agency = CollectionAgency.objects.create(name="Test Agency")
+        client = Client.objects.create(
+            reference_no="ffeb5d88-e5af-45f0-9637-16ea469c58c0", agency=agency)
+        consumer = Consumer.objects.create(
+            name="John Doe", address="123 Main St", ssn="123-45-6789")
+        Account.objects.bulk_create(
+            Account(balance=(i % 7) * 100, status="IN_COLLECTION",
+                    consumer=consumer, client=client)
+            for i in range(250)
+        )
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", response.data)
+            ids.extend(account["id"] for account in response.data["results"])
+            url = response.data["next"]
+        return ids
+
+    def test_page_number_pagination_is_the_default(self):
+        response = self.client.get(ACCOUNTS_URL)
+        self.assertEqual(response.data["count"], 250)
+
+    def test_cursor_walk_by_id(self):
+        ids = self.walk(f"{ACCOUNTS_URL}?pagination=cursor")
+        self.assertEqual(
+            ids, list(Account.objects.order_by("id").values_list("id", flat=True)))
+
+    def test_cursor_walk_by_balance_breaks_ties_on_id(self):
+        ids = self.walk(f"{ACCOUNTS_URL}?pagination=cursor&ordering=-balance")
+        self.assertEqual(ids, list(
+            Account.objects.order_by("-balance", "-id").values_list("id", flat=True)))
+
+    def test_cursor_pages_do_not_count(self):
+        first = self.client.get(f"{ACCOUNTS_URL}?pagination=cursor&status=IN_COLLECTION")
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(first.data["next"])
+        self.assertFalse(any("COUNT(" in q["sql"] for q in queries.captured_queries))
+        self.assertNotIn("OFFSET", queries.captured_queries[0]["sql"])
+
+        previous = self.client.get(second.data["previous"])
+        self.assertEqual(previous.data["results"], first.data["results"])
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.client.get(f"{ACCOUNTS_URL}?cursor=garbage")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+class FilterIndexTests(TestCase):
+    """
+    Every supported filter must be answerable from an index.
+
+    Sequential scans are disabled so that the planner uses an index whenever
+    the predicate allows it; a filter that ends up without an ``Index Cond``
+    on its column (e.g. because of ``UPPER()``) fails.
+    """
+
+    COMBINATIONS = [
+        ({"min_balance": 900}, ["balance"]),
+        ({"max_balance": 5}, ["balance"]),
+        ({"min_balance": 100, "max_balance": 110}, ["balance"]),
+        ({"status": "paid_in_full"}, ["status"]),
+        ({"status": "PAID_IN_FULL", "min_balance": 900}, ["status"]),
+        ({"status": "INACTIVE", "max_balance": 5}, ["status"]),
+        ({"consumer_ssn": "000-00-0042"}, ["ssn"]),
+        ({"consumer_ssn": "000-00-0042", "status": "INACTIVE"}, ["ssn", "status"]),
+        ({"agency_name": "Agency 3", "status": "IN_COLLECTION"}, ["status"]),
+        ({"client_reference_no": "c81e728d-9d4c-2f63-6f06-7f89cc14862c"},
+         ["client_id"]),
+        # md5('421') starts with "e0c641195b".
+        ({"consumer_name": "E0C641195B"}, ["name"]),
+        ({"consumer_name": "e0c641195b", "status": "INACTIVE"}, ["name", "status"]),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO webapp_collectionagency (name)
+                SELECT 'Agency ' || i FROM generate_series(1, 20) i;
+            """)
+        for agency_id in CollectionAgency.objects.values_list("id", flat=True):
+            ensure_partition(agency_id)
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO webapp_client (reference_no, agency_id)
+                SELECT md5(i::text)::uuid, agency.id
+                FROM generate_series(1, 200) i
+                JOIN webapp_collectionagency agency
+                    ON agency.name = 'Agency ' || (i % 20 + 1);
+
+                INSERT INTO webapp_consumer (name, address, ssn)
+                SELECT 'Consumer ' || i || ' ' || md5(i::text), i || ' Main St',
+                    '000-00-' || lpad(i::text, 4, '0')
+                FROM generate_series(1, 5000) i;
+
+                INSERT INTO webapp_account
+                    (balance, status, consumer_id, client_id, agency_id)
+                SELECT (i % 10000) / 10.0,
+                    (ARRAY['INACTIVE', 'PAID_IN_FULL', 'IN_COLLECTION'])[i % 3 + 1],
+                    consumer.id, client.reference_no, client.agency_id
+                FROM generate_series(1, 30000) i
+                JOIN webapp_consumer consumer
+                    ON consumer.ssn = '000-00-' || lpad((i % 5000 + 1)::text, 4, '0')
+                JOIN webapp_client client
+                    ON client.reference_no = md5((i % 200 + 1)::text)::uuid;
+
+                ANALYZE webapp_collectionagency, webapp_client,
+                    webapp_consumer, webapp_account;
+
+                -- Autovacuum would move the new rows out of the GIN pending
+                -- list, which the planner otherwise costs as a full scan.
+                SELECT gin_clean_pending_list('consumer_name_trgm_idx');
+            """)
+            rebuild_read_model(cursor)
+            cursor.execute("""
+                ANALYZE webapp_accountsearch;
+                SELECT gin_clean_pending_list('search_consumer_name_trgm_idx');
+            """)
+
+    def explain(self, queryset):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        return json.loads(queryset.explain(format="json"))[0]["Plan"]
+
+    def index_conditions(self, plan):
+        self.assertNotIn(
+            "Seq Scan", [node["Node Type"] for node in plan_nodes(plan)])
+        return " ".join(node["Index Cond"] for node in plan_nodes(plan)
+                        if "Index Cond" in node)
+
+    def list_queryset(self, params):
+        view = AccountListView(request=Request(APIRequestFactory().get(ACCOUNTS_URL)))
+        return view.filterset_class(params, queryset=view.get_queryset()).qs
+
+    def test_filters_use_index_scans(self):
+        for params, columns in self.COMBINATIONS:
+            with self.subTest(params=params):
+                queryset = self.list_queryset(params)
+                self.assertTrue(queryset.exists())
+                plan = self.explain(queryset)
+                conditions = self.index_conditions(plan)
+                self.assertTrue(
+                    any(column in conditions for column in columns), conditions)
+                self.assertEqual(
+                    {node["Relation Name"] for node in plan_nodes(plan)
+                     if "Relation Name" in node},
+                    {"webapp_accountsearch"})
+
+    def test_counts_are_index_only(self):
+        for params in ({"status": "INACTIVE"}, {"agency_name": "Agency 3"},
+                       {"min_balance": 900}):
+            with self.subTest(params=params):
+                with CaptureQueriesContext(connection) as queries:
+                    self.list_queryset(params).count()
+                with connection.cursor() as cursor:
+                    # Rows written in the test transaction are not all-visible
+                    # until vacuumed, so bitmap scans would be cheaper here.
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+                    cursor.execute("SET LOCAL enable_bitmapscan = off")
+                    cursor.execute(
+                        f"EXPLAIN (FORMAT JSON) {queries.captured_queries[0]['sql']}")
+                    plan = cursor.fetchone()[0][0]["Plan"]
+                self.assertIn("Index Only Scan",
+                              [node["Node Type"] for node in plan_nodes(plan)])
+
+    def test_agency_filter_prunes_other_partitions(self):
+        agencies = dict(CollectionAgency.objects.values_list("name", "id"))
+        for names in (["Agency 3"], ["Agency 3", "Agency 4"]):
+            with self.subTest(names=names):
+                queryset = AccountFilter(
+                    {"agency_name": ",".join(names)},
+                    queryset=Account.objects.all()).qs
+                self.assertTrue(queryset.exists())
+                plan = self.explain(queryset)
+                scanned = {node["Relation Name"] for node in plan_nodes(plan)
+                           if node.get("Relation Name", "").startswith("webapp_account")}
+                self.assertEqual(
+                    scanned, {partition_name(agencies[name]) for name in names})
+
+    def test_consumer_search_uses_trigram_index(self):
+        for fuzzy in ("false", "true"):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(
+                    f"/api/v1/consumers/search/?q=consumer 4210 ef35613fc5fa&fuzzy={fuzzy}")
+            self.assertTrue(
+                response.data["results"][0]["name"].startswith("Consumer 4210 "))
+            sql = queries.captured_queries[0]["sql"]
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+                plan = cursor.fetchone()[0][0]["Plan"]
+            self.assertIn("consumer_name_trgm_idx", [
+                node.get("Index Name") for node in plan_nodes(plan)])
+
+    def test_case_insensitive_lookup_cannot_use_index(self):
+        plan = self.explain(Account.objects.filter(status__iexact="inactive"))
+        self.assertNotIn("status", " ".join(
+            node.get("Index Cond", "") for node in plan_nodes(plan)))
+
+    def test_status_filter_is_case_insensitive(self):
+        self.assertEqual(
+            AccountFilter({"status": " paid_in_full"},
+                          queryset=Account.objects.all()).qs.count(), 10000)
+
+
+class AccountLookupTests(TestCase):
+    URL = "/api/v1/accounts/lookup/"
+
+    def setUp(self):
+        caches[ACCOUNT_CACHE].clear()
+        self.agency = CollectionAgency.objects.create(name="Test Agency")
+        ingest(synthetic_csv_chunks(300), self.agency, engine="copy")
+
+    def post(self, payload):
+        return self.client.post(self.URL, payload, content_type="application/json")
+
+    def test_accounts_are_grouped_by_key(self):
+        reference_no = "ffeb5d88-e5af-45f0-9637-000000000003"
+        response = self.post({
+            "consumer_ssns": ["007-45-6789", "999-99-9999"],
+            "client_reference_nos": [reference_no],
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+
+        self.assertEqual(
+            sorted(account["id"] for account in data["consumer_ssn"]["007-45-6789"]),
+            sorted(Account.objects.filter(consumer__ssn="007-45-6789")
+                   .values_list("id", flat=True)))
+        self.assertEqual(data["consumer_ssn"]["999-99-9999"], [])
+        self.assertEqual(len(data["client_reference_no"][reference_no]), 30)
+        self.assertEqual(
+            data["consumer_ssn"]["007-45-6789"][0],
+            self.client.get(ACCOUNTS_URL, {"consumer_ssn": "007-45-6789",
+                                           "pagination": "cursor"}).json()["results"][0])
+        self.assertEqual(data["truncated"], [])
+
+    def test_limit_per_key(self):
+        reference_no = "ffeb5d88-e5af-45f0-9637-000000000001"
+        data = self.post({"client_reference_nos": [reference_no], "limit": 10}).json()
+        accounts = data["client_reference_no"][reference_no]
+        self.assertEqual(len(accounts), 10)
+        self.assertEqual([account["id"] for account in accounts],
+                         sorted(account["id"] for account in accounts))
+        self.assertEqual(data["truncated"], [reference_no])
+
+    def test_query_count_does_not_depend_on_the_number_of_keys(self):
+        for ssns in (["000-45-6789"], [f"{n:03d}-45-6789" for n in range(1000)]):
+            with self.subTest(keys=len(ssns)):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.post({
+                        "consumer_ssns": ssns,
+                        "client_reference_nos": [str(uuid.uuid4())],
+                    })
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(len(queries), 2)
+
+    def test_invalid_requests(self):
+        for payload in [
+            {}, [], {"consumer_ssns": "000-45-6789"}, {"consumer_ssns": [1]},
+            {"client_reference_nos": ["nope"]}, {"client_reference_nos": [5]},
+            {"consumer_ssns": ["000-45-6789"], "limit": 0},
+            {"consumer_ssns": ["000-45-6789"] * 50_001},
+        ]:
+            with self.subTest(payload=str(payload)[:60]):
+                self.assertEqual(self.post(payload).status_code,
+                                 status.HTTP_400_BAD_REQUEST)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command("benchmark_lookup", keys=20, stdout=out)
+        self.assertIn("GET per key: 20 requests", out.getvalue())
+        self.assertIn("POST lookup: 1 request in", out.getvalue())
+
+
+class ConsumerSearchTests(TestCase):
+    URL = "/api/v1/consumers/search/"
+
+    def setUp(self):
+        self.client = APIClient()
+        agency = CollectionAgency.objects.create(name="Test Agency")
+        client = Client.objects.create(
+            reference_no="ffeb5d88-e5af-45f0-9637-16ea469c58c0", agency=agency)
+        self.john = Consumer.objects.create(
+            name="John Doe", address="123 Main St", ssn="123-45-6789")
+        self.johnny = Consumer.objects.create(
+            name="Johnny Doeson", address="456 Elm St", ssn="987-65-4321")
+        Consumer.objects.create(
+            name="Alice Smith", address="789 Pine St", ssn="555-55-5555")
+        for balance in (100, 200):
+            Account.objects.create(balance=balance, status="IN_COLLECTION",
+                                   consumer=self.john, client=client)
+
+    def test_substring_search_ranks_closest_match_first(self):
+        response = self.client.get(f"{self.URL}?q=john")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"]
+        self.assertEqual([r["id"] for r in results],
+                         [self.john.pk, self.johnny.pk])
+        self.assertEqual(results[0]["account_count"], 2)
+        self.assertEqual(results[1]["account_count"], 0)
+        self.assertGreater(results[0]["score"], results[1]["score"])
+        self.assertNotIn("accounts", results[0])
+
+    def test_fuzzy_search_tolerates_typos(self):
+        self.assertEqual(
+            self.client.get(f"{self.URL}?q=jhon doe").data["results"], [])
+        results = self.client.get(
+            f"{self.URL}?q=jhon doe&fuzzy=true").data["results"]
+        self.assertEqual(results[0]["id"], self.john.pk)
+
+    def test_limit(self):
+        results = self.client.get(f"{self.URL}?q=doe&limit=1").data["results"]
+        self.assertEqual(len(results), 1)
+
+    def test_short_query_is_rejected(self):
+        response = self.client.get(f"{self.URL}?q=jo")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AccountExportTests(TestCase):
+    URL = "/api/v1/accounts/export/"
+
+    def setUp(self):
+        self.client = APIClient()
+        agency = CollectionAgency.objects.create(name="Test Agency")
+        client = Client.objects.create(
+            reference_no="ffeb5d88-e5af-45f0-9637-16ea469c58c0", agency=agency)
+        consumer = Consumer.objects.create(
+            name="Doe, John", address="123 Main St", ssn="123-45-6789")
+        self.accounts = [
+            Account.objects.create(balance=balance, status=account_status,
+                                   consumer=consumer, client=client)
+            for balance, account_status in [
+                (100, "IN_COLLECTION"), (200, "PAID_IN_FULL"), (300, "INACTIVE")]
+        ]
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_export(self):
+        response = self.client.get(f"{self.URL}?min_balance=150")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.reader(StringIO(self.content(response))))
+        self.assertEqual(rows[0], [
+            "id", "balance", "status", "consumer_name", "consumer_address",
+            "consumer_ssn", "client_reference_no", "agency_name",
+        ])
+        self.assertEqual(rows[1], [
+            str(self.accounts[1].pk), "200.00", "PAID_IN_FULL", "Doe, John",
+            "123 Main St", "123-45-6789",
+            "ffeb5d88-e5af-45f0-9637-16ea469c58c0", "Test Agency",
+        ])
+        self.assertEqual(len(rows), 3)
+
+    def test_ndjson_export(self):
+        response = self.client.get(f"{self.URL}?output=ndjson&status=inactive")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = self.content(response).splitlines()
+        self.assertEqual(len(lines), 1)
+        row = json.loads(lines[0])
+        self.assertEqual(row["id"], self.accounts[2].pk)
+        self.assertEqual(row["balance"], "300.00")
+        self.assertEqual(row["agency_name"], "Test Agency")
+
+    def test_header_is_sent_before_the_query_runs(self):
+        response = self.client.get(self.URL)
+        content = iter(response.streaming_content)
+        with self.assertNumQueries(0):
+            self.assertTrue(next(content).startswith(b"id,balance,"))
+        self.assertEqual(len(b"".join(content).splitlines()), 3)
+
+    def test_invalid_parameters_are_rejected(self):
+        response = self.client.get(f"{self.URL}?output=xml")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{self.URL}?min_balance=lots")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("min_balance", response.data)
+
+
+class AccountRowSerializerTests(TestCase):
+    def setUp(self):
+        agency = CollectionAgency.objects.create(name="Agence Süd")
+        client = Client.objects.create(
+            reference_no="ffeb5d88-e5af-45f0-9637-16ea469c58c0", agency=agency)
+        consumer = Consumer.objects.create(
+            name="Zoë \"Z\" O'Brien\u2028", address="1 Rue\nBis", ssn="123-45-6789")
+        for balance in ("0.10", "99999999.99", "12"):
+            Account.objects.create(balance=balance, status="IN_COLLECTION",
+                                   consumer=consumer, client=client)
+
+    def test_output_is_identical_to_nested_serializer(self):
+        self.assertEqual(nested_page(10), flat_page(10))
+        self.assertIn(b"\\u2028", flat_page(10))
+
+    def test_account_list_is_served_in_one_query(self):
+        with self.assertNumQueries(2):
+            response = APIClient().get(ACCOUNTS_URL)
+        self.assertEqual(response.content, JSONRenderer().render({
+            "count": 3, "next": None, "previous": None,
+            "results": json.loads(nested_page(10)),
+        }))
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command("benchmark_serializers", rows=10, repeat=1, stdout=out)
+        self.assertIn("3 rows, identical output", out.getvalue())
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        caches[ACCOUNT_CACHE].clear()
+        agency = CollectionAgency.objects.create(name="Test Agency")
+        self.client_ref = "ffeb5d88-e5af-45f0-9637-16ea469c58c0"
+        client = Client.objects.create(reference_no=self.client_ref, agency=agency)
+        self.consumer = Consumer.objects.create(
+            name="John Doe", address="123 Main St", ssn="123-45-6789")
+        self.accounts = [
+            Account.objects.create(balance=balance, status="IN_COLLECTION",
+                                   consumer=self.consumer, client=client)
+            for balance in (30, 10, 20)
+        ]
+
+    def get(self, url=ACCOUNTS_URL, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        return response, " ".join(query["sql"] for query in queries)
+
+    def test_fields_narrow_the_rows_and_the_query(self):
+        for url in (ACCOUNTS_URL, "/api/v1/accounts/async/"):
+            with self.subTest(url=url):
+                response, sql = self.get(url, fields="id,status,balance")
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.json()["results"][0], {
+                    "id": self.accounts[0].pk, "balance": "30.00",
+                    "status": "IN_COLLECTION"})
+                self.assertNotIn("consumer_name", sql)
+                self.assertNotIn("agency", sql)
+
+    def test_relations_are_keys_unless_expanded(self):
+        response, sql = self.get(fields="id,consumer,client")
+        self.assertEqual(response.json()["results"][0], {
+            "id": self.accounts[0].pk, "consumer": self.consumer.pk,
+            "client": self.client_ref})
+        self.assertNotIn("consumer_address", sql)
+
+        response, sql = self.get(fields="consumer", expand="consumer")
+        self.assertEqual(response.json()["results"][0], {"consumer": {
+            "id": self.consumer.pk, "name": "John Doe", "address": "123 Main St",
+            "ssn": "123-45-6789"}})
+        self.assertNotIn("agency_name", sql)
+
+        response, _ = self.get(expand="client")
+        row = response.json()["results"][0]
+        self.assertEqual(list(row), ["id", "balance", "status", "consumer", "client"])
+        self.assertEqual((row["consumer"], row["client"]["agency"]["name"]),
+                         (self.consumer.pk, "Test Agency"))
+
+    def test_default_is_the_full_representation(self):
+        self.assertEqual(
+            self.get()[0].json(),
+            self.get(fields="id,balance,status,consumer,client",
+                     expand="consumer,client")[0].json())
+
+    @mock.patch.object(KeysetPagination, "page_size", 2)
+    def test_cursor_pages_keep_their_ordering_columns(self):
+        response, _ = self.get(fields="id", pagination="cursor", ordering="balance")
+        self.assertEqual(response.json()["results"],
+                         [{"id": self.accounts[1].pk}, {"id": self.accounts[2].pk}])
+        self.assertEqual(self.client.get(response.json()["next"]).json()["results"],
+                         [{"id": self.accounts[0].pk}])
+
+    def test_unknown_names_are_rejected(self):
+        for url in (ACCOUNTS_URL, "/api/v1/accounts/async/"):
+            response, _ = self.get(url, fields="id,ssn", expand="agency")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(set(response.json()), {"fields", "expand"})
+
+    def test_empty_fields_are_rejected(self):
+        for url in (ACCOUNTS_URL, "/api/v1/accounts/async/"):
+            for fields in ("", " , "):
+                with self.subTest(url=url, fields=fields):
+                    response, _ = self.get(url, fields=fields)
+                    self.assertEqual(response.status_code,
+                                     status.HTTP_400_BAD_REQUEST)
+                    self.assertIn("No field named", response.json()["fields"][0])
+
+
+class AccountCacheTests(TestCase):
+    def setUp(self):
+        caches[ACCOUNT_CACHE].clear()
+        self.client = APIClient()
+        self.agency = CollectionAgency.objects.create(name="Test Agency")
+        client = Client.objects.create(
+            reference_no="ffeb5d88-e5af-45f0-9637-16ea469c58c0", agency=self.agency)
+        consumer = Consumer.objects.create(
+            name="John Doe", address="123 Main St", ssn="123-45-6789")
+        Account.objects.create(balance=500, status="IN_COLLECTION",
+                               consumer=consumer, client=client)
+
+    def upload(self, rows):
+        csv_content = CSV_HEADER + "".join(
+            f"ffeb5d88-e5af-45f0-9637-16ea469c58c0,{balance},IN_COLLECTION,"
+            f"Anna Smith,1 Oak St,123-45-678{n}\n"
+            for n, balance in enumerate(rows)
+        )
+        response = self.client.post("/api/v1/upload/", {
+            "file": SimpleUploadedFile("accounts.csv", csv_content.encode()),
+            "agency_name": self.agency.name,
+        }, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_repeated_request_is_served_from_cache(self):
+        first = self.client.get(f"{ACCOUNTS_URL}?status=in_collection&min_balance=100")
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            second = self.client.get(
+                f"{ACCOUNTS_URL}?min_balance=100&status=in_collection&utm=1")
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second["ETag"], first["ETag"])
+
+    def test_unchanged_data_is_not_modified(self):
+        etag = self.client.get(ACCOUNTS_URL)["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(ACCOUNTS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+        self.assertNotEqual(
+            self.client.get(f"{ACCOUNTS_URL}?page=2", HTTP_IF_NONE_MATCH=etag)
+            .status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_upload_invalidates_cached_responses(self):
+        before = self.client.get(ACCOUNTS_URL)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload([700])
+        response = self.client.get(ACCOUNTS_URL, HTTP_IF_NONE_MATCH=before["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], before["ETag"])
+        self.assertEqual(response.data["count"], 2)
+
+    def test_direct_writes_invalidate_cached_responses(self):
+        self.assertEqual(self.client.get(ACCOUNTS_URL).data["count"], 1)
+        Account.objects.update(status="PAID_IN_FULL")
+        Account.objects.get().save()
+        response = self.client.get(ACCOUNTS_URL)
+        self.assertEqual(response.data["results"][0]["status"], "PAID_IN_FULL")
+
+    def test_errors_are_not_cached(self):
+        self.client.get(f"{ACCOUNTS_URL}?page=9")
+        response = self.client.get(f"{ACCOUNTS_URL}?page=9")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn("ETag", response)
+
+
+class AccountSummaryTests(TestCase):
+    URL = "/api/v1/summary/"
+
+    def setUp(self):
+        self.client = APIClient()
+        self.agency = CollectionAgency.objects.create(name="Test Agency")
+        self.other_agency = CollectionAgency.objects.create(name="Other Agency")
+
+    def ingest_file(self, content, agency, engine):
+        response = self.client.post("/api/v1/upload/", {
+            "file": SimpleUploadedFile("accounts.csv", content.encode()),
+            "agency_name": agency.name, "engine": engine,
+        }, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def differences(self):
+        with connection.cursor() as cursor:
+            return summary_differences(cursor)
+
+    def test_both_engines_keep_the_summary_up_to_date(self):
+        for engine, rows in [("orm", 250), ("copy", 120)]:
+            with self.subTest(engine=engine):
+                content = b"".join(synthetic_csv_chunks(rows)).decode()
+                self.ingest_file(content, self.agency, engine)
+                self.assertEqual(self.differences(), 0)
+                self.ingest_file(
+                    CSV_HEADER
+                    + "11111111-1111-1111-1111-111111111111,10.25,paid_in_full,"
+                    f"Jane Roe,1 Elm St,{len(engine):03d}-00-0000\n",
+                    self.other_agency, engine)
+                self.assertEqual(self.differences(), 0)
+        self.assertEqual(AccountSummary.objects.count(), 11)
+
+    def test_summary_endpoint(self):
+        self.ingest_file(b"".join(synthetic_csv_chunks(20)).decode(),
+                         self.agency, "orm")
+        self.ingest_file(
+            CSV_HEADER
+            + "11111111-1111-1111-1111-111111111111,10.25,PAID_IN_FULL,"
+            "Jane Roe,1 Elm St,000-00-0000\n"
+            + "11111111-1111-1111-1111-111111111111,1.00,IN_COLLECTION,"
+            "Jane Roe,1 Elm St,000-00-0000\n",
+            self.other_agency, "copy")
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.URL)
+        self.assertEqual(response.data["results"], [
+            {"agency": "Other Agency", "account_count": 2, "total_balance": "11.25"},
+            {"agency": "Test Agency", "account_count": 20, "total_balance": "200.00"},
+        ])
+
+        response = self.client.get(
+            f"{self.URL}?group_by=client,status&agency_name=Other Agency")
+        self.assertEqual(response.data["results"], [
+            {"client_reference_no": uuid.UUID("11111111-1111-1111-1111-111111111111"),
+             "status": status_name, "account_count": 1, "total_balance": balance}
+            for status_name, balance in [("IN_COLLECTION", "1.00"),
+                                         ("PAID_IN_FULL", "10.25")]
+        ])
+
+        response = self.client.get(f"{self.URL}?group_by=balance")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rebuild_summary_command(self):
+        self.ingest_file(b"".join(synthetic_csv_chunks(30)).decode(),
+                         self.agency, "orm")
+        Account.objects.filter(balance__lt=5).delete()
+        with self.assertRaisesMessage(CommandError, "summary groups differ"):
+            call_command("rebuild_summary", check=True, stdout=StringIO())
+
+        out = StringIO()
+        call_command("rebuild_summary", stdout=out)
+        self.assertIn("5 groups were out of date", out.getvalue())
+        self.assertEqual(self.differences(), 0)
+        call_command("rebuild_summary", check=True, stdout=out)
+        self.assertIn("Summary is up to date", out.getvalue())
+
+
+def snapshot_csv(accounts):
+    """A snapshot upload of ``{account reference no: (balance, status)}``."""
+    lines = ["client reference no,account reference no,balance,status,"
+             "consumer name,consumer address,ssn\n"]
+    for external_id, (balance, status) in accounts.items():
+        n = int(external_id.split("-")[1])
+        lines.append(
+            f"ffeb5d88-e5af-45f0-9637-{n % 5:012d},{external_id},{balance},{status},"
+            f"Consumer {n},{n} Main St,{n:03d}-45-6789\n")
+    return [line.encode() for line in lines]
+
+
+class SnapshotIngestTests(TestCase):
+    def setUp(self):
+        self.agency = CollectionAgency.objects.create(name="Test Agency")
+        self.accounts = {f"A-{n}": ("100.00", "IN_COLLECTION") for n in range(50)}
+
+    def snapshot(self, accounts, **options):
+        return ingest(snapshot_csv(accounts), self.agency, engine="snapshot",
+                      **options)
+
+    def assert_consistent(self):
+        with connection.cursor() as cursor:
+            self.assertEqual(summary_differences(cursor), 0)
+            self.assertEqual(read_model_differences(cursor), 0)
+
+    def row_versions(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT external_id, xmin::text FROM webapp_account ORDER BY 1")
+            return dict(cursor.fetchall())
+
+    def test_only_new_and_changed_accounts_are_written(self):
+        stats = self.snapshot(self.accounts)
+        self.assertEqual((stats["rows"], stats["inserted"], stats["updated"]),
+                         (50, 50, 0))
+        before = self.row_versions()
+
+        self.accounts["A-3"] = ("100.00", "PAID_IN_FULL")
+        self.accounts["A-4"] = ("12.50", "IN_COLLECTION")
+        self.accounts["A-50"] = ("7.00", "IN_COLLECTION")
+        stats = self.snapshot(self.accounts)
+
+        self.assertEqual(
+            [stats[name] for name in ("rows", "inserted", "updated", "unchanged",
+                                      "inactivated")],
+            [51, 1, 2, 48, 0])
+        self.assertEqual(Account.objects.count(), 51)
+        self.assertEqual(
+            Account.objects.get(external_id="A-3").status, "PAID_IN_FULL")
+        after = self.row_versions()
+        self.assertEqual(
+            sorted(key for key in after if after[key] != before.get(key)),
+            ["A-3", "A-4", "A-50"])
+        self.assert_consistent()
+
+    def test_missing_accounts_can_be_marked_inactive(self):
+        self.snapshot(self.accounts)
+        del self.accounts["A-7"]
+        self.assertEqual(self.snapshot(self.accounts)["inactivated"], 0)
+        self.assertEqual(
+            Account.objects.get(external_id="A-7").status, "IN_COLLECTION")
+
+        stats = self.snapshot(self.accounts, mark_missing=True)
+
+        self.assertEqual((stats["inactivated"], stats["unchanged"]), (1, 49))
+        self.assertEqual(Account.objects.get(external_id="A-7").status, "INACTIVE")
+        self.assertEqual(self.snapshot(self.accounts, mark_missing=True)["inactivated"], 0)
+        self.assert_consistent()
+
+    def test_snapshots_need_account_reference_nos(self):
+        with self.assertRaisesMessage(IngestError, "account reference no"):
+            ingest(synthetic_csv_chunks(5), self.agency, engine="snapshot")
+        with self.assertRaisesMessage(IngestError, "account reference no"):
+            ingest([b"client reference no,account reference no,balance,status,"
+                    b"consumer name,consumer address,ssn\n",
+                    b"ffeb5d88-e5af-45f0-9637-000000000001,,1.00,INACTIVE,"
+                    b"Consumer 1,1 Main St,001-45-6789\n"],
+                   self.agency, engine="snapshot")
+        with self.assertRaises(IngestError):
+            ingest(synthetic_csv_chunks(5), self.agency, engine="copy",
+                   mark_missing=True)
+
+    def test_plain_engines_reject_taken_reference_nos(self):
+        self.snapshot(self.accounts)
+        repeated = b"".join(snapshot_csv({"B-1": ("1.00", "INACTIVE")}))
+        repeated += repeated.split(b"\n", 1)[1]
+        for engine in ("orm", "copy"):
+            for content in (b"".join(snapshot_csv(self.accounts)), repeated):
+                with self.subTest(engine=engine, repeated=content == repeated):
+                    response = self.client.post("/api/v1/upload/", {
+                        "file": SimpleUploadedFile("accounts.csv", content),
+                        "agency_name": self.agency.name, "engine": engine,
+                    })
+                    self.assertEqual(response.status_code,
+                                     status.HTTP_400_BAD_REQUEST)
+                    self.assertIn("same client, consumer and account reference no",
+                                  response.data["error"])
+        self.assertEqual(Account.objects.count(), 50)
+        self.assertFalse(Upload.objects.exists())
+        self.assert_consistent()
+
+    def test_upload_and_job_report_the_counts(self):
+        self.snapshot(self.accounts)
+        self.accounts["A-1"] = ("0.00", "PAID_IN_FULL")
+        del self.accounts["A-2"]
+        payload = {
+            "file": SimpleUploadedFile("snapshot.csv", b"".join(snapshot_csv(self.accounts))),
+            "agency_name": self.agency.name, "engine": "snapshot",
+            "mark_missing": "true",
+        }
+        response = self.client.post("/api/v1/upload/", payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [response.data[name] for name in ("inserted", "updated", "unchanged",
+                                              "inactivated")],
+            [0, 1, 48, 1])
+
+        payload["file"].seek(0)
+        payload.update(engine="copy")
+        self.assertEqual(self.client.post("/api/v1/upload/", payload).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+        self.accounts["A-1"] = ("5.00", "PAID_IN_FULL")
+        payload.update(
+            file=SimpleUploadedFile("snapshot.csv", b"".join(snapshot_csv(self.accounts))),
+            engine="snapshot", async_="true")
+        payload["async"] = payload.pop("async_")
+        self.client.post("/api/v1/upload/", payload)
+        job = run_next_job()
+        self.assertEqual(job.status, IngestJob.SUCCEEDED)
+        data = self.client.get(f"/api/v1/upload/{job.pk}/").data
+        self.assertEqual(
+            [data[f"rows_{name}"] for name in ("inserted", "updated", "unchanged",
+                                               "inactivated")],
+            [0, 1, 48, 0])
+        self.assert_consistent()
+
+
+class AccountPartitionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.agency = CollectionAgency.objects.create(name="Test Agency")
+        self.other_agency = CollectionAgency.objects.create(name="Other Agency")
+
+    def upload(self, agency_name, rows, engine="copy"):
+        response = self.client.post("/api/v1/upload/", {
+            "file": SimpleUploadedFile("accounts.csv", b"".join(
+                SyntheticDataset(accounts=rows, agencies=1, clients=5,
+                                 seed=agency_name).csv_chunks(0))),
+            "agency_name": agency_name, "engine": engine,
+        }, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def partition_rows(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {table}")
+            return cursor.fetchone()[0]
+
+    def test_upload_for_a_new_agency_creates_its_partition(self):
+        for engine, rows in [("orm", 30), ("copy", 20)]:
+            with self.subTest(engine=engine):
+                name = f"New Agency {engine}"
+                self.upload(name, rows, engine)
+                agency = CollectionAgency.objects.get(name=name)
+                self.assertEqual(self.partition_rows(partition_name(agency.pk)), rows)
+                self.assertEqual(self.partition_rows("webapp_account_default"), 0)
+        self.assertFalse(ensure_partition(agency.pk))
+
+    def test_accounts_created_with_a_client_get_its_agency(self):
+        client = Client.objects.create(
+            reference_no="ffeb5d88-e5af-45f0-9637-16ea469c58c0", agency=self.agency)
+        consumer = Consumer.objects.create(
+            name="John Doe", address="123 Main St", ssn="123-45-6789")
+        Account.objects.create(balance=1, status="INACTIVE",
+                               consumer=consumer, client=client)
+        Account.objects.bulk_create([
+            Account(balance=2, status="INACTIVE", consumer=consumer,
+                    client_id="ffeb5d88-e5af-45f0-9637-16ea469c58c0"),
+        ])
+        self.assertEqual(
+            list(Account.objects.values_list("agency_id", flat=True)),
+            [self.agency.pk] * 2)
+        self.assertEqual(self.partition_rows(partition_name(self.agency.pk)), 2)
+
+    def test_read_model_upsert_reads_only_the_partition_written(self):
+        client = Client.objects.create(
+            reference_no="ffeb5d88-e5af-45f0-9637-16ea469c58c0", agency=self.agency)
+        consumer = Consumer.objects.create(
+            name="John Doe", address="123 Main St", ssn="123-45-6789")
+        account = Account.objects.create(balance=1, status="INACTIVE",
+                                         consumer=consumer, client=client)
+        with CaptureQueriesContext(connection) as queries:
+            account.save()
+        upsert = next(query["sql"] for query in queries
+                      if "INSERT INTO webapp_accountsearch" in query["sql"])
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN {upsert}")
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+
+        self.assertIn(partition_name(self.agency.pk), plan)
+        self.assertNotIn(partition_name(self.other_agency.pk), plan)
+        self.assertNotIn("webapp_account_default", plan)
+
+    def test_archive_detaches_the_agency_partition(self):
+        self.upload(self.agency.name, 40)
+        self.upload(self.other_agency.name, 10)
+        out = StringIO()
+
+        call_command("archive_agency", self.agency.name, stdout=out)
+
+        self.assertIn("Archived 40 accounts", out.getvalue())
+        self.assertEqual(Account.objects.count(), 10)
+        self.assertFalse(AccountSummary.objects.filter(agency=self.agency).exists())
+        self.assertEqual(AccountSearch.objects.count(), 10)
+        self.assertEqual(
+            self.partition_rows(f"webapp_account_archive_p{self.agency.pk}_1"), 40)
+        with connection.cursor() as cursor:
+            self.assertEqual(summary_differences(cursor), 0)
+
+    def test_archived_agency_can_upload_and_archive_again(self):
+        self.upload(self.agency.name, 40)
+        call_command("archive_agency", self.agency.name, stdout=StringIO())
+
+        self.upload(self.agency.name, 30, engine="orm")
+
+        self.assertEqual(self.partition_rows(partition_name(self.agency.pk)), 30)
+        self.assertEqual(self.partition_rows("webapp_account_default"), 0)
+        out = StringIO()
+        call_command("archive_agency", self.agency.name, stdout=out)
+        self.assertIn(f"Archived 30 accounts of Test Agency in "
+                      f"webapp_account_archive_p{self.agency.pk}_2", out.getvalue())
+        self.assertEqual(
+            self.partition_rows(f"webapp_account_archive_p{self.agency.pk}_1"), 40)
+        self.assertFalse(Account.objects.exists())
+        with connection.cursor() as cursor:
+            self.assertEqual(summary_differences(cursor), 0)
+
+    def test_archive_with_drop_deletes_the_agency(self):
+        self.upload(self.agency.name, 40)
+        call_command("archive_agency", self.agency.name, drop=True, stdout=StringIO())
+
+        self.assertFalse(CollectionAgency.objects.filter(pk=self.agency.pk).exists())
+        self.assertEqual(Account.objects.count(), 0)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)", [partition_name(self.agency.pk)])
+            self.assertIsNone(cursor.fetchone()[0])
+
+
+class PartitionMigrationTests(TransactionTestCase):
+    def relkind(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT relkind FROM pg_class WHERE relname = 'webapp_account'")
+            return cursor.fetchone()[0]
+
+    def test_partitioning_can_be_rolled_back(self):
+        agency = CollectionAgency.objects.create(name="Test Agency")
+        ingest(synthetic_csv_chunks(30), agency)
+        accounts = list(Account.objects.order_by("id").values_list("id", "balance"))
+
+        try:
+            call_command("migrate", "webapp", "0008", verbosity=0)
+            self.assertEqual(self.relkind(), "r")
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT id, balance FROM webapp_account ORDER BY id")
+                self.assertEqual(cursor.fetchall(), accounts)
+        finally:
+            call_command("migrate", "webapp", verbosity=0)
+
+        self.assertEqual(self.relkind(), "p")
+        self.assertEqual(
+            list(Account.objects.filter(agency=agency).order_by("id")
+                 .values_list("id", "balance")),
+            accounts)
+
+
+class AccountReadModelTests(TestCase):
+    def setUp(self):
+        self.agency = CollectionAgency.objects.create(name="Test Agency")
+
+    def differences(self):
+        with connection.cursor() as cursor:
+            return read_model_differences(cursor)
+
+    def test_both_engines_keep_the_read_model_up_to_date(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                ingest(synthetic_csv_chunks(120, references=engine), self.agency,
+                       engine=engine)
+                self.assertEqual(self.differences(), 0)
+        self.assertEqual(AccountSearch.objects.count(), 360)
+
+    def test_direct_writes_update_the_read_model(self):
+        client = Client.objects.create(
+            reference_no="ffeb5d88-e5af-45f0-9637-16ea469c58c0", agency=self.agency)
+        consumer = Consumer.objects.create(
+            name="John Doe", address="123 Main St", ssn="123-45-6789")
+        account = Account.objects.create(balance=10, status="INACTIVE",
+                                         consumer=consumer, client=client)
+        account.status = "PAID_IN_FULL"
+        account.save()
+        consumer.name = "John Q. Doe"
+        consumer.save()
+        self.agency.name = "Renamed Agency"
+        self.agency.save()
+
+        row = AccountSearch.objects.get(pk=account.pk)
+        self.assertEqual(
+            (row.status, row.consumer_name, row.agency_name),
+            ("PAID_IN_FULL", "John Q. Doe", "Renamed Agency"))
+        self.assertEqual(self.differences(), 0)
+        account.delete()
+        self.assertFalse(AccountSearch.objects.exists())
+
+    def test_rebuild_command(self):
+        ingest(synthetic_csv_chunks(50), self.agency)
+        Account.objects.filter(balance__lt=10).update(status="INACTIVE")
+        out = StringIO()
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_read_model", check=True, stdout=out)
+        call_command("rebuild_read_model", stdout=out)
+
+        self.assertIn("10 accounts were out of date", out.getvalue())
+        self.assertEqual(self.differences(), 0)
+
+
+class AsyncAccountListTests(TestCase):
+    URL = "/api/v1/accounts/async/"
+
+    def setUp(self):
+        caches[ACCOUNT_CACHE].clear()
+        agency = CollectionAgency.objects.create(name="Test Agency")
+        client = Client.objects.create(
+            reference_no="ffeb5d88-e5af-45f0-9637-16ea469c58c0", agency=agency)
+        consumer = Consumer.objects.create(
+            name="John Doe", address="123 Main St", ssn="123-45-6789")
+        Account.objects.bulk_create([
+            Account(balance=n, status=("INACTIVE", "IN_COLLECTION")[n % 2],
+                    consumer=consumer, client=client)
+            for n in range(250)
+        ])
+
+    async def test_results_match_the_sync_view(self):
+        for query in ["?status=inactive&max_balance=150",
+                      "?min_balance=10&max_balance=20", "?consumer_name=nobody"]:
+            with self.subTest(query=query):
+                response = await self.async_client.get(self.URL + query)
+                expected = await self.async_client.get(ACCOUNTS_URL + query)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(json.loads(response.content), expected.json())
+
+    async def test_pages(self):
+        ids = []
+        url = self.URL
+        while url:
+            data = json.loads((await self.async_client.get(url)).content)
+            self.assertEqual(data["count"], 250)
+            ids += [account["id"] for account in data["results"]]
+            url = data["next"]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), 250)
+        self.assertEqual(data["previous"], f"http://testserver{self.URL}?page=2")
+
+    async def test_invalid_requests(self):
+        for query in ["?page=4", "?page=0", "?page=last"]:
+            with self.subTest(query=query):
+                response = await self.async_client.get(self.URL + query)
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = await self.async_client.get(f"{self.URL}?min_balance=lots")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("min_balance", json.loads(response.content))
+
+
+# The live server's static files handler needs a STATIC_URL.
+@override_settings(STATIC_URL="/static/")
+class LoadTestCommandTests(LiveServerTestCase):
+    def test_reports_throughput_and_latency(self):
+        out = StringIO()
+        call_command("loadtest", f"{self.live_server_url}{ACCOUNTS_URL}",
+                     f"{self.live_server_url}/api/v1/accounts/async/",
+                     concurrency=2, requests=10, stdout=out)
+        self.assertIn("10 responses", out.getvalue())
+        self.assertIn("0 failures", out.getvalue())
+        self.assertIn("requests/s", out.getvalue())
+
+
+class HealthCheckTests(TestCase):
+    def test_liveness_does_not_touch_the_database(self):
+        with self.assertNumQueries(0):
+            response = self.client.get("/health/live/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_readiness_checks_the_database(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/health/ready/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with mock.patch("webapp.views.connection.cursor",
+                        side_effect=OperationalError("connection refused")):
+            response = self.client.get("/health/ready/")
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.json()["error"], "connection refused")
+
+
+class BenchmarkConnectionsCommandTests(TransactionTestCase):
+    def test_reports_both_modes(self):
+        out = StringIO()
+        call_command("benchmark_connections", requests=5, stdout=out)
+        self.assertIn("new connection: p50", out.getvalue())
+        self.assertIn("persistent: p50", out.getvalue())
+        self.assertEqual(connection.settings_dict["CONN_MAX_AGE"],
+                         settings.DATABASES["default"]["CONN_MAX_AGE"])
+
+
+class AsgiConnectionTests(SimpleTestCase):
+    def load_asgi(self, **env):
+        environ = {name: value for name, value in os.environ.items()
+                   if name not in ("DB_CONN_MAX_AGE", "DJANGO_SETTINGS_MODULE")}
+        return subprocess.run(
+            [sys.executable, "-c",
+             "from debt_collection_agency.asgi import settings; "
+             "print(settings.DATABASES['default']['CONN_MAX_AGE'])"],
+            cwd=settings.BASE_DIR, env={**environ, **env},
+            capture_output=True, text=True,
+        )
+
+    def test_connections_are_closed_after_every_request(self):
+        result = self.load_asgi()
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "0")
+
+    def test_persistent_connections_are_refused(self):
+        result = self.load_asgi(DB_CONN_MAX_AGE="60")
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("DB_CONN_MAX_AGE must be 0", result.stderr)
+
+
+class SyntheticDatasetTests(TestCase):
+    def test_rows_are_reproducible_and_follow_the_cardinality(self):
+        dataset = SyntheticDataset(accounts=1000, agencies=3, clients=12,
+                                   consumers=50, seed=7)
+        rows = [row for agency in range(3) for row in dataset.rows(agency)]
+        self.assertEqual(len(rows), 1000)
+        self.assertEqual(
+            rows, [row for agency in range(3)
+                   for row in SyntheticDataset(1000, 3, 12, 50, seed=7).rows(agency)])
+        self.assertEqual(len({row[0] for row in rows}), 12)
+        self.assertEqual(len({row[3:6] for row in rows}), 50)
+        self.assertEqual(len({row[5] for row in rows}), 50)
+        self.assertNotEqual(rows, list(SyntheticDataset(1000, 3, 12, 50).rows(0)))
+
+    def test_generate_accounts_command(self):
+        directory = tempfile.mkdtemp()
+        out = StringIO()
+        call_command("generate_accounts", accounts=500, agencies=2, clients=10,
+                     output=directory, load=True, engine="orm", stdout=out)
+        self.assertIn("Loaded 500 accounts", out.getvalue())
+        self.assertEqual(Account.objects.count(), 500)
+        self.assertEqual(Client.objects.count(), 10)
+        self.assertEqual(
+            sorted(os.listdir(directory)), ["agency-1.csv", "agency-2.csv"])
+
+        Account.objects.all().delete()
+        call_command("ingest_accounts", os.path.join(directory, "agency-1.csv"),
+                     agency="Synthetic Agency 1", workers=1, stdout=out)
+        self.assertEqual(Account.objects.count(), 250)
+
+    def test_run_benchmarks_command(self):
+        call_command("generate_accounts", accounts=200, agencies=2, clients=4,
+                     load=True, stdout=StringIO())
+        out = StringIO()
+        call_command("run_benchmarks", ingest_accounts=100, requests=2, stdout=out)
+        self.assertIn("ingest orm: 100 rows", out.getvalue())
+        self.assertIn("ingest copy: 100 rows", out.getvalue())
+        self.assertIn("ingest snapshot: 100 rows", out.getvalue())
+        self.assertIn("accounts consumer ssn: p50", out.getvalue())
+        self.assertEqual(Account.objects.count(), 200)
+
+
+class QueryCountGuardTests(TestCase):
+    """The number of queries of an endpoint must not depend on the page size."""
+
+    URLS = [
+        ACCOUNTS_URL,
+        f"{ACCOUNTS_URL}?pagination=cursor&ordering=-balance",
+        f"{ACCOUNTS_URL}?status=in_collection&consumer_name=consumer",
+        f"{ACCOUNTS_URL}?count=approximate&status=in_collection",
+        "/api/v1/accounts/async/",
+        "/api/v1/accounts/export/",
+        "/api/v1/accounts/export/?output=ndjson",
+        "/api/v1/summary/?group_by=agency,client,status",
+        "/api/v1/consumers/search/?q=consumer",
+    ]
+
+    def add_accounts(self, count):
+        start = Account.objects.count()
+        for n in range(start, start + count):
+            agency, _ = CollectionAgency.objects.get_or_create(name=f"Agency {n % 4}")
+            client, _ = Client.objects.get_or_create(
+                reference_no=uuid.UUID(int=n % 8), agency=agency)
+            consumer = Consumer.objects.create(
+                name=f"Consumer {n}", address=f"{n} Main St", ssn=f"000-00-{n:04d}")
+            Account.objects.create(balance=n, status="IN_COLLECTION",
+                                   consumer=consumer, client=client)
+        with connection.cursor() as cursor:
+            rebuild_summary(cursor)
+
+    def query_counts(self):
+        counts = {}
+        for url in self.URLS:
+            caches[ACCOUNT_CACHE].clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+                if response.streaming:
+                    b"".join(response.streaming_content)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+            counts[url] = len(queries)
+        return counts
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.add_accounts(2)
+        small = self.query_counts()
+        self.add_accounts(60)
+        large = self.query_counts()
+        for url in self.URLS:
+            with self.subTest(url=url):
+                self.assertEqual(large[url], small[url])
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        caches[ACCOUNT_CACHE].clear()
+        self.agency = CollectionAgency.objects.create(name="Test Agency")
+
+    def test_server_timing_header(self):
+        response = self.client.get(ACCOUNTS_URL)
+        timings = dict(
+            entry.split(";", 1) for entry in response["Server-Timing"].split(", "))
+        self.assertEqual(
+            list(timings), ["sql", "serialize", "render", "total"])
+        self.assertIn('desc="1 queries"', timings["sql"])
+
+    def test_metrics_endpoint(self):
+        self.client.get(ACCOUNTS_URL)
+        self.client.post("/api/v1/upload/", {
+            "file": SimpleUploadedFile(
+                "accounts.csv", b"".join(synthetic_csv_chunks(30))),
+            "agency_name": self.agency.name,
+        }, format="multipart")
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4")
+        metrics = response.content.decode()
+        for line in [
+            '# TYPE http_request_duration_seconds histogram',
+            'http_request_duration_seconds_bucket{method="GET",'
+            'route="api/v1/accounts/",status="2xx",le="+Inf"}',
+            'http_request_queries_count{method="POST",route="api/v1/upload/"}',
+            'http_request_stage_duration_seconds_count{method="GET",'
+            'route="api/v1/accounts/",stage="serialize"}',
+            'ingest_rows_total{engine="orm"}',
+            'ingest_rows_per_second_count{engine="orm"}',
+            'ingest_batch_duration_seconds_count{engine="orm"}',
+        ]:
+            self.assertIn(line, metrics)
+
+    @override_settings(METRICS_DIR=tempfile.mkdtemp())
+    def test_metrics_of_all_processes_are_added_up(self):
+        other = {
+            "ingest_rows_total": [[[["engine", "orm"]], 5]],
+            "ingest_batch_duration_seconds": [
+                [[["engine", "orm"]], [[1] + [0] * 11, 0.001, 1]]],
+        }
+        # Pid 1 never runs the tests.
+        with open(os.path.join(settings.METRICS_DIR,
+                               f"{socket.gethostname()}-1.json"), "w") as file:
+            json.dump(other, file)
+        ingest(synthetic_csv_chunks(30), self.agency)
+        metrics.flush()
+        key = (("engine", "orm"),)
+        rows = INGEST_ROWS.snapshot()[key]
+        batches = INGEST_BATCH_DURATION.snapshot()[key][2]
+        expected = [
+            f'ingest_rows_total{{engine="orm"}} {rows + 5.0!r}',
+            f'ingest_batch_duration_seconds_count{{engine="orm"}} {batches + 1.0!r}',
+        ]
+
+        exposed = self.client.get("/metrics").content.decode()
+        # Once process 1 exited, its metrics are kept in a file of all those
+        # of exited processes.
+        metrics.fold(settings.METRICS_DIR, 1)
+        metrics.fold(settings.METRICS_DIR, 1)
+        exposed_after_fold = self.client.get("/metrics").content.decode()
+
+        for line in expected:
+            self.assertIn(line, exposed)
+            self.assertIn(line, exposed_after_fold)
+        self.assertEqual(
+            sorted(name for name in os.listdir(settings.METRICS_DIR)
+                   if name.endswith(".json")),
+            [metrics.EXITED_FILE, f"{socket.gethostname()}-{os.getpid()}.json"])
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_slow_queries_are_logged_normalized(self):
+        with self.assertLogs("webapp.sql", "WARNING") as logs:
+            self.client.get(f"{ACCOUNTS_URL}?consumer_ssn=123-45-6789")
+        self.assertIn("Slow query", logs.output[0])
+        self.assertNotIn("123-45-6789", "".join(logs.output))
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql("SELECT  *\n FROM t WHERE a IN (%s, %s, %s) "
+                          "AND b = 'it''s' AND c > 10.5 AND t1.d = 2"),
+            "SELECT * FROM t WHERE a IN (?, ...) AND b = ? AND c > ? AND t1.d = ?")
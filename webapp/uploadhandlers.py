@@ -0,0 +1,125 @@
+import hashlib
+import lzma
+import zlib
+
+from django.core.files.uploadhandler import FileUploadHandler
+
+from webapp.compression import (
+    CHUNK_SIZE,
+    DECOMPRESSORS,
+    HEAD_SIZE,
+    decompressed_chunks,
+    detect_compression,
+)
+
+
+class ContentHash:
+    """
+    SHA-256 of the content of a file fed in chunks, decompressed as it is
+    fed if it is gzip, bz2 or xz, so that a CSV has the same digest however
+    it was compressed.
+
+    The digest is ``None`` for zip archives, whose member is only found
+    once the whole file is stored, and for streams that do not decompress
+    to the end; ``file_sha256`` hashes those files instead.
+    """
+
+    def __init__(self):
+        self._sha256 = hashlib.sha256()
+        # The first bytes, until there are enough to detect the format.
+        self._head = b""
+        self._compression = None
+        self._decompressor = None
+        self._failed = False
+
+    def update(self, data):
+        if self._head is not None:
+            self._head += data
+            if len(self._head) < HEAD_SIZE:
+                return
+            self._start()
+        elif not self._failed:
+            self._feed(data)
+
+    def hexdigest(self):
+        if self._head is not None:
+            self._start()
+        if (
+            self._failed
+            or self._compression == "zip"
+            or (self._decompressor is not None and not self._decompressor.eof)
+        ):
+            return None
+        return self._sha256.hexdigest()
+
+    def _start(self):
+        data, self._head = self._head, None
+        self._compression = detect_compression(data)
+        if self._compression in DECOMPRESSORS:
+            self._decompressor = DECOMPRESSORS[self._compression]()
+        self._feed(data)
+
+    def _feed(self, data):
+        if self._decompressor is None:
+            self._sha256.update(data)
+            return
+        try:
+            while True:
+                if self._decompressor.eof:
+                    # Concatenated streams follow one another.
+                    data = self._decompressor.unused_data + data
+                    if not data:
+                        return
+                    self._decompressor = DECOMPRESSORS[self._compression]()
+                chunk = self._decompressor.decompress(data, CHUNK_SIZE)
+                self._sha256.update(chunk)
+                if not data and not chunk:
+                    return
+                data = b""
+                # A full chunk may leave output behind, even when zlib has
+                # consumed all of its input.
+                if (
+                    self._decompressor.needs_input
+                    and not self._decompressor.eof
+                    and len(chunk) < CHUNK_SIZE
+                ):
+                    return
+        except (OSError, EOFError, zlib.error, lzma.LZMAError):
+            self._failed = True
+
+
+class ContentHashUploadHandler(FileUploadHandler):
+    """
+    Compute the ``ContentHash`` of every uploaded file while it is being
+    received.
+
+    The handler only observes the data and passes every chunk on to the next
+    handler, which still stores the file. Digests are kept by field name.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.digests = {}
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hash = ContentHash()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hash.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.digests[self.field_name] = self.hash.hexdigest()
+
+
+def file_sha256(file):
+    """
+    Hash the decompressed content of an already stored file, for files that
+    did not go through the handler or that it could not hash. Raises
+    ``IngestError`` for a file that does not decompress.
+    """
+    digest = hashlib.sha256()
+    for chunk in decompressed_chunks(file):
+        digest.update(chunk)
+    return digest.hexdigest()
@@ -1,8 +1,41 @@
 from django.urls import path
 
-from webapp.views import AccountListView, CSVUploadView
+from webapp.views import (
+    AccountExportView,
+    AccountListView,
+    AccountLookupView,
+    AccountSummaryView,
+    AsyncAccountListView,
+    ConsumerSearchView,
+    CSVUploadView,
+    IngestJobView,
+    UploadSessionCompleteView,
+    UploadSessionCreateView,
+    UploadSessionView,
+)
 
 urlpatterns = [
     path("accounts/", AccountListView.as_view(), name="account-list"),
+    path("accounts/async/", AsyncAccountListView.as_view(), name="account-list-async"),
+    path("accounts/export/", AccountExportView.as_view(), name="account-export"),
+    path("accounts/lookup/", AccountLookupView.as_view(), name="account-lookup"),
+    path("summary/", AccountSummaryView.as_view(), name="account-summary"),
+    path("consumers/search/", ConsumerSearchView.as_view(), name="consumer-search"),
     path("upload/", CSVUploadView.as_view(), name="upload"),
+    path("upload/<uuid:job_id>/", IngestJobView.as_view(), name="upload-job"),
+    path(
+        "upload/sessions/",
+        UploadSessionCreateView.as_view(),
+        name="upload-sessions",
+    ),
+    path(
+        "upload/sessions/<uuid:session_id>/",
+        UploadSessionView.as_view(),
+        name="upload-session",
+    ),
+    path(
+        "upload/sessions/<uuid:session_id>/complete/",
+        UploadSessionCompleteView.as_view(),
+        name="upload-session-complete",
+    ),
 ]
@@ -0,0 +1,203 @@
+import csv
+import gzip
+import io
+import os
+import re
+import tempfile
+from itertools import islice
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.files.base import File
+
+from webapp.compression import decompressed_chunks
+from webapp.ingest import (
+    BATCH_SIZE,
+    IngestError,
+    check_header,
+    iter_lines,
+    normalize_status,
+)
+from webapp.models import Account, Consumer
+
+# Rows whose errors are listed in a report. Every invalid row is counted.
+MAX_REPORTED_ERRORS = 100
+
+_balance = Account._meta.get_field("balance")
+_integer_digits = _balance.max_digits - _balance.decimal_places
+BALANCE = re.compile(
+    rf"\s*[+-]?0*(\d{{1,{_integer_digits}}}(\.\d{{0,{_balance.decimal_places}}})?"
+    rf"|\.\d{{1,{_balance.decimal_places}}})\s*"
+)
+UUID = re.compile(
+    r"\{?[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?"
+    r"[0-9a-fA-F]{12}\}?"
+)
+SSN = re.compile(r"\d{3}-\d{2}-\d{4}")
+STATUSES = [status for status, _ in Account.STATUS_CHOICES]
+
+
+def _pattern(pattern):
+    """
+    Value and column checks for a regular expression.
+
+    A column is matched as one string, its values joined by NUL characters,
+    which no pattern matches, so a whole batch is checked in a single call.
+    """
+    column = re.compile(rf"(?:{pattern.pattern})(?:\x00(?:{pattern.pattern}))*")
+
+    def check_column(values):
+        joined = "\x00".join(values)
+        return (
+            joined.count("\x00") == len(values) - 1
+            and column.fullmatch(joined) is not None
+        )
+
+    return pattern.fullmatch, check_column
+
+
+def _status(value):
+    return normalize_status(value) in STATUSES
+
+
+def _at_most(length):
+    return (
+        lambda value: len(value) <= length,
+        lambda values: max(map(len, values), default=0) <= length,
+    )
+
+
+# Value check, column check and error message of each validated CSV column.
+COLUMN_CHECKS = {
+    "client reference no": (*_pattern(UUID), "Not a UUID"),
+    "balance": (
+        *_pattern(BALANCE),
+        f"Not a number with at most {_integer_digits} digits before and "
+        f"{_balance.decimal_places} after the decimal point",
+    ),
+    # Statuses repeat, so each distinct one is checked once.
+    "status": (
+        _status,
+        lambda values: all(map(_status, set(values))),
+        f"Not one of {', '.join(STATUSES)}",
+    ),
+    "consumer name": (
+        *_at_most(Consumer._meta.get_field("name").max_length),
+        f"Longer than {Consumer._meta.get_field('name').max_length} characters",
+    ),
+    "ssn": (*_pattern(SSN), "Not formatted as 123-45-6789"),
+    "account reference no": (
+        *_at_most(Account._meta.get_field("external_id").max_length),
+        f"Longer than {Account._meta.get_field('external_id').max_length} characters",
+    ),
+}
+
+
+def _numbered_rows(chunks):
+    """The non-blank CSV rows, header first, with the line each one ends on."""
+    reader = csv.reader(iter_lines(chunks))
+    try:
+        for row in reader:
+            if row:
+                yield reader.line_num, row
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise IngestError(f"Unreadable CSV: {exc}") from exc
+
+
+_row = itemgetter(1)
+
+
+def validate_csv(chunks, batch_size=BATCH_SIZE, max_errors=MAX_REPORTED_ERRORS):
+    """
+    Check an upload from CSV byte chunks without touching the database.
+
+    The header must name every required column. Rows are read in batches of
+    ``batch_size`` and every validated column of a batch is checked at once;
+    only a column with a bad value is checked again value by value to find
+    it. Memory use depends on the batch size and the number of invalid rows,
+    not on the size of the file.
+
+    Returns a report with the number of ``rows`` and ``invalid_rows`` and the
+    ``errors`` of the first ``max_errors`` invalid rows, each with its CSV
+    ``line`` and a message per bad column, and the set of the line numbers
+    of every invalid row. Raises ``IngestError`` for a bad header or a file
+    that is not UTF-8 CSV.
+    """
+    numbered = _numbered_rows(chunks)
+    _, header = next(numbered, (0, []))
+    check_header(header)
+    width = len(header)
+    checks = [
+        (header.index(name), name, *COLUMN_CHECKS[name])
+        for name in COLUMN_CHECKS
+        if name in header
+    ]
+    rows = 0
+    invalid = set()
+    errors = []
+
+    while batch := list(islice(numbered, batch_size)):
+        rows += len(batch)
+        found = {}
+        complete = batch
+        if set(map(len, map(_row, batch))) != {width}:
+            complete = []
+            for line, row in batch:
+                if len(row) == width:
+                    complete.append((line, row))
+                else:
+                    found[line] = {"row": f"Expected {width} fields, found {len(row)}"}
+        complete_rows = list(map(_row, complete))
+        for position, name, check_value, check_column, message in checks:
+            column = list(map(itemgetter(position), complete_rows))
+            if check_column(column):
+                continue
+            for (line, _), value in zip(complete, column):
+                if not check_value(value):
+                    found.setdefault(line, {})[name] = message
+        invalid.update(found)
+        for line in sorted(found)[: max_errors - len(errors)]:
+            errors.append({"line": line, **found[line]})
+
+    return {
+        "rows": rows,
+        "invalid_rows": len(invalid),
+        "errors": errors,
+        "errors_truncated": len(invalid) > len(errors),
+    }, invalid
+
+
+def invalid_rows_message(report):
+    return f"{report['invalid_rows']} of {report['rows']} rows are invalid"
+
+
+def write_valid_rows(chunks, invalid, file, chunk_size=1024 * 1024):
+    """
+    Write the CSV from ``chunks`` to the binary ``file`` without the rows on
+    the ``invalid`` lines reported by ``validate_csv``, or blank lines.
+    """
+    numbered = _numbered_rows(chunks)
+    _, header = next(numbered, (0, []))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(header)
+    for line, row in numbered:
+        if line not in invalid:
+            writer.writerow(row)
+        if buffer.tell() >= chunk_size:
+            file.write(buffer.getvalue().encode())
+            buffer.seek(0)
+            buffer.truncate()
+    file.write(buffer.getvalue().encode())
+
+
+def valid_rows_file(file, invalid):
+    """
+    A gzipped copy of ``file`` without the rows on the ``invalid`` lines,
+    so that not even the valid rows of a compressed upload are spooled
+    uncompressed.
+    """
+    valid = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    with gzip.GzipFile(fileobj=valid, mode="wb", compresslevel=1) as compressed:
+        write_valid_rows(decompressed_chunks(file), invalid, compressed)
+    return File(valid, name=os.path.basename(file.name))
@@ -1,33 +1,308 @@
-import csv
+import uuid
 
-from django.db.models import Prefetch
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.urls import reverse
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models import Count, Sum
+from django.db.models.functions import Upper
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.functional import cached_property
+from django.views import View
 
 from rest_framework import generics, status, views
+from rest_framework.generics import get_object_or_404
+from rest_framework.exceptions import ValidationError
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 from django_filters.rest_framework import DjangoFilterBackend
 
-from webapp.models import Client, CollectionAgency, Consumer, Account
-from webapp.serializers import AccountSerializer
-from webapp.filters import AccountFilter
+from webapp.models import (
+    AccountSearch, AccountSummary, CollectionAgency, Consumer, Account, IngestJob,
+    Upload, UploadSession,
+)
+from webapp.renderers import FastJSONRenderer
+from webapp.serializers import (
+    AccountSearchRowSerializer, IngestJobSerializer, UploadSessionSerializer
+)
+from webapp.caching import VersionedCacheMixin
+from webapp.compression import decompressed_chunks
+from webapp.exports import FORMATS, export_rows
+from webapp.filters import AccountFilter, AccountSearchFilter
+from webapp.ingest import ENGINES, IngestError, ingest
+from webapp.jobs import enqueue
+from webapp.metrics import TimedListMixin, expose
+from webapp.pagination import ApproximateCountPagination, KeysetPagination
+from webapp.readmodel import lookup_accounts
+from webapp.uploadhandlers import ContentHashUploadHandler, file_sha256
+from webapp.validation import invalid_rows_message, valid_rows_file, validate_csv
 
+UPLOAD_PART_CHUNK_SIZE = 1024 * 1024
 
-class AccountListView(generics.ListAPIView):
-    serializer_class = AccountSerializer
+
+def sparse_columns(request, serializer):
+    """
+    Columns to read for the fields a row ``serializer`` was narrowed to,
+    together with those that keyset pages are ordered on.
+    """
+    ordering = KeysetPagination.orderings.get(
+        request.GET.get(KeysetPagination.ordering_query_param), ("id",))
+    columns = serializer.columns()
+    return columns + [
+        field.lstrip("-") for field in ordering if field.lstrip("-") not in columns]
+
+
+class AccountListView(VersionedCacheMixin, TimedListMixin, generics.ListAPIView):
+    # Rows are read from the flat AccountSearch table, without joins, and
+    # serialized as plain dicts, in the same shape as AccountSerializer.
+    serializer_class = AccountSearchRowSerializer
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
     filter_backends = [DjangoFilterBackend]
-    filterset_class = AccountFilter
+    filterset_class = AccountSearchFilter
+    cache_params = [
+        *AccountFilter.base_filters, "page", "pagination", "cursor", "ordering",
+        "count", "fields", "expand",
+    ]
+
+    @property
+    def paginator(self):
+        """
+        Page-number pagination unless the client asks for cursors with
+        ``?pagination=cursor`` or sends a ``cursor``. ``?count=approximate``
+        replaces the exact count of page-number pages with a cheaper one.
+        """
+        if not hasattr(self, "_paginator"):
+            params = self.request.query_params
+            if params.get("pagination") == "cursor" or "cursor" in params:
+                self._paginator = KeysetPagination()
+            elif params.get("count") == "approximate":
+                self._paginator = ApproximateCountPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    @cached_property
+    def fieldset(self):
+        return AccountSearchRowSerializer.fieldset(self.request.query_params)
+
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, **self.fieldset, **kwargs)
 
     def get_queryset(self):
-        clients_with_agencies = Client.objects.select_related('agency')
-        return Account.objects.select_related('consumer').prefetch_related(
-            Prefetch('client', queryset=clients_with_agencies)
-        ).all()
+        return AccountSearch.objects.values(
+            *sparse_columns(self.request, AccountSearchRowSerializer(**self.fieldset))
+        ).order_by("id")
+
+
+class AsyncAccountListView(View):
+    """
+    ``AccountListView`` as a native async view, for ASGI deployments.
+
+    It takes the same filters and returns the same page-number pages, but
+    queries through the async ORM, so a worker keeps serving other requests
+    while a list query waits on the database.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    page_query_param = "page"
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            fieldset = AccountSearchRowSerializer.fieldset(request.GET)
+        except ValidationError as exc:
+            return self.render(exc.detail, status.HTTP_400_BAD_REQUEST)
+        serializer = AccountSearchRowSerializer(**fieldset)
+        filterset = AccountSearchFilter(
+            request.GET,
+            queryset=AccountSearch.objects.values(*sparse_columns(request, serializer)),
+        )
+        if not filterset.is_valid():
+            return self.render(filterset.errors, status.HTTP_400_BAD_REQUEST)
+        queryset = filterset.qs.order_by("id")
+
+        try:
+            page = int(request.GET.get(self.page_query_param, 1))
+        except ValueError:
+            page = 0
+        count = await queryset.acount() if page > 0 else 0
+        offset = (page - 1) * self.page_size
+        if page < 1 or (page > 1 and offset >= count):
+            return self.render({"detail": "Invalid page."}, status.HTTP_404_NOT_FOUND)
+        rows = [row async for row in queryset[offset:offset + self.page_size]]
+
+        url = request.build_absolute_uri()
+        next_link = previous_link = None
+        if offset + self.page_size < count:
+            next_link = replace_query_param(url, self.page_query_param, page + 1)
+        if page == 2:
+            previous_link = remove_query_param(url, self.page_query_param)
+        elif page > 2:
+            previous_link = replace_query_param(url, self.page_query_param, page - 1)
+        return self.render({
+            "count": count,
+            "next": next_link,
+            "previous": previous_link,
+            "results": [serializer.to_representation(row) for row in rows],
+        })
+
+    def render(self, data, status_code=status.HTTP_200_OK):
+        return HttpResponse(
+            FastJSONRenderer().render(data),
+            content_type=FastJSONRenderer.media_type,
+            status=status_code,
+        )
+
+
+class AccountExportView(views.APIView):
+    """
+    Stream every account matching the ``AccountFilter`` parameters.
+
+    ``output`` selects ``csv`` (default) or ``ndjson``. Rows are read from a
+    server-side cursor and written out as they arrive, so the response starts
+    at once and memory stays flat however many accounts match.
+    """
+
+    def get(self, request, *args, **kwargs):
+        output = request.query_params.get("output", "csv")
+        if output not in FORMATS:
+            return bad_request(
+                f"Unknown output, expected one of: {', '.join(FORMATS)}")
+
+        filterset = AccountFilter(
+            request.query_params, queryset=Account.objects.all())
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        render, content_type = FORMATS[output]
+        return StreamingHttpResponse(
+            render(export_rows(filterset.qs)),
+            content_type=content_type,
+            headers={
+                "Content-Disposition": f'attachment; filename="accounts.{output}"'
+            },
+        )
+
+
+def bad_request(message):
+    return Response({"error": message}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class IngestMixin:
+    """
+    Ingest a received file once per agency and content hash.
 
+    Files already recorded in the upload ledger are not ingested again, and a
+    file that is still queued or running is not queued a second time.
+    """
 
-class CSVUploadView(views.APIView):
+    def ingest_file(self, request, file, agency, sha256):
+        engine = request.data.get("engine", "orm")
+        if engine not in ENGINES:
+            return bad_request(
+                f"Unknown engine, expected one of: {', '.join(ENGINES)}")
+        mark_missing = str(request.data.get("mark_missing", "")).lower() in (
+            "1", "true", "yes")
+        if mark_missing and engine != "snapshot":
+            return bad_request("mark_missing needs the snapshot engine")
+
+        skip_invalid = str(request.data.get("skip_invalid", "")).lower() in (
+            "1", "true", "yes")
+
+        duplicate = Upload.objects.filter(agency=agency, sha256=sha256).first()
+        if duplicate:
+            return self.duplicate_response(duplicate)
+
+        if self.wants_async(request):
+            # The worker validates queued files, so that the request returns
+            # without reading the whole file.
+            job = IngestJob.objects.filter(
+                agency=agency, sha256=sha256,
+                status__in=[IngestJob.QUEUED, IngestJob.RUNNING],
+            ).first() or enqueue(file, agency, engine=engine, sha256=sha256,
+                                 mark_missing=mark_missing, skip_invalid=skip_invalid)
+            return self.job_response(job)
+
+        # Every row is checked before anything is written, so a bad value
+        # deep in the file is reported at once instead of failing the ingest.
+        try:
+            report, invalid = validate_csv(decompressed_chunks(file))
+        except IngestError as exc:
+            return bad_request(str(exc))
+        skipped = {}
+        rows_file = file
+        if invalid:
+            if not skip_invalid:
+                return Response(
+                    {"error": invalid_rows_message(report), **report},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            rows_file = valid_rows_file(file, invalid)
+            skipped = {"skipped_rows": report["invalid_rows"],
+                       "errors": report["errors"],
+                       "errors_truncated": report["errors_truncated"]}
+
+        try:
+            with transaction.atomic():
+                # Claiming the ledger entry first makes a concurrent upload of
+                # the same file wait here and then fail, before any ingest.
+                # Only that claim is a duplicate, in its own savepoint so that
+                # integrity errors of the ingest are not mistaken for one.
+                try:
+                    with transaction.atomic():
+                        upload = Upload.objects.create(
+                            agency=agency, sha256=sha256, size=file.size, rows=0)
+                except IntegrityError:
+                    return self.duplicate_response(
+                        Upload.objects.get(agency=agency, sha256=sha256))
+                stats = ingest(decompressed_chunks(rows_file), agency, engine=engine,
+                               mark_missing=mark_missing)
+                upload.rows = stats["rows"]
+                upload.save(update_fields=["rows"])
+        except IngestError as exc:
+            return bad_request(str(exc))
+
+        return Response(
+            {"status": "Data ingested successfully", "upload_id": upload.pk,
+             **stats, **skipped},
+            status=status.HTTP_201_CREATED,
+        )
+
+    def wants_async(self, request):
+        run_async = request.data.get("async")
+        if run_async is None:
+            return settings.INGEST_ASYNC
+        return str(run_async).lower() in ("1", "true", "yes")
+
+    def duplicate_response(self, upload):
+        return Response(
+            {"status": "File already ingested", "upload_id": upload.pk,
+             "rows": upload.rows},
+            status=status.HTTP_200_OK,
+        )
+
+    def job_response(self, job):
+        location = reverse("upload-job", kwargs={"job_id": job.pk})
+        return Response(
+            {"job_id": job.pk, "status": job.status, "url": location},
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": location},
+        )
+
+
+class CSVUploadView(IngestMixin, views.APIView):
     parser_classes = (MultiPartParser, FormParser)
 
+    def initialize_request(self, request, *args, **kwargs):
+        # Must be installed before the multipart body is parsed.
+        self.hash_handler = ContentHashUploadHandler(request)
+        request.upload_handlers.insert(0, self.hash_handler)
+        return super().initialize_request(request, *args, **kwargs)
+
     def post(self, request, *args, **kwargs):
         file = request.data.get("file")
         if not file:
@@ -45,41 +320,296 @@ class CSVUploadView(views.APIView):
         agency, _ = CollectionAgency.objects.get_or_create(
             name=agency_name)
 
-        decoded_file = file.read().decode("utf-8").splitlines()
-        reader = csv.DictReader(decoded_file)
+        try:
+            sha256 = self.hash_handler.digests.get("file") or file_sha256(file)
+        except IngestError as exc:
+            return bad_request(str(exc))
+        return self.ingest_file(request, file, agency, sha256)
 
-        consumers = {}
-        accounts_to_create = []
-        clients = {}
 
-        for row in reader:
-            reference_no = row["client reference no"]
-            if reference_no not in clients:
-                clients[reference_no], _ = Client.objects.get_or_create(
-                    reference_no=reference_no, agency=agency
-                )
-            client = clients[reference_no]
-
-            consumer_key = (row["consumer name"],
-                            row["consumer address"], row["ssn"])
-            if consumer_key not in consumers:
-                consumers[consumer_key], _ = Consumer.objects.get_or_create(
-                    name=row["consumer name"],
-                    address=row["consumer address"],
-                    ssn=row["ssn"],
+class IngestJobView(generics.RetrieveAPIView):
+    serializer_class = IngestJobSerializer
+    queryset = IngestJob.objects.select_related("agency")
+    lookup_url_kwarg = "job_id"
+
+
+class UploadSessionCreateView(views.APIView):
+    """Start a resumable upload whose parts are sent with ``PUT``."""
+
+    def post(self, request, *args, **kwargs):
+        agency_name = request.data.get("agency_name")
+        if not agency_name:
+            return bad_request("Agency name not provided")
+
+        agency, _ = CollectionAgency.objects.get_or_create(name=agency_name)
+        session = UploadSession(agency=agency)
+        session.file.save("upload.csv", ContentFile(b""), save=False)
+        session.save()
+
+        location = reverse("upload-session", kwargs={"session_id": session.pk})
+        return Response(
+            UploadSessionSerializer(session).data,
+            status=status.HTTP_201_CREATED,
+            headers={"Location": location},
+        )
+
+
+class UploadSessionView(generics.RetrieveAPIView):
+    """
+    Report the acknowledged offset of a resumable upload, or append a part.
+
+    A part is the raw request body of a ``PUT`` whose ``Upload-Offset`` header
+    must equal the acknowledged offset. Anything written past that offset by
+    an interrupted request is discarded first.
+    """
+
+    serializer_class = UploadSessionSerializer
+    queryset = UploadSession.objects.select_related("agency")
+    lookup_url_kwarg = "session_id"
+
+    def put(self, request, *args, **kwargs):
+        try:
+            offset = int(request.headers["Upload-Offset"])
+        except (KeyError, ValueError):
+            return bad_request("Upload-Offset header not provided")
+
+        with transaction.atomic():
+            session = get_object_or_404(
+                self.get_queryset().select_for_update(of=("self",)),
+                pk=kwargs["session_id"],
+            )
+            if session.status != UploadSession.OPEN:
+                return Response(
+                    {"error": "Upload session is already complete"},
+                    status=status.HTTP_409_CONFLICT,
                 )
-            consumer = consumers[consumer_key]
-            accounts_to_create.append(
-                Account(
-                    balance=row["balance"],
-                    status=row["status"],
-                    consumer=consumer,
-                    client=client,
+            if offset != session.offset:
+                return Response(
+                    {"error": "Upload-Offset does not match", "offset": session.offset},
+                    status=status.HTTP_409_CONFLICT,
+                    headers={"Upload-Offset": str(session.offset)},
                 )
-            )
 
-        Account.objects.bulk_create(accounts_to_create)
+            with open(session.file.path, "r+b") as file:
+                file.truncate(session.offset)
+                file.seek(session.offset)
+                stream = request.stream
+                while stream and (chunk := stream.read(UPLOAD_PART_CHUNK_SIZE)):
+                    file.write(chunk)
+                session.offset = file.tell()
+            session.save(update_fields=["offset", "updated_at"])
 
         return Response(
-            {"status": "Data ingested successfully"}, status=status.HTTP_201_CREATED
+            UploadSessionSerializer(session).data,
+            headers={"Upload-Offset": str(session.offset)},
         )
+
+
+class UploadSessionCompleteView(IngestMixin, views.APIView):
+    """Ingest a resumable upload once all of its parts were sent."""
+
+    def post(self, request, *args, **kwargs):
+        with transaction.atomic():
+            session = get_object_or_404(
+                UploadSession.objects.select_for_update(of=("self",))
+                .select_related("agency"),
+                pk=kwargs["session_id"],
+            )
+            if session.upload_id:
+                return self.duplicate_response(session.upload)
+            if session.job_id:
+                return self.job_response(session.job)
+
+            try:
+                sha256 = file_sha256(session.file)
+            except IngestError as exc:
+                return bad_request(str(exc))
+            response = self.ingest_file(request, session.file, session.agency, sha256)
+            if response.status_code == status.HTTP_400_BAD_REQUEST:
+                return response
+
+            session.status = UploadSession.COMPLETE
+            if response.status_code == status.HTTP_202_ACCEPTED:
+                session.job_id = response.data["job_id"]
+            else:
+                session.upload_id = response.data["upload_id"]
+            session.save(update_fields=["status", "job", "upload", "updated_at"])
+
+        if session.upload_id:
+            session.file.storage.delete(session.file.name)
+        return response
+
+
+class AccountSummaryView(views.APIView):
+    """
+    Account count and total balance grouped by agency, client and/or status.
+
+    ``group_by`` takes a comma-separated list, ``agency`` by default, and
+    ``agency_name`` optionally restricts the agencies like the account filter.
+    Totals come from the summary maintained by ingest, so the cost depends on
+    the number of clients and statuses rather than on the number of accounts.
+    """
+
+    groupings = {
+        "agency": ("agency", "agency__name"),
+        "client": ("client_reference_no", "client_id"),
+        "status": ("status", "status"),
+    }
+
+    def get(self, request, *args, **kwargs):
+        group_by = request.query_params.get("group_by", "agency").split(",")
+        unknown = set(group_by) - set(self.groupings)
+        if unknown:
+            return bad_request(
+                f"Unknown group_by, expected any of: {', '.join(self.groupings)}")
+        columns = {self.groupings[name][0]: self.groupings[name][1]
+                   for name in group_by}
+
+        summaries = AccountSummary.objects.all()
+        agency_name = request.query_params.get("agency_name")
+        if agency_name:
+            summaries = summaries.filter(agency__name__in=agency_name.split(","))
+        groups = (
+            summaries.values(*columns.values())
+            .annotate(account_count=Sum("account_count"),
+                      total_balance=Sum("total_balance"))
+            .filter(account_count__gt=0)
+            .order_by(*columns.values())
+        )
+        return Response({"results": [
+            {
+                **{key: group[column] for key, column in columns.items()},
+                "account_count": group["account_count"],
+                "total_balance": str(group["total_balance"]),
+            }
+            for group in groups
+        ]})
+
+
+class AccountLookupView(views.APIView):
+    """
+    Accounts of many consumers and/or clients in one request.
+
+    POST a JSON object with ``consumer_ssns`` and/or ``client_reference_nos``
+    lists, up to ``max_keys`` keys in total. Each kind of key is resolved
+    with a single query against the read model, however many keys are sent.
+    Accounts are grouped by key, ``limit`` per key at most, lowest ids
+    first; keys with more accounts are listed in ``truncated``.
+    """
+
+    renderer_classes = [FastJSONRenderer]
+    max_keys = 50_000
+    default_limit = 100
+    max_limit = 1000
+
+    def post(self, request, *args, **kwargs):
+        if not isinstance(request.data, dict):
+            return bad_request("Expected a JSON object")
+        ssns = request.data.get("consumer_ssns", [])
+        reference_nos = request.data.get("client_reference_nos", [])
+        if not isinstance(ssns, list) or not isinstance(reference_nos, list):
+            return bad_request("consumer_ssns and client_reference_nos must be lists")
+        if not ssns and not reference_nos:
+            return bad_request("Send consumer_ssns and/or client_reference_nos")
+        if len(ssns) + len(reference_nos) > self.max_keys:
+            return bad_request(f"At most {self.max_keys} keys can be looked up at once")
+        if not all(isinstance(ssn, str) for ssn in ssns):
+            return bad_request("consumer_ssns must be strings")
+        try:
+            reference_nos = [uuid.UUID(value) for value in reference_nos]
+        except (AttributeError, TypeError, ValueError):
+            return bad_request("client_reference_nos must be UUIDs")
+        limit = request.data.get("limit", self.default_limit)
+        if type(limit) is not int or not 1 <= limit <= self.max_limit:
+            return bad_request(f"limit must be a number from 1 to {self.max_limit}")
+
+        serializer = AccountSearchRowSerializer()
+        results = {"truncated": []}
+        for key, values in [("consumer_ssn", ssns),
+                            ("client_reference_no", reference_nos)]:
+            results[key] = {}
+            for value, rows in lookup_accounts(key, values, limit).items():
+                if len(rows) > limit:
+                    results["truncated"].append(str(value))
+                results[key][str(value)] = [
+                    serializer.to_representation(row) for row in rows[:limit]]
+        return Response(results)
+
+
+class ConsumerSearchView(views.APIView):
+    """
+    Top matches for a consumer name, with the number of accounts of each.
+
+    ``q`` matches as a substring, or by trigram similarity with ``fuzzy=true``
+    so that typos are tolerated. Both are answered from the trigram index on
+    the consumer name, and results are ordered by similarity to ``q``.
+    """
+
+    default_limit = 10
+    max_limit = 50
+    min_query_length = 3
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get("q", "").strip()
+        if len(query) < self.min_query_length:
+            return bad_request(
+                f"q must have at least {self.min_query_length} characters")
+        try:
+            limit = int(request.query_params.get("limit", self.default_limit))
+        except ValueError:
+            return bad_request("limit must be a number")
+        if limit < 1:
+            return bad_request("limit must be positive")
+        limit = min(limit, self.max_limit)
+        fuzzy = request.query_params.get("fuzzy", "").lower() in ("1", "true", "yes")
+
+        consumers = Consumer.objects.alias(upper_name=Upper("name"))
+        if fuzzy:
+            consumers = consumers.filter(upper_name__trigram_similar=query.upper())
+        else:
+            consumers = consumers.filter(name__icontains=query)
+        matches = list(
+            consumers.annotate(
+                score=TrigramSimilarity("upper_name", query.upper())
+            ).order_by("-score", "id").values("id", "name", "address", "score")[:limit]
+        )
+
+        account_counts = dict(
+            Account.objects.filter(consumer_id__in=[match["id"] for match in matches])
+            .values("consumer_id")
+            .annotate(account_count=Count("id"))
+            .values_list("consumer_id", "account_count")
+        )
+        for match in matches:
+            match["score"] = round(match["score"], 3)
+            match["account_count"] = account_counts.get(match["id"], 0)
+        return Response({"results": matches})
+
+
+class LivenessView(views.APIView):
+    """The process is up and serving requests. Does not touch the database."""
+
+    def get(self, request, *args, **kwargs):
+        return Response({"status": "ok"})
+
+
+class ReadinessView(views.APIView):
+    """The process can serve traffic: the database answers a query."""
+
+    def get(self, request, *args, **kwargs):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+        except DatabaseError as exc:
+            return Response(
+                {"status": "unavailable", "error": str(exc).strip()},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        return Response({"status": "ok"})
+
+
+class MetricsView(View):
+    """Request, SQL and ingest metrics, of every process with METRICS_DIR."""
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(expose(), content_type="text/plain; version=0.0.4")